@@ -4,13 +4,35 @@ Use common fields of FlowStats/FlowMod of supported OF versions. ``match`` and
 ``actions`` fields are different, so Flow, Action and Match related classes are
 inherited in v0x04 modules.
 """
+import inspect
 import json
+import struct
 from abc import ABC, abstractmethod
-from hashlib import md5
+from collections import defaultdict
+from hashlib import blake2b, md5
 
 from pyof.v0x04.controller2switch.flow_mod import FlowModCommand
 
-from napps.kytos.of_core import v0x04
+from napps.kytos.of_core import settings, v0x04
+
+# Fixed size fields of version 2 flow ids: table_id, priority, idle_timeout,
+# hard_timeout and cookie, and of version 2 match ids: table_id, priority
+# and cookie
+_ID_FIELDS = struct.Struct('!BHHHQ')
+_MATCH_ID_FIELDS = struct.Struct('!BHQ')
+
+# Tagged values of the binary encoding of ``pack_values``: an unsigned
+# integer, the length of a string, list or JSON value, and the number of
+# keys of a dict with the length of their names
+_PACKED_UINT = struct.Struct('!cQ')
+_PACKED_SIZE = struct.Struct('!cI')
+_PACKED_DICT = struct.Struct('!cII')
+
+# Types of the values of dicts packed at once
+_INT_TYPES = frozenset((int,))
+
+# Types of the values whose encodings are kept until an attribute is set
+_IMMUTABLE_TYPES = frozenset((int, str, float, bool, type(None)))
 
 
 class FlowFactory(ABC):  # pylint: disable=too-few-public-methods
@@ -40,7 +62,7 @@ class FlowFactory(ABC):  # pylint: disable=too-few-public-methods
         raise NotImplementedError(f'Unsupported OpenFlow version {of_version}')
 
 
-class FlowBase(ABC):  # pylint: disable=too-many-instance-attributes
+class FlowBase(ABC):
     """Class to abstract a Flow to switches.
 
     This class represents a Flow installed or to be installed inside the
@@ -48,6 +70,11 @@ class FlowBase(ABC):  # pylint: disable=too-many-instance-attributes
     actions that should occur in case any match happen.
     """
 
+    # Attributes set by ``from_dict``, subclasses add theirs to both tuples
+    _fields = ('switch', 'table_id', 'match', 'priority', 'idle_timeout',
+               'hard_timeout', 'cookie', 'stats')
+    __slots__ = _fields + ('_id', '_id_fields', '_match_id')
+
     # of_version number: 0x04
     of_version = None
 
@@ -56,6 +83,11 @@ class FlowBase(ABC):  # pylint: disable=too-many-instance-attributes
     _flow_mod_class = None
     _match_class = None
 
+    # Attributes left out of the flow identifiers, setting any other one
+    # clears the memoized identifiers
+    _unhashed_attributes = frozenset(('stats', '_id', '_id_fields',
+                                      '_match_id'))
+
     def __init__(self, switch, table_id=0x0, match=None, priority=0x8000,
                  idle_timeout=0, hard_timeout=0, cookie=0, stats=None):
         """Assign parameters to attributes.
@@ -74,6 +106,11 @@ class FlowBase(ABC):  # pylint: disable=too-many-instance-attributes
             stats (Stats): Latest flow statistics.
         """
         # pylint: disable=too-many-arguments,too-many-locals
+        # Memoized identifiers, computed on first use, and the frozen fields
+        # the id was computed from
+        self._id = None
+        self._id_fields = None
+        self._match_id = None
         self.switch = switch
         self.table_id = table_id
         # Disable not-callable error as subclasses set a class
@@ -84,44 +121,120 @@ class FlowBase(ABC):  # pylint: disable=too-many-instance-attributes
         self.cookie = cookie
         self.stats = stats or FlowStats()  # pylint: disable=E1102
 
+    def __setattr__(self, name, value):
+        if name not in self._unhashed_attributes:
+            object.__setattr__(self, '_id', None)
+            object.__setattr__(self, '_match_id', None)
+        object.__setattr__(self, name, value)
+
     @property
     def id(self):  # pylint: disable=invalid-name
         """Return this flow unique identifier.
 
-        Calculate an md5 hash based on this object's modified json string. The
-        json for ID calculation excludes ``stats`` attribute that changes over
+        Calculate a hash of this object's fields with :meth:`get_id`. The
+        fields for ID calculation exclude ``stats`` attribute that changes over
         time.
 
+        The identifier is memoized only while the nested fields it depends on
+        are frozen, as those of flows from flow stats are, and until an
+        attribute other than ``stats`` is set. Otherwise, it is computed on
+        every access, since a match or an action can be changed in place.
+
         Returns:
-            str: Flow unique identifier (md5sum).
+            str: Flow unique identifier.
 
         """
-        flow_str = self.as_json(sort_keys=True, include_id=False)
-        md5sum = md5()
-        md5sum.update(flow_str.encode('utf-8'))
-        return md5sum.hexdigest()
+        fields = self._frozen_fields()
+        if fields is None:
+            return self.get_id()
+        if self._id is None or fields != self._id_fields:
+            self._id = self.get_id()
+            self._id_fields = fields
+        return self._id
 
     @property
     def match_id(self):
         """Return this flow unique match identifier.
 
         This is meant for effecient overlapping match updates or insertions.
+        It is memoized like :attr:`id`, while the match is frozen.
 
         Returns:
-            str: Flow unique match identifier (md5sum).
+            str: Flow unique match identifier.
 
         """
-        flow_match_fields = {
-            'switch': self.switch.id,
-            'table_id': self.table_id,
-            'match': self.match.as_dict(),
-            'priority': self.priority,
-            'cookie': self.cookie,
-        }
-        flow_str = json.dumps(flow_match_fields, sort_keys=True)
-        md5sum = md5()
-        md5sum.update(flow_str.encode('utf-8'))
-        return md5sum.hexdigest()
+        if not self.match.frozen:
+            return self.get_match_id()
+        if self._match_id is None:
+            self._match_id = self.get_match_id()
+        return self._match_id
+
+    def get_id(self, version=None):
+        """Return the flow identifier of a fingerprint version.
+
+        Version 1 is the md5sum of the flow JSON, version 2 the blake2b
+        digest of a canonical binary encoding of the same fields. Matches,
+        instructions and actions keep their encodings until they change, so
+        version 2 ids are faster to compute again. Both have 32 hexadecimal
+        digits.
+
+        Args:
+            version (int): Fingerprint version, ``settings.FLOW_ID_VERSION``
+                by default.
+
+        Returns:
+            str: Flow identifier of that version.
+
+        """
+        version = version or settings.FLOW_ID_VERSION
+        if version == 1:
+            flow_str = self.as_json(sort_keys=True, include_id=False)
+            md5sum = md5()
+            md5sum.update(flow_str.encode('utf-8'))
+            return md5sum.hexdigest()
+        if version == 2:
+            fields = _ID_FIELDS.pack(self.table_id, self.priority,
+                                     self.idle_timeout, self.hard_timeout,
+                                     self.cookie)
+            return _fingerprint(self.switch.id, fields, self._id_values())
+        raise ValueError(f'Unknown flow id version {version}')
+
+    def get_match_id(self, version=None):
+        """Return the flow match identifier of a fingerprint version.
+
+        Versions are those of :meth:`get_id`.
+        """
+        version = version or settings.FLOW_ID_VERSION
+        if version == 1:
+            flow_match_fields = {
+                'switch': self.switch.id,
+                'table_id': self.table_id,
+                'match': self.match.as_dict(),
+                'priority': self.priority,
+                'cookie': self.cookie,
+            }
+            flow_str = json.dumps(flow_match_fields, sort_keys=True)
+            md5sum = md5()
+            md5sum.update(flow_str.encode('utf-8'))
+            return md5sum.hexdigest()
+        if version == 2:
+            fields = _MATCH_ID_FIELDS.pack(self.table_id, self.priority,
+                                           self.cookie)
+            return _fingerprint(self.switch.id, fields, self.match.packed())
+        raise ValueError(f'Unknown flow id version {version}')
+
+    def _frozen_fields(self):
+        """Return the nested fields of the id if all of them are frozen.
+
+        Otherwise, return None, as they can be changed in place.
+        """
+        if self.match.frozen:
+            return (self.match,)
+        return None
+
+    def _id_values(self):
+        """Return the encoding of the fields of version 2 ids that vary."""
+        return self.match.packed()
 
     def as_dict(self, include_id=True):
         """Return the Flow as a serializable Python dictionary.
@@ -159,7 +272,7 @@ class FlowBase(ABC):  # pylint: disable=too-many-instance-attributes
 
         # Set attributes found in ``flow_dict``
         for attr_name, attr_value in flow_dict.items():
-            if attr_name in vars(flow):
+            if attr_name in cls._fields:
                 setattr(flow, attr_name, attr_value)
 
         flow.switch = switch
@@ -231,22 +344,148 @@ class FlowBase(ABC):  # pylint: disable=too-many-instance-attributes
                    stats=FlowStats.from_of_flow_stats(of_flow_stats))
 
     def __eq__(self, other):
-        include_id = False
+        """Compare flows by their memoized ids, ignoring their stats."""
         if not isinstance(other, self.__class__):
             raise ValueError(f'Error comparing flows: {other} is not '
                              f'an instance of {self.__class__}')
 
-        return self.as_dict(include_id) == other.as_dict(include_id)
+        return self is other or self.id == other.id
+
+    def __hash__(self):
+        """Hash the memoized id, so flows must not change while in sets."""
+        return hash(self.id)
+
+
+def _fingerprint(dpid, fields, values):
+    """Return the blake2b digest of a canonical encoding of flow fields.
+
+    The switch id is followed by the packed fixed size ``fields`` and the
+    ``values`` encoded by :func:`pack_values`.
+    """
+    digest = blake2b(digest_size=16)
+    digest.update(dpid.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(fields)
+    digest.update(values)
+    return digest.hexdigest()
+
+
+def pack_values(value):
+    """Return a canonical binary encoding of a value of ``as_dict``.
+
+    Unsigned 64-bit integers and strings are packed with a tag, lists with
+    their length and dicts with their keys, sorted like in the JSON of
+    version 1 ids. Dicts of unsigned integers, like most matches and
+    actions, are packed at once. Other values are tagged JSON. Each value
+    delimits itself, so encodings can be concatenated.
+    """
+    # pylint: disable=unidiomatic-typecheck
+    value_type = type(value)
+    if value_type is int and 0 <= value <= 0xffffffffffffffff:
+        return _PACKED_UINT.pack(b'i', value)
+    if value_type is str:
+        data = value.encode('utf-8')
+        return _PACKED_SIZE.pack(b's', len(data)) + data
+    if value_type is dict:
+        return _pack_dict(value)
+    if value_type in (list, tuple):
+        return b''.join((_PACKED_SIZE.pack(b'l', len(value)),
+                         *map(pack_values, value)))
+    data = json.dumps(value, sort_keys=True).encode('utf-8')
+    return _PACKED_SIZE.pack(b'j', len(data)) + data
+
+
+def _pack_dict(value):
+    """Pack the sorted keys of a dict, which are names, and its values."""
+    keys = sorted(value)
+    items = [value[key] for key in keys]
+    data = '\0'.join(keys).encode('utf-8')
+    if _INT_TYPES.issuperset(map(type, items)):
+        try:
+            return b''.join((_PACKED_DICT.pack(b'u', len(keys), len(data)),
+                             data, struct.pack(f'!{len(items)}Q', *items)))
+        except struct.error:
+            pass
+    return b''.join((_PACKED_DICT.pack(b'd', len(keys), len(data)), data,
+                     *map(pack_values, items)))
+
+
+class Freezable:
+    """Base class of flow fields that can be shared between flows.
+
+    Once frozen, e.g. when flows of many switches share them, setting any
+    of their attributes raises ``AttributeError``. Their copies are not
+    frozen, to be changed and set to a flow instead.
+    """
+
+    __slots__ = ('_frozen', '_packed')
+
+    @property
+    def frozen(self):
+        """Return whether the attributes can no longer be set."""
+        return getattr(self, '_frozen', False)
+
+    def as_dict(self):
+        """Return the fields as a dict, subclasses must implement it."""
+        raise NotImplementedError
 
+    def packed(self):
+        """Return the :func:`pack_values` encoding of ``as_dict``.
 
-class InstructionBase(ABC):
+        It is kept until an attribute is set, if the object is frozen or
+        its values can't be changed in place.
+        """
+        packed = getattr(self, '_packed', None)
+        if packed is None:
+            values = self.as_dict()
+            packed = pack_values(values)
+            if self.frozen or _IMMUTABLE_TYPES.issuperset(
+                    map(type, values.values())):
+                object.__setattr__(self, '_packed', packed)
+        return packed
+
+    def freeze(self):
+        """Forbid setting the attributes from now on and return ``self``."""
+        object.__setattr__(self, '_frozen', True)
+        return self
+
+    def __setattr__(self, name, value):
+        self._check_frozen(name)
+        object.__setattr__(self, '_packed', None)
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        # Used by copy and pickle, copies are not frozen
+        slots = {name: getattr(self, name) for cls in type(self).__mro__
+                 for name in getattr(cls, '__slots__', ())
+                 if name not in ('_frozen', '_packed')
+                 and hasattr(self, name)}
+        return getattr(self, '__dict__', None), slots
+
+    def _check_frozen(self, name):
+        """Raise ``AttributeError`` if ``name`` can't be set."""
+        if self.frozen:
+            raise AttributeError(f'{type(self).__name__!r} object is shared'
+                                 f' by flows, {name!r} of a copy can be set'
+                                 ' instead')
+
+
+class InstructionBase(Freezable, ABC):
     """Base class for Instructions."""
 
+    __slots__ = ()
+
     _action_factory = None
 
+    # Attributes of ``as_dict`` in order, instructions without them are
+    # serialized from their ``__dict__``
+    _fields = None
+
     def as_dict(self):
         """Return this instruction as a dict."""
-        return vars(self)
+        if self._fields is None:
+            return vars(self)
+        return {name: getattr(self, name) for name in self._fields}
 
     @classmethod
     def from_dict(cls, instruction_dict):
@@ -284,13 +523,27 @@ class InstructionFactoryBase(ABC):
         return instruction_class.from_of_instruction(of_instruction) \
             if instruction_class else None
 
+    @classmethod
+    def get_instruction_class(cls, key):
+        """Return the class of an instruction type or pyof class, if any."""
+        return cls._instruction_class.get(key)
+
 
-class ActionBase(ABC):
+class ActionBase(Freezable, ABC):
     """Base class for a flow action."""
 
+    __slots__ = ()
+
+    # Attributes of ``as_dict`` in order, actions without them, e.g.
+    # experimenter actions of other NApps, are serialized from their
+    # ``__dict__``
+    _fields = None
+
     def as_dict(self):
         """Return a dict that can be dumped as JSON."""
-        return vars(self)
+        if self._fields is None:
+            return vars(self)
+        return {name: getattr(self, name) for name in self._fields}
 
     @classmethod
     def from_dict(cls, action_dict):
@@ -342,9 +595,24 @@ class ActionFactoryBase(ABC):
         action_class = cls._action_class.get(of_class)
         return action_class.from_of_action(of_action) if action_class else None
 
+    @classmethod
+    def get_action_class(cls, key):
+        """Return the class of an action type or pyof class, if any."""
+        return cls._action_class.get(key)
+
+
+class MatchBase(Freezable):
+    """Base class with common high-level Match fields.
 
-class MatchBase:  # pylint: disable=too-many-instance-attributes
-    """Base class with common high-level Match fields."""
+    Only the fields that are set are stored, in a dict ordered like the
+    arguments of ``__init__``. Fields that are not set read as ``None``, and
+    setting a field to ``None`` removes it.
+    """
+
+    __slots__ = ('_fields',)
+
+    # Position of each field in ``__init__`` arguments, set below the class
+    _field_index = {}
 
     def __init__(self, in_port=None, dl_src=None, dl_dst=None, dl_vlan=None,
                  dl_vlan_pcp=None, dl_type=None, nw_proto=None, nw_src=None,
@@ -360,57 +628,63 @@ class MatchBase:  # pylint: disable=too-many-instance-attributes
         """Make it possible to set all attributes from the constructor."""
         # pylint: disable=too-many-arguments
         # pylint: disable=too-many-locals
-        self.in_port = in_port
-        self.dl_src = dl_src
-        self.dl_dst = dl_dst
-        self.dl_vlan = dl_vlan
-        self.dl_vlan_pcp = dl_vlan_pcp
-        self.dl_type = dl_type
-        self.nw_proto = nw_proto
-        self.nw_src = nw_src
-        self.nw_dst = nw_dst
-        self.tp_src = tp_src
-        self.tp_dst = tp_dst
-        self.in_phy_port = in_phy_port
-        self.ip_dscp = ip_dscp
-        self.ip_ecn = ip_ecn
-        self.udp_src = udp_src
-        self.udp_dst = udp_dst
-        self.sctp_src = sctp_src
-        self.sctp_dst = sctp_dst
-        self.icmpv4_type = icmpv4_type
-        self.icmpv4_code = icmpv4_code
-        self.arp_op = arp_op
-        self.arp_spa = arp_spa
-        self.arp_tpa = arp_tpa
-        self.arp_sha = arp_sha
-        self.arp_tha = arp_tha
-        self.ipv6_src = ipv6_src
-        self.ipv6_dst = ipv6_dst
-        self.ipv6_flabel = ipv6_flabel
-        self.icmpv6_type = icmpv6_type
-        self.icmpv6_code = icmpv6_code
-        self.nd_tar = nd_tar
-        self.nd_sll = nd_sll
-        self.nd_tll = nd_tll
-        self.mpls_lab = mpls_lab
-        self.mpls_tc = mpls_tc
-        self.mpls_bos = mpls_bos
-        self.pbb_isid = pbb_isid
-        self.v6_hdr = v6_hdr
-        self.metadata = metadata
-        self.tun_id = tun_id
+        # pylint: disable=unused-argument
+        arguments = locals()
+        self._fields = {name: arguments[name] for name in self._field_index
+                        if arguments[name] is not None}
+        self._packed = None
+
+    def __getattr__(self, name):
+        # Only called for the names that are not in __slots__
+        if not name.startswith('_'):
+            fields = self._fields
+            if name in fields:
+                return fields[name]
+            if name in self._field_index:
+                return None
+        raise AttributeError(f'{type(self).__name__!r} object has no'
+                             f' attribute {name!r}')
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+            return
+        self._check_frozen(name)
+        self._packed = None
+        fields = self._fields
+        if value is None:
+            fields.pop(name, None)
+            return
+        in_order = (name in fields or not fields or
+                    self._position(name) >=
+                    self._position(next(reversed(fields))))
+        fields[name] = value
+        if not in_order:
+            self._fields = dict(sorted(fields.items(),
+                                       key=lambda item:
+                                       self._position(item[0])))
+
+    def __copy__(self):
+        match = type(self).__new__(type(self))
+        match._fields = dict(self._fields)
+        match._packed = None
+        return match
+
+    @classmethod
+    def _position(cls, name):
+        """Return the position of a field, fields of other NApps go last."""
+        return cls._field_index.get(name, len(cls._field_index))
 
     def as_dict(self):
         """Return a dictionary excluding ``None`` values."""
-        return {k: v for k, v in self.__dict__.items() if v is not None}
+        return dict(self._fields)
 
     @classmethod
     def from_dict(cls, match_dict):
         """Return a Match instance from a dictionary."""
         match = cls()
         for key, value in match_dict.items():
-            if key in match.__dict__:
+            if key in cls._field_index:
                 setattr(match, key, value)
         return match
 
@@ -424,13 +698,25 @@ class MatchBase:  # pylint: disable=too-many-instance-attributes
         """Return a python-openflow Match."""
 
 
+MatchBase._field_index = {  # pylint: disable=protected-access
+    name: index for index, name in
+    enumerate(inspect.signature(MatchBase.__init__).parameters)
+    if name != 'self'}
+
+
 class Stats:
     """Simple class to store statistics as attributes and values."""
 
+    __slots__ = ()
+
+    # Statistics of subclasses, in order
+    _fields = ()
+
     def as_dict(self):
         """Return a dict excluding attributes with ``None`` value."""
-        return {attribute: value
-                for attribute, value in vars(self).items()
+        values = ((attribute, getattr(self, attribute))
+                  for attribute in self._fields)
+        return {attribute: value for attribute, value in values
                 if value is not None}
 
     @classmethod
@@ -454,9 +740,10 @@ class Stats:
         instances whose native values can be accessed by `.value`.
         """
         # Generator for GenericType values
-        attr_name_value = ((attr_name, gen_type.value)
-                           for attr_name, gen_type in vars(of_stats).items()
-                           if attr_name in vars(self))
+        of_values = vars(of_stats)
+        attr_name_value = ((attr_name, of_values[attr_name].value)
+                           for attr_name in self._fields
+                           if attr_name in of_values)
         self._update(self, attr_name_value)
 
     @staticmethod
@@ -470,6 +757,9 @@ class Stats:
 class FlowStats(Stats):
     """Fields for 1.3 FlowStats."""
 
+    _fields = ('byte_count', 'duration_sec', 'duration_nsec', 'packet_count')
+    __slots__ = _fields
+
     def __init__(self):
         """Initialize all statistics as ``None``."""
         self.byte_count = None
@@ -478,9 +768,14 @@ class FlowStats(Stats):
         self.packet_count = None
 
 
-class PortStats(Stats):  # pylint: disable=too-many-instance-attributes
+class PortStats(Stats):
     """Fields for 1.3 PortStats."""
 
+    _fields = ('rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes',
+               'rx_dropped', 'tx_dropped', 'rx_errors', 'tx_errors',
+               'rx_frame_err', 'rx_over_err', 'rx_crc_err', 'collisions')
+    __slots__ = _fields
+
     def __init__(self):
         """Initialize all statistics as ``None``."""
         self.rx_packets = None
@@ -495,3 +790,101 @@ class PortStats(Stats):  # pylint: disable=too-many-instance-attributes
         self.rx_over_err = None
         self.rx_crc_err = None
         self.collisions = None
+
+
+def flows_delta(old_table, flows):
+    """Return how a flow table changed given the flows of a new stats reply.
+
+    Tables map flow ids to ``(flow, packet_count, byte_count)``, so that
+    counters are compared with their values at the previous reply even if
+    a flow object is reused and updated in place.
+
+    Args:
+        old_table (dict): Previous table, as returned by this function.
+        flows (list): Flows of the new reply.
+
+    Returns:
+        tuple: The new table and the lists of added, removed and changed
+            flows, the latter with different packet or byte counts.
+
+    """
+    table = {}
+    added, changed = [], []
+    for flow in flows:
+        counters = (flow.stats.packet_count, flow.stats.byte_count)
+        flow_id = flow.id
+        table[flow_id] = (flow, *counters)
+        old_entry = old_table.get(flow_id)
+        if old_entry is None:
+            added.append(flow)
+        elif old_entry[1:] != counters:
+            changed.append(flow)
+    removed = [entry[0] for flow_id, entry in old_table.items()
+               if flow_id not in table]
+    return table, added, removed, changed
+
+
+class FlowTable(list):
+    """List of the flows of a switch with indexes to look them up.
+
+    Flows are indexed by id, match id, cookie and table, the flows of each
+    table ordered by descending priority. Indexes are built all at once on
+    the first lookup and dropped whenever the list is modified, so a table
+    is meant to be built with all the flows of a flow stats reply and then
+    only read.
+    """
+
+    def __init__(self, flows=()):
+        super().__init__(flows)
+        self._indexes = None
+
+    def get(self, flow_id, default=None):
+        """Return the flow with ``flow_id``, or ``default``."""
+        return self._get_indexes()[0].get(flow_id, default)
+
+    def by_match_id(self, match_id):
+        """Return the flows with ``match_id``."""
+        return self._get_indexes()[1].get(match_id, [])
+
+    def by_cookie(self, cookie):
+        """Return the flows with exactly ``cookie``."""
+        return self._get_indexes()[2].get(cookie, [])
+
+    def by_table(self, table_id):
+        """Return the flows of a table by descending priority."""
+        return self._get_indexes()[3].get(table_id, [])
+
+    def _get_indexes(self):
+        indexes = self._indexes
+        if indexes is None:
+            indexes = self._indexes = self._build_indexes()
+        return indexes
+
+    def _build_indexes(self):
+        ids, match_ids = {}, defaultdict(list)
+        cookies, tables = defaultdict(list), defaultdict(list)
+        for flow in self:
+            ids[flow.id] = flow
+            match_ids[flow.match_id].append(flow)
+            cookies[flow.cookie].append(flow)
+            tables[flow.table_id].append(flow)
+        for flows in tables.values():
+            flows.sort(key=lambda flow: flow.priority, reverse=True)
+        return ids, dict(match_ids), dict(cookies), dict(tables)
+
+
+def _dropping_indexes(method):
+    """Wrap a list method to drop the indexes of a FlowTable it modifies."""
+    def wrapper(self, *args, **kwargs):
+        self._indexes = None  # pylint: disable=protected-access
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'clear', 'sort',
+              'reverse'):
+    setattr(FlowTable, _name, _dropping_indexes(getattr(list, _name)))
+del _name
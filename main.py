@@ -1,11 +1,9 @@
 """NApp responsible for the main OpenFlow basic operations."""
 
 import asyncio
-import time
-from collections import defaultdict
 
 from pyof.foundation.exceptions import UnpackException
-from pyof.foundation.network_types import Ethernet, EtherType
+from pyof.foundation.network_types import EtherType
 from pyof.utils import PYOF_VERSION_LIBS, unpack
 from pyof.v0x04.common.header import Type
 from pyof.v0x04.common.port import PortState
@@ -13,28 +11,61 @@ from pyof.v0x04.controller2switch.common import MultipartType
 
 from kytos.core import KytosEvent, KytosNApp, log
 from kytos.core.connection import ConnectionState
-from kytos.core.helpers import alisten_to, listen_to, run_on_thread
+from kytos.core.helpers import alisten_to, listen_to
 from kytos.core.interface import Interface
 from napps.kytos.of_core import settings
-from napps.kytos.of_core.utils import (GenericHello, NegotiationException,
+from napps.kytos.of_core.reassembly import MultipartReassembler
+from napps.kytos.of_core.scheduler import StatsScheduler
+from napps.kytos.of_core.stats import StatsPoller
+from napps.kytos.of_core.transactions import (ErrorReplyException,
+                                              TransactionAborted, Transactions)
+from napps.kytos.of_core.utils import (OF_EVENTS, ConsumersRegistry,
+                                       GenericHello, IngestWorker, LazyMessage,
+                                       NegotiationException, ReachableMacCache,
                                        aemit_message_in, aemit_message_out,
-                                       emit_message_in, emit_message_out,
-                                       of_slicer)
+                                       aemit_messages_in, emit_message_in,
+                                       emit_message_out, of_slicer,
+                                       peek_eth_source, peek_ether_type,
+                                       peek_multipart_header, peek_of_header)
 from napps.kytos.of_core.v0x04 import utils as of_core_v0x04_utils
 from napps.kytos.of_core.v0x04.flow import Flow as Flow04
+from napps.kytos.of_core.v0x04.flow import intern_metrics
 from napps.kytos.of_core.v0x04.utils import try_to_activate_interface
 
 
 class Main(KytosNApp):
     """Main class of the NApp responsible for OpenFlow basic operations."""
 
-    # Keep track of multiple multipart replies from our own request only.
-    # Assume that all replies are received before setting a new xid. If
-    # that is not the case (i.e., overlapping replies), we skip up to X
-    # cycles before cleaning up pending requests and getting a fresh start
-    _multipart_replies_xids = {}
-    _multipart_replies_flows = defaultdict(list)
-    _multipart_replies_ports = defaultdict(list)
+    # Events sent with the assembled replies of stats requested with
+    # arequest_stats, other than flow and port stats
+    _stats_events = {MultipartType.OFPMP_TABLE: 'table_stats',
+                     MultipartType.OFPMP_GROUP: 'group_stats',
+                     MultipartType.OFPMP_METER: 'meter_stats'}
+
+    # Types of the replies resolving the requests awaited with arequest
+    _reply_types = {
+        Type.OFPT_ECHO_REQUEST.value: Type.OFPT_ECHO_REPLY.value,
+        Type.OFPT_FEATURES_REQUEST.value: Type.OFPT_FEATURES_REPLY.value,
+        Type.OFPT_GET_CONFIG_REQUEST.value: Type.OFPT_GET_CONFIG_REPLY.value,
+        Type.OFPT_MULTIPART_REQUEST.value: Type.OFPT_MULTIPART_REPLY.value,
+        Type.OFPT_BARRIER_REQUEST.value: Type.OFPT_BARRIER_REPLY.value,
+        Type.OFPT_QUEUE_GET_CONFIG_REQUEST.value:
+            Type.OFPT_QUEUE_GET_CONFIG_REPLY.value,
+        Type.OFPT_ROLE_REQUEST.value: Type.OFPT_ROLE_REPLY.value,
+        Type.OFPT_GET_ASYNC_REQUEST.value: Type.OFPT_GET_ASYNC_REPLY.value}
+
+    # Message types handled by of_core itself, always unpacked on arrival
+    _unpack_always = frozenset((Type.OFPT_ERROR.value,
+                                Type.OFPT_FEATURES_REPLY.value,
+                                Type.OFPT_MULTIPART_REPLY.value,
+                                Type.OFPT_PORT_STATUS.value,
+                                Type.OFPT_PACKET_IN.value))
+
+    def __init__(self, controller, **kwargs):
+        """Create the stats scheduler, which :meth:`execute` starts."""
+        self._stats_scheduler = StatsScheduler(self._on_stats_deadline)
+        self._stats_scheduler_future = None
+        super().__init__(controller, **kwargs)
 
     def setup(self):
         """App initialization (used instead of ``__init__``).
@@ -43,12 +74,13 @@ class Main(KytosNApp):
         Users shouldn't call this method directly.
         """
         self.of_core_version_utils = {0x04: of_core_v0x04_utils}
-        self.execute_as_loop(settings.STATS_INTERVAL)
-        self._connection_lock = defaultdict(asyncio.Lock)
-
-        # Per switch delay to request flow/port stats, to avoid all request
-        # being sent together and increase the overhead on the controller
-        self.switch_req_stats_delay = {}
+        self._multipart = MultipartReassembler()
+        self._transactions = Transactions()
+        self._stats_poller = StatsPoller(self.controller, self._multipart,
+                                         self._stats_scheduler)
+        self._ingest_workers = {}
+        self._consumers = ConsumersRegistry(self.controller)
+        self._reachable_macs = ReachableMacCache()
 
     def execute(self):
         """Run once on app 'start' or in a loop.
@@ -56,61 +88,152 @@ class Main(KytosNApp):
         The execute method is called by the run method of KytosNApp class.
         Users shouldn't call this method directly.
         """
+        self._stats_scheduler_future = asyncio.run_coroutine_threadsafe(
+            self._run_stats_scheduler(), self.controller.loop)
+        self._stats_scheduler_future.add_done_callback(
+            self._on_stats_scheduler_done)
+
+    @staticmethod
+    def _on_stats_scheduler_done(future):
+        """Log the error that stopped the stats scheduler, if any."""
+        if not future.cancelled() and future.exception():
+            log.error(f'Stats scheduler stopped: {future.exception()!r}')
+
+    async def _run_stats_scheduler(self):
+        """Schedule the connected switches and run the stats scheduler."""
         for switch in self.controller.switches.copy().values():
             if switch.is_connected():
-                self.request_flow_list(switch)
-                if settings.SEND_ECHO_REQUESTS:
-                    version_utils = \
-                        self.of_core_version_utils[switch.
-                                                   connection.protocol.version]
-                    version_utils.send_echo(self.controller, switch)
-
-    @run_on_thread
-    def request_flow_list(self, switch):
-        """Send flow stats request to a connected switch."""
-        self._request_flow_list(switch)
-
-    def _check_overlapping_multipart_request(self, switch):
-        """Check overlapping multipart stats request (OF 1.3 only)."""
-        current_req = self._multipart_replies_xids.get(switch.id, {})
-        if ('flows' in current_req or 'ports' in current_req) and \
-           current_req.get('skipped', 0) < settings.STATS_REQ_SKIP:
-            log.info("Overlapping stats request: switch %s flows_xid %s"
-                     " ports_xid %s", switch.id, current_req.get('flows'),
-                     current_req.get('ports'))
-            current_req['skipped'] = current_req.get('skipped', 0) + 1
-            return True
-
-        if switch.id in self._multipart_replies_flows:
-            del self._multipart_replies_flows[switch.id]
-        if switch.id in self._multipart_replies_ports:
-            del self._multipart_replies_ports[switch.id]
-        return False
-
-    def _get_switch_req_stats_delay(self, switch):
-        if switch.id in self.switch_req_stats_delay:
-            return self.switch_req_stats_delay[switch.id]
-        last = self.switch_req_stats_delay.get('last', 0)
-        max_delay = settings.STATS_INTERVAL/2
-        next_delay = (last + max_delay/10) % max_delay
-        self.switch_req_stats_delay[switch.id] = next_delay
-        self.switch_req_stats_delay['last'] = next_delay
-        return next_delay
-
-    def _request_flow_list(self, switch):
-        """Send flow stats request to a connected switch."""
-        time.sleep(self._get_switch_req_stats_delay(switch))
-        of_version = switch.connection.protocol.version
-        if of_version == 0x04:
-            if self._check_overlapping_multipart_request(switch):
-                return
+                self._stats_scheduler.add(switch.id)
+        await self._stats_scheduler.run()
+
+    async def _on_stats_deadline(self, dpid):
+        """Request the stats of a switch and keep its connection alive."""
+        switch = self.controller.switches.get(dpid)
+        if not switch or not switch.is_connected():
+            self._stats_scheduler.remove(dpid)
+            return
+        self._multipart.evict_expired(dpid)
+        await self._request_flow_list(switch)
+        if settings.SEND_ECHO_REQUESTS:
+            version_utils = \
+                self.of_core_version_utils[switch.connection.protocol.version]
+            await version_utils.asend_echo(self.controller, switch)
+
+    def _expect_multipart(self, switch, multipart_type, callback,
+                          on_evict=None):
+        """Return a multipart request whose replies are expected."""
+        request = of_core_v0x04_utils.multipart_stats_request(multipart_type)
+        self._multipart.expect(switch, int(request.header.xid),
+                               multipart_type, callback, on_evict=on_evict)
+        return request
+
+    async def _arequest_multipart(self, switch, multipart_type, callback,
+                                  on_evict=None):
+        """Send a multipart request, its replies go to ``callback``."""
+        request = self._expect_multipart(switch, multipart_type, callback,
+                                         on_evict)
+        await aemit_message_out(self.controller, switch.connection, request)
+        return int(request.header.xid)
+
+    async def _request_flow_list(self, switch):
+        """Send the stats requests of a poll of a connected switch."""
+        await self._stats_poller.poll(switch)
+
+    def set_flow_stats_filters(self, owner, filters):
+        """Set the flow stats filters of a NApp consuming flow stats.
+
+        See :meth:`StatsPoller.set_flow_stats_filters`.
+        """
+        self._stats_poller.set_flow_stats_filters(owner, filters)
+
+    def flow_stats_filters(self):
+        """Return the flow stats filters of all NApps, without repeats."""
+        return self._stats_poller.flow_stats_filters()
+
+    async def arequest_stats(self, switch, multipart_type):
+        """Request the table, group or meter stats of a switch.
+
+        Once all the replies are received, their entries are sent in a
+        ``kytos/of_core.table_stats``, ``group_stats`` or ``meter_stats``
+        event.
 
-            xid_flows = of_core_v0x04_utils.update_flow_list(self.controller,
-                                                             switch)
-            xid_ports = of_core_v0x04_utils.request_port_stats(self.controller,
-                                                               switch)
-            self._multipart_replies_xids[switch.id] = {'flows': xid_flows,
-                                                       'ports': xid_ports}
+        Returns:
+            int: multipart request xid
+
+        """
+        if multipart_type not in self._stats_events:
+            raise ValueError(f'Unsupported stats type {multipart_type}')
+        return await self._arequest_multipart(switch, multipart_type,
+                                              self._on_stats)
+
+    async def arequest(self, switch, message, timeout=None):
+        """Send a request to a switch and return its reply.
+
+        The reply is matched by its xid and its type, other messages
+        reusing the xid are ignored. Multipart requests are resolved with
+        the pyof entries of all their replies, once the last one arrives,
+        flow stats included. Other requests, such as barrier requests, are
+        resolved with their reply message. Replies are still sent as
+        events, like any other message.
+
+        Args:
+            switch (:class:`~kytos.core.switch.Switch`): Connected switch.
+            message: python-openflow request message.
+            timeout (float): Seconds to wait for the reply, defaults to
+                ``settings.REQUEST_TIMEOUT``.
+
+        Raises:
+            ValueError: The message is not a request with a reply.
+            ErrorReplyException: The switch replied with an OFPT_ERROR.
+            TransactionAborted: The switch disconnected or, for multipart
+                requests, too many entries or newer requests of the same
+                type evicted it.
+            asyncio.TimeoutError: No reply within the timeout.
+
+        """
+        reply_type = self._reply_types.get(message.header.message_type.value)
+        if reply_type is None:
+            raise ValueError(f'{message.header.message_type} has no reply')
+        if timeout is None:
+            timeout = settings.REQUEST_TIMEOUT
+        xid = int(message.header.xid)
+        future = self._transactions.open(switch.id, xid, reply_type)
+        pending = None
+        if reply_type == Type.OFPT_MULTIPART_REPLY.value:
+            async def on_complete(request):
+                self._transactions.resolve(switch.id, xid, request.entries,
+                                           reply_type)
+
+            def on_evict(request):
+                self._transactions.fail(
+                    switch.id, xid, TransactionAborted(
+                        f'multipart request xid {request.xid} evicted'))
+
+            pending = self._multipart.expect(
+                switch, xid, message.multipart_type, on_complete,
+                timeout=timeout, on_evict=on_evict)
+            # Flows are only built for the flow stats polls
+            pending.raw = True
+        try:
+            await aemit_message_out(self.controller, switch.connection,
+                                    message)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._transactions.close(switch.id, xid)
+            if pending:
+                self._multipart.cancel(pending)
+
+    def _settle_transaction(self, switch, msg_type, xid, message):
+        """Resolve or fail the request awaiting a reply, if any.
+
+        Only replies of the type a request expects resolve it.
+        """
+        if msg_type == Type.OFPT_ERROR.value:
+            self._transactions.fail(switch.id, xid,
+                                    ErrorReplyException(message))
+        elif msg_type != Type.OFPT_MULTIPART_REPLY.value:
+            # Multipart replies are assembled before resolving
+            self._transactions.resolve(switch.id, xid, message, msg_type)
 
     @listen_to('kytos/of_core.v0x04.messages.in.ofpt_features_reply')
     def on_features_reply(self, event):
@@ -129,12 +252,17 @@ class Main(KytosNApp):
         version_utils = self.of_core_version_utils[connection.protocol.version]
         switch = version_utils.handle_features_reply(self.controller, event)
         switch.update_lastseen()
+        port_desc_request = self._expect_multipart(
+            switch, MultipartType.OFPMP_PORT_DESC, self._on_port_desc)
+        emit_message_out(self.controller, connection, port_desc_request)
 
         if (connection.is_during_setup() and
                 connection.protocol.state == 'waiting_features_reply'):
             connection.protocol.state = 'handshake_complete'
             connection.set_established_state()
-            version_utils.send_desc_request(self.controller, switch)
+            desc_request = self._expect_multipart(
+                switch, MultipartType.OFPMP_DESC, self._on_desc)
+            emit_message_out(self.controller, connection, desc_request)
             if settings.SEND_SET_CONFIG:
                 version_utils.send_set_config(self.controller, switch)
             log.info('Connection %s, Switch %s: OPENFLOW HANDSHAKE COMPLETE',
@@ -144,95 +272,94 @@ class Main(KytosNApp):
                 content={'switch': switch})
             self.controller.buffers.app.put(event_raw)
 
-    @listen_to('kytos/of_core.handshake.completed')
-    def on_handshake_completed_request_flow_list(self, event):
+    @alisten_to('kytos/of_core.handshake.completed')
+    async def on_handshake_completed_request_flow_list(self, event):
         """Request an flow list right after the handshake is completed.
 
+        The switch is also added to the stats scheduler, which requests its
+        stats periodically from then on.
+
         Args:
             event (KytosEvent): Event with the switch' handshake completed
         """
         switch = event.content['switch']
+        self._stats_scheduler.add(switch.id)
         if switch.is_enabled():
-            self.handle_handshake_completed_request_flow_list(switch)
+            await self.handle_handshake_completed_request_flow_list(switch)
 
-    def handle_handshake_completed_request_flow_list(self, switch):
+    async def handle_handshake_completed_request_flow_list(self, switch):
         """Request an flow list right after the handshake is completed."""
-        self._request_flow_list(switch)
+        await self._request_flow_list(switch)
 
     async def _handle_multipart_reply(self, reply, switch):
-        """Handle multipart replies for v0x04 switches."""
-        if reply.multipart_type == MultipartType.OFPMP_FLOW:
-            await self._handle_multipart_flow_stats(reply, switch)
-        elif reply.multipart_type == MultipartType.OFPMP_PORT_STATS:
-            await self._handle_multipart_port_stats(reply, switch)
-        elif reply.multipart_type == MultipartType.OFPMP_PORT_DESC:
+        """Handle multipart replies for v0x04 switches.
+
+        Replies to requests expected by the multipart reassembler are
+        assembled until their last reply. Port and switch descriptions
+        requested by others are handled as they arrive, other unexpected
+        replies are ignored.
+        """
+        multipart_type, flags, xid = self._multipart_header(reply)
+        request = self._multipart.get(switch.id, xid, multipart_type)
+        if request is not None:
+            entries = self._multipart_entries(reply, switch, request)
+            # Last bit means more replies
+            await self._multipart.feed(request, entries, flags % 2 == 1)
+        elif multipart_type == MultipartType.OFPMP_PORT_DESC:
             await of_core_v0x04_utils.handle_port_desc(self.controller, switch,
                                                        reply.body)
-        elif reply.multipart_type == MultipartType.OFPMP_DESC:
+        elif multipart_type == MultipartType.OFPMP_DESC:
             switch.update_description(reply.body)
 
-    async def _handle_multipart_flow_stats(self, reply, switch):
-        """Update switch flows after all replies are received.
+    def _multipart_entries(self, reply, switch, request):
+        """Return the entries of a multipart reply to be assembled.
 
-        Returns true if no more replies are expected.
+        Flow stats replies are read as flows, unless the request wants
+        their raw pyof entries.
         """
-        if self._is_multipart_reply_ours(reply, switch, 'flows'):
-            # Get all flows from the reply and extend the multipar flows list
-            flows = [Flow04.from_of_flow_stats(of_flow_stats, switch)
-                     for of_flow_stats in reply.body]
-            self._multipart_replies_flows[switch.id].extend(flows)
-            xid = int(reply.header.xid)
-            if reply.flags.value % 2 == 0:  # Last bit means more replies
-                try:
-                    replies_flows = [
-                        flow for flow
-                        in self._multipart_replies_flows[switch.id]
-                    ]
-                    self._update_switch_flows(switch)
-                except KeyError:
-                    log.error("Skipped flow stats reply due to error when"
-                              f"updating switch {switch.id}, xid {xid}")
-                    return
-                event_raw = KytosEvent(
-                    name='kytos/of_core.flow_stats.received',
-                    content={'switch': switch, 'replies_flows': replies_flows})
-                await self.controller.buffers.app.aput(event_raw)
-                return True
-
-    async def _handle_multipart_port_stats(self, reply, switch):
-        """Emit an event about new port stats."""
-        if self._is_multipart_reply_ours(reply, switch, 'ports'):
-            port_stats = [of_port_stats for of_port_stats in reply.body]
-            self._multipart_replies_ports[switch.id].extend(port_stats)
-            if reply.flags.value % 2 == 0:
-                await self._new_port_stats(switch)
-
-    def _update_switch_flows(self, switch):
-        """Update controllers' switch flow list and clean resources."""
-        switch.flows = self._multipart_replies_flows[switch.id]
-        del self._multipart_replies_flows[switch.id]
-        del self._multipart_replies_xids[switch.id]['flows']
-
-    async def _new_port_stats(self, switch):
-        """Send an event with the new port stats and clean resources."""
-        all_port_stats = self._multipart_replies_ports[switch.id]
-        del self._multipart_replies_ports[switch.id]
-        del self._multipart_replies_xids[switch.id]['ports']
-        port_stats_event = KytosEvent(
-            name="kytos/of_core.port_stats",
-            content={
-                'switch': switch,
-                'port_stats': all_port_stats
-                })
-        await self.controller.buffers.app.aput(port_stats_event)
-
-    def _is_multipart_reply_ours(self, reply, switch, stat):
-        """Return whether we are expecting the reply."""
-        if switch.id in self._multipart_replies_xids:
-            sent_xid = self._multipart_replies_xids[switch.id].get(stat)
-            if sent_xid == reply.header.xid:
-                return True
-        return False
+        multipart_type = request.multipart_type
+        if multipart_type == MultipartType.OFPMP_FLOW and not request.raw:
+            if isinstance(reply, LazyMessage):
+                return self._stats_poller.flows(reply.packet, switch)
+            return [Flow04.from_of_flow_stats(of_flow_stats, switch)
+                    for of_flow_stats in reply.body]
+        if multipart_type == MultipartType.OFPMP_DESC:
+            return [reply.body]
+        return list(reply.body)
+
+    def stats_intervals(self):
+        """Return the stats interval chosen for each scheduled switch."""
+        return self._stats_scheduler.intervals
+
+    async def _on_port_desc(self, request):
+        """Update the interfaces of a switch from all its port replies."""
+        await of_core_v0x04_utils.handle_port_desc(
+            self.controller, request.switch, request.entries)
+
+    async def _on_desc(self, request):
+        """Update the description of a switch."""
+        request.switch.update_description(request.entries[0])
+
+    async def _on_stats(self, request):
+        """Send an event with the table, group or meter stats of a switch."""
+        name = self._stats_events[request.multipart_type]
+        event = KytosEvent(name=f'kytos/of_core.{name}',
+                           content={'switch': request.switch,
+                                    name: request.entries})
+        await self.controller.buffers.app.aput(event)
+
+    @staticmethod
+    def _multipart_header(reply):
+        """Return multipart type, flags and xid of a multipart reply.
+
+        They are read from the raw packet of a :class:`LazyMessage`, so
+        that it is not unpacked.
+        """
+        if isinstance(reply, LazyMessage):
+            multipart_type, flags = peek_multipart_header(reply.packet)
+            return multipart_type, flags, reply.of_header[3]
+        return (int(reply.multipart_type), reply.flags.value,
+                int(reply.header.xid))
 
     @alisten_to('kytos/core.openflow.raw.in')
     async def on_raw_in(self, event):
@@ -248,15 +375,35 @@ class Main(KytosNApp):
             switch.update_lastseen()
 
         connection = event.source
-        async with self._connection_lock[connection.id]:
-            data = connection.remaining_data + event.content['new_data']
-            packets, connection.remaining_data = of_slicer(data)
-            if not packets:
+        worker = self._ingest_workers.get(connection.id)
+        if worker is None:
+            # Raw data handled after connection.lost would start a worker
+            # that is never stopped
+            if not connection.is_alive():
                 return
+            worker = IngestWorker(connection, self._process_raw_data)
+            self._ingest_workers[connection.id] = worker
+            worker.start()
+        await worker.put(event.content['new_data'])
+
+    async def _process_raw_data(self, connection, rx_buffer):
+        """Unpack and emit the packets received so far from a connection.
+
+        Called by the connection's :class:`IngestWorker` after it feeds
+        a raw chunk to ``rx_buffer``.
+        """
+        switch = connection.switch
+        packets, _ = of_slicer(rx_buffer)
+        if not packets:
+            return
+        self._consumers.refresh()
 
-            unprocessed_packets = []
-            multipart_messages = {}
+        unprocessed_packets = []
+        multipart_messages = {}
+        messages_in = []
 
+        # Messages collected before an early return are still emitted
+        try:
             for packet in packets:
                 if not connection.is_alive():
                     return
@@ -267,48 +414,90 @@ class Main(KytosNApp):
                         return
                     continue
 
-                try:
-                    message = connection.protocol.unpack(packet)
-                    if message.header.message_type == Type.OFPT_ERROR:
-                        log.error(f"OFPT_ERROR: type {message.error_type},"
-                                  f" error code {message.code},"
-                                  f" from switch {switch.id},"
-                                  f" xid {message.header.xid}/"
-                                  f"0x{message.header.xid.value:x}")
-                except (UnpackException, AttributeError) as err:
-                    log.error(err)
-                    if isinstance(err, AttributeError):
-                        log.error(f'Connection {connection.id}: connection'
-                                  f'closed before version negotiation')
-                    connection.close()
+                of_header = peek_of_header(packet)
+                version, msg_type, _, xid = of_header
+                message = self._unpack_frame(connection, packet, of_header)
+                if message is None:
                     return
 
-                log.debug('Connection %s: IN OFP, ver: %s, type: %s, xid: %s',
-                          connection.id,
-                          message.header.version,
-                          message.header.message_type,
-                          message.header.xid)
+                log.debug('Connection %s: IN OFP, ver: %s, type: %s,'
+                          ' xid: %s', connection.id, version, msg_type, xid)
 
-                ofp_msg_type_str = message.header.message_type.name.lower()
                 waiting_features_reply = (
-                    ofp_msg_type_str == 'ofpt_features_reply'
+                    msg_type == Type.OFPT_FEATURES_REPLY.value
                     and connection.protocol.state == 'waiting_features_reply')
 
-                if connection.is_during_setup() and not waiting_features_reply:
+                if connection.is_during_setup() and \
+                        not waiting_features_reply:
                     unprocessed_packets.append(packet)
                     continue
 
-                if ofp_msg_type_str == 'ofpt_multipart_reply':
-                    multipart_messages.setdefault(int(message.header.xid), [])
-                    multipart_messages[int(message.header.xid)].append(message)
+                if switch:
+                    self._settle_transaction(switch, msg_type, xid, message)
+
+                if msg_type == Type.OFPT_MULTIPART_REPLY.value:
+                    multipart_messages.setdefault(xid, [])
+                    multipart_messages[xid].append(message)
                     continue
 
-                await self.aemit_message_in(connection, message)
+                messages_in.append(message)
+        finally:
+            await self.aemit_messages_in(connection, messages_in)
+        rx_buffer.unread(unprocessed_packets)
+        await self.process_multipart_messages(connection, multipart_messages)
 
-            connection.remaining_data = b''.join(unprocessed_packets) + \
-                                        connection.remaining_data
+    def _unpack_frame(self, connection, packet, of_header):
+        """Unpack a frame of a connection, or close it and return None.
 
-        await self.process_multipart_messages(connection, multipart_messages)
+        Frames that can't be unpacked, e.g. because the connection was
+        closed before version negotiation, close the connection.
+        """
+        msg_type, xid = of_header[1], of_header[3]
+        try:
+            message = self._unpack_message(connection, packet, of_header)
+            if msg_type == Type.OFPT_ERROR.value:
+                log.error(f"OFPT_ERROR: type {message.error_type},"
+                          f" error code {message.code},"
+                          f" from switch {connection.switch.id},"
+                          f" xid {xid}/0x{xid:x}")
+        except (UnpackException, AttributeError) as err:
+            log.error(err)
+            if isinstance(err, AttributeError):
+                log.error(f'Connection {connection.id}: connection'
+                          f'closed before version negotiation')
+            connection.close()
+            return None
+        return message
+
+    def ingest_metrics(self):
+        """Return the ingest queue metrics of each connection."""
+        return {connection_id: worker.metrics
+                for connection_id, worker in self._ingest_workers.items()}
+
+    @staticmethod
+    def intern_metrics():
+        """Return the metrics of the flow fields shared by all switches."""
+        return intern_metrics()
+
+    def _unpack_message(self, connection, packet, of_header):
+        """Unpack a packet, unless no NApp listens to its message type.
+
+        Messages without listeners are wrapped in a :class:`LazyMessage`,
+        which is only unpacked if any of its attributes is accessed later.
+        """
+        version, msg_type = of_header[:2]
+        if (msg_type == Type.OFPT_MULTIPART_REPLY.value and
+                peek_multipart_header(packet)[0] == MultipartType.OFPMP_FLOW):
+            # Flow stats are read from the raw entries, see FlowStatsCache
+            return LazyMessage(bytes(packet), connection.protocol.unpack,
+                               of_header)
+        if msg_type not in self._unpack_always:
+            of_event = OF_EVENTS.get((version, msg_type, 'in'))
+            if of_event and not self._consumers.has_consumers(of_event[0]):
+                return LazyMessage(bytes(packet), connection.protocol.unpack,
+                                   of_header)
+        # pyof only unpacks bytes, frames are copied just once
+        return connection.protocol.unpack(bytes(packet))
 
     async def process_new_connection(self, connection, packet):
         """Async process a packet from a new connection."""
@@ -335,7 +524,7 @@ class Main(KytosNApp):
         for msgs in messages.values():
             for message in msgs:
                 await self._handle_multipart_reply(message, switch)
-                await self.aemit_message_in(connection, message)
+            await self.aemit_messages_in(connection, msgs)
 
     def emit_message_in(self, connection, message):
         """Emit a KytosEvent for each incoming message.
@@ -345,11 +534,7 @@ class Main(KytosNApp):
         if not connection.is_alive():
             return
         emit_message_in(self.controller, connection, message)
-        msg_type = message.header.message_type.name.lower()
-        if msg_type == 'ofpt_port_status':
-            self.update_port_status(message, connection)
-        elif msg_type == 'ofpt_packet_in':
-            self.update_links(message, connection)
+        self._update_from_message_in(connection, message)
 
     async def aemit_message_in(self, connection, message):
         """Async emit a KytosEvent for each incoming message.
@@ -359,6 +544,26 @@ class Main(KytosNApp):
         if not connection.is_alive():
             return
         await aemit_message_in(self.controller, connection, message)
+        self._update_from_message_in(connection, message)
+
+    async def aemit_messages_in(self, connection, messages):
+        """Async emit a KytosEvent for each message of a batch.
+
+        The messages were received while the connection was alive, so they
+        are emitted even if it was closed since, e.g. by a later message of
+        the same chunk. Also update links and port status.
+        """
+        if not messages:
+            return
+        await aemit_messages_in(self.controller, connection, messages)
+        for message in messages:
+            self._update_from_message_in(connection, message)
+
+    def _update_from_message_in(self, connection, message):
+        """Update links and port status from an incoming message."""
+        # Not unpacked, so neither a port status nor a packet in
+        if isinstance(message, LazyMessage):
+            return
         msg_type = message.header.message_type.name.lower()
         if msg_type == 'ofpt_port_status':
             self.update_port_status(message, connection)
@@ -496,29 +701,42 @@ class Main(KytosNApp):
     @alisten_to(".*.connection.lost")
     async def on_connection_lost(self, event) -> None:
         """On connection_lost event."""
+        worker = self._ingest_workers.pop(event.content["source"].id, None)
+        if worker:
+            worker.stop()
         switch = event.content["source"].switch
         if not switch:
             return
+        self._stats_scheduler.remove(switch.id)
         self.pop_multipart_replies(switch)
+        self._transactions.abort(switch.id, 'connection lost')
+        self._stats_poller.remove(switch.id)
 
     def pop_multipart_replies(self, switch) -> None:
         """Pop multipart replies."""
-        self._multipart_replies_xids.pop(switch.id, None)
-        self._multipart_replies_flows.pop(switch.id, None)
-        self._multipart_replies_ports.pop(switch.id, None)
+        self._multipart.discard(switch.id)
 
     @alisten_to("kytos/core.openflow.connection.error")
     async def on_openflow_connection_error(self, event):
         """On openflow connection error try to pop multipart replies."""
-        self.pop_multipart_replies(event.content["destination"].switch)
+        switch = event.content["destination"].switch
+        self.pop_multipart_replies(switch)
+        self._transactions.abort(switch.id, 'connection error')
 
     def shutdown(self):
         """End of the application."""
         log.debug('Shutting down...')
+        if self._stats_scheduler_future:
+            self._stats_scheduler_future.cancel()
+        for worker in self._ingest_workers.values():
+            worker.stop()
 
     def update_links(self, message, source):
         """Dispatch 'reacheable.mac' event.
 
+        The event is only dispatched for MAC addresses that are new, moved or
+        expired in the reachable MAC cache.
+
         Args:
             message: python openflow (pyof) PacketIn object.
             source: kytos.core.switch.Connection instance.
@@ -532,27 +750,27 @@ class Main(KytosNApp):
                 }
 
         """
-        ethernet = Ethernet()
-        ethernet.unpack(message.data.value)
-        if ethernet.ether_type in (EtherType.LLDP, EtherType.IPV6):
+        frame = message.data.value
+        ether_type = peek_ether_type(frame)
+        if ether_type in (None, EtherType.LLDP, EtherType.IPV6):
             return
 
-        try:
-            port = source.switch.get_interface_by_port_no(
-                message.in_port.value)
-        except AttributeError:
-            port = source.switch.get_interface_by_port_no(message.in_port)
+        in_port = getattr(message.in_port, 'value', message.in_port)
+        reachable_mac = peek_eth_source(frame)
+        if not self._reachable_macs.is_new(source.switch.id, in_port,
+                                           reachable_mac):
+            return
 
+        port = source.switch.get_interface_by_port_no(in_port)
         name = 'kytos/of_core.reachable.mac'
         content = {'switch': source.switch,
                    'port': port,
-                   'reachable_mac': ethernet.source.value}
+                   'reachable_mac': reachable_mac}
         event = KytosEvent(name, content)
         self.controller.buffers.app.put(event)
 
         msg = 'The MAC %s is reachable from switch/port %s/%s.'
-        log.debug(msg, ethernet.source, source.switch.id,
-                  message.in_port)
+        log.debug(msg, reachable_mac, source.switch.id, in_port)
 
     def _send_specific_port_mod(self, port, interface, current_state):
         """Dispatch port link_up/link_down events."""
@@ -0,0 +1,108 @@
+"""Per second rates of the port counters of each switch."""
+import time
+
+import numpy as np
+
+#: Port counters whose rates are computed, in the order of their columns
+COUNTERS = ('rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes',
+            'rx_dropped', 'tx_dropped', 'rx_errors', 'tx_errors')
+#: Other port counters, only compared to tell whether a port changed
+OTHER_COUNTERS = ('rx_frame_err', 'rx_over_err', 'rx_crc_err', 'collisions')
+
+# Deltas this large are counters that went back, e.g. after a port reset,
+# rather than 64-bit counters that wrapped around
+_MAX_DELTA = np.uint64(2**63)
+
+
+class PortStatsRates:
+    """Compute the rates of port counters between port stats replies.
+
+    The counters of the last reply of each switch are kept in arrays sorted
+    by port number, so that the rates of all the ports of a reply are
+    computed at once. Deltas of unsigned 64-bit counters wrap around, and
+    rates are NaN for new ports and ports whose counters or duration went
+    back since the previous reply. Ports are also flagged as changed if
+    they are new or any of their counters, including
+    :data:`OTHER_COUNTERS`, moved. Durations are intentionally not
+    compared: they move at every reply of a live port, which would then
+    never be unchanged.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._previous = {}
+
+    def __len__(self):
+        return len(self._previous)
+
+    def update(self, dpid, port_stats):
+        """Return the rates of the ports of a new port stats reply.
+
+        Args:
+            dpid (str): Switch the reply is from.
+            port_stats (list): pyof ``PortStats`` of all the ports.
+
+        Returns:
+            dict: ``port_no``, ``changed`` and each of :data:`COUNTERS`
+                mapped to arrays with a row per port, sorted by port
+                number, the counters with their rates per second.
+
+        """
+        now = self._clock()
+        names = COUNTERS + OTHER_COUNTERS
+        rows = [(int(stats.port_no),
+                 *(int(getattr(stats, name)) for name in names),
+                 int(stats.duration_sec), int(stats.duration_nsec))
+                for stats in port_stats]
+        table = np.array(rows, dtype=np.uint64)
+        table = table.reshape(-1, len(names) + 3)
+        table = table[np.argsort(table[:, 0], kind='stable')]
+        port_nos, counters = table[:, 0], table[:, 1:-2]
+        durations = table[:, -2] + table[:, -1] * 1e-9
+
+        rates = np.full((len(port_nos), len(COUNTERS)), np.nan)
+        changed = np.ones(len(port_nos), dtype=bool)
+        previous = self._previous.get(dpid)
+        if previous is not None and len(previous[0]):
+            self._fill_rates(rates, changed, previous, port_nos, counters,
+                             durations, now)
+        self._previous[dpid] = (port_nos, counters, durations, now)
+
+        result = {'port_no': port_nos, 'changed': changed}
+        result.update(zip(COUNTERS, rates.T))
+        return result
+
+    def remove(self, dpid):
+        """Forget the counters of a switch."""
+        self._previous.pop(dpid, None)
+
+    # pylint: disable=too-many-arguments
+    @staticmethod
+    def _fill_rates(rates, changed, previous, port_nos, counters, durations,
+                    now):
+        """Fill ``rates`` and ``changed`` given the previous reply."""
+        old_port_nos, old_counters, old_durations, old_now = previous
+        index = np.minimum(np.searchsorted(old_port_nos, port_nos),
+                           len(old_port_nos) - 1)
+        found = old_port_nos[index] == port_nos
+        old_durations = old_durations[index]
+        # Switches without port durations report them as 0
+        elapsed = np.where((durations > 0) | (old_durations > 0),
+                           durations - old_durations, now - old_now)
+        deltas = counters - old_counters[index]
+        rates[:] = PortStatsRates._rates(deltas[:, :len(COUNTERS)], elapsed,
+                                         found)
+        changed[:] = ~found | deltas.any(axis=1)
+
+    @staticmethod
+    def _rates(deltas, elapsed, found):
+        """Return the rates of counter deltas over the elapsed seconds.
+
+        Rates are NaN for ports not found before, for durations that did not
+        move forward and for counters that went back.
+        """
+        rates = np.full(deltas.shape, np.nan)
+        valid = found & (elapsed > 0)
+        rates[valid] = deltas[valid] / elapsed[valid, None]
+        rates[deltas >= _MAX_DELTA] = np.nan
+        return rates
@@ -0,0 +1,234 @@
+"""Reassembly of the multipart replies to in-flight multipart requests."""
+import time
+from threading import Lock
+
+from kytos.core import log
+from napps.kytos.of_core import settings
+
+
+class PendingMultipart:
+    """A multipart request waiting for the rest of its replies."""
+
+    __slots__ = ('switch', 'xid', 'multipart_type', 'callback', 'on_evict',
+                 'max_entries', 'started', 'deadline', 'entries', 'replies',
+                 'raw')
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, switch, xid, multipart_type, callback, started,
+                 deadline, max_entries, on_evict=None):
+        self.switch = switch
+        self.xid = xid
+        self.multipart_type = multipart_type
+        self.callback = callback
+        self.on_evict = on_evict
+        self.max_entries = max_entries
+        self.started = started
+        self.deadline = deadline
+        self.entries = []
+        self.replies = 0
+        # Whether to assemble the pyof entries of flow stats replies
+        self.raw = False
+
+    @property
+    def key(self):
+        """Return the key of the request within its switch."""
+        return (self.xid, self.multipart_type)
+
+
+class MultipartGroup:
+    """Multipart requests of a switch that complete together.
+
+    Each request is expected with :meth:`complete` as its callback and
+    :meth:`evict` as its ``on_evict``, then added to the group. Once all of
+    them complete, the group callback is awaited with the group, whose
+    entries are those of its requests in the order they were added. If any
+    of them is evicted, ``on_evict`` is called once with the group instead.
+    """
+
+    def __init__(self, switch, callback, on_evict=None):
+        self.switch = switch
+        self.callback = callback
+        self.on_evict = on_evict
+        self.requests = []
+        self.entries = []
+        self.evicted = False
+        self._remaining = 0
+
+    @property
+    def started(self):
+        """Return when the first request of the group was expected."""
+        return self.requests[0].started
+
+    def add(self, request):
+        """Add a request expected with the callbacks of the group."""
+        self.requests.append(request)
+        self._remaining += 1
+
+    async def complete(self, request):  # pylint: disable=unused-argument
+        """Complete a request, and the group with its last one."""
+        self._remaining -= 1
+        if self._remaining or self.evicted:
+            return
+        self.entries = [entry for member in self.requests
+                        for entry in member.entries]
+        await self.callback(self)
+
+    def evict(self, request):  # pylint: disable=unused-argument
+        """Evict the group, the first time any of its requests is evicted."""
+        if self.evicted:
+            return
+        self.evicted = True
+        if self.on_evict:
+            self.on_evict(self)
+
+
+class MultipartReassembler:
+    """Assemble the replies to multipart requests sent to switches.
+
+    Requests are expected by switch, xid and multipart type, so any number
+    of them can be in flight at once. The entries of their replies are
+    accumulated until the last reply, when the request completion callback
+    is awaited with it. Requests that take longer than their timeout or
+    that get too many entries are evicted, as are the oldest requests of a
+    type when too many of them are in flight for the same switch.
+
+    Requests can be expected from any thread, replies are fed from the
+    event loop.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, timeout=None, max_entries=None, max_pending=None,
+                 clock=time.monotonic):
+        """Use the ``MULTIPART_*`` settings by default."""
+        self.timeout = timeout or settings.MULTIPART_TIMEOUT
+        self.max_entries = max_entries or settings.MULTIPART_MAX_ENTRIES
+        self.max_pending = max_pending or settings.MULTIPART_MAX_PENDING
+        self._clock = clock
+        self._pending = {}
+        self._lock = Lock()
+        self.completed = 0
+        self.evicted = 0
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(requests) for requests in self._pending.values())
+
+    # pylint: disable=too-many-arguments
+    def expect(self, switch, xid, multipart_type, callback, timeout=None,
+               max_entries=None, on_evict=None, max_pending=None):
+        """Expect the replies to a multipart request sent to ``switch``.
+
+        Args:
+            switch (:class:`~kytos.core.switch.Switch`): Switch the request
+                is sent to.
+            xid (int): Request xid.
+            multipart_type (int): Request multipart type.
+            callback (coroutine function): Awaited with the
+                :class:`PendingMultipart` once its last reply is fed.
+            timeout (float): Seconds to wait for the last reply.
+            max_entries (int): Maximum number of entries of all replies.
+            on_evict (callable): Called with the :class:`PendingMultipart`
+                if it is evicted.
+            max_pending (int): Maximum number of requests of the same type
+                in flight for the switch.
+        """
+        now = self._clock()
+        if timeout is None:
+            timeout = self.timeout
+        request = PendingMultipart(switch, xid, int(multipart_type),
+                                   callback, now, now + timeout,
+                                   max_entries or self.max_entries,
+                                   on_evict)
+        evicted = []
+        with self._lock:
+            requests = self._pending.setdefault(switch.id, {})
+            requests[request.key] = request
+            same_type = [pending for pending in requests.values()
+                         if pending.multipart_type == request.multipart_type]
+            # Requests are kept in insertion order, the oldest go first
+            for pending in same_type[:-(max_pending or self.max_pending)]:
+                evicted.append(requests.pop(pending.key))
+        self._evicted(evicted, 'too many requests in flight')
+        return request
+
+    def get(self, dpid, xid, multipart_type):
+        """Return the request expecting a reply, if any."""
+        with self._lock:
+            return self._pending.get(dpid, {}).get((xid, int(multipart_type)))
+
+    def pending(self, dpid):
+        """Return the requests of a switch still waiting for replies."""
+        with self._lock:
+            return list(self._pending.get(dpid, {}).values())
+
+    async def feed(self, request, entries, more):
+        """Add the entries of a reply to its request.
+
+        Return True if it was the last reply and the request completed.
+        """
+        request.entries.extend(entries)
+        request.replies += 1
+        if len(request.entries) > request.max_entries:
+            if self._pop(request):
+                self._evicted([request], f'more than {request.max_entries}'
+                                         ' entries')
+            return False
+        if more:
+            return False
+        if not self._pop(request):
+            return False
+        self.completed += 1
+        await request.callback(request)
+        return True
+
+    def evict_expired(self, dpid=None):
+        """Evict the requests past their deadline, of a switch or of all."""
+        now = self._clock()
+        evicted = []
+        with self._lock:
+            dpids = [dpid] if dpid is not None else list(self._pending)
+            for key in dpids:
+                requests = self._pending.get(key, {})
+                for pending in list(requests.values()):
+                    if pending.deadline <= now:
+                        evicted.append(requests.pop(pending.key))
+                if not requests:
+                    self._pending.pop(key, None)
+        self._evicted(evicted, 'timed out')
+        return evicted
+
+    def discard(self, dpid):
+        """Forget the requests of a switch, e.g. when it disconnects."""
+        with self._lock:
+            requests = self._pending.pop(dpid, {})
+        for request in requests.values():
+            if request.on_evict:
+                request.on_evict(request)
+
+    def cancel(self, request):
+        """Stop expecting the replies to a request, without evicting it.
+
+        Return whether it was still pending.
+        """
+        return self._pop(request)
+
+    def _pop(self, request):
+        """Remove a request, return whether it was still pending."""
+        with self._lock:
+            requests = self._pending.get(request.switch.id, {})
+            if requests.get(request.key) is not request:
+                return False
+            del requests[request.key]
+            if not requests:
+                del self._pending[request.switch.id]
+            return True
+
+    def _evicted(self, requests, reason):
+        for request in requests:
+            self.evicted += 1
+            log.warning(f'Switch {request.switch.id}: evicted multipart'
+                        f' request xid {request.xid} type'
+                        f' {request.multipart_type} after {request.replies}'
+                        f' replies, {reason}')
+            if request.on_evict:
+                request.on_evict(request)
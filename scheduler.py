@@ -0,0 +1,171 @@
+"""Scheduler of the periodic stats requests sent to each switch."""
+import asyncio
+import heapq
+import time
+import zlib
+
+from pyof.foundation.exceptions import PackException
+
+from kytos.core import log
+from napps.kytos.of_core import settings
+
+
+class StatsScheduler:
+    """Call an async callback for each scheduled switch once per interval.
+
+    Each switch gets a stable phase within the interval, derived from the
+    crc32 of its dpid, so that the requests to many switches are spread
+    over the interval and a switch keeps its slot across reconnections.
+    Deadlines are kept in a heap served by a single asyncio task, so no
+    thread or task is needed per switch.
+
+    Switches are added and removed from the event loop running :meth:`run`.
+    Errors of packing or sending the requests of a switch are logged and
+    don't stop the other switches' requests.
+    """
+
+    def __init__(self, callback, interval=None, clock=time.monotonic):
+        """Create the scheduler, call :meth:`run` to start it.
+
+        Args:
+            callback (coroutine function): Called with the dpid of a switch
+                at each of its deadlines.
+            interval (float): Seconds between two calls for the same switch,
+                defaults to ``settings.STATS_INTERVAL``.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.interval = interval or settings.STATS_INTERVAL
+        self._callback = callback
+        self._clock = clock
+        self._heap = []
+        self._deadlines = {}
+        self._intervals = {}
+        # Created by run(), within the event loop
+        self._wakeup = None
+
+    def __contains__(self, dpid):
+        return dpid in self._deadlines
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    @property
+    def intervals(self):
+        """Return the current interval of each scheduled switch."""
+        return {dpid: self.interval_of(dpid) for dpid in self._deadlines}
+
+    def interval_of(self, dpid):
+        """Return the interval of a switch."""
+        return self._intervals.get(dpid, self.interval)
+
+    def set_interval(self, dpid, interval):
+        """Change the interval of a switch.
+
+        A shorter interval that brings the next deadline of the switch
+        closer reschedules it right away, otherwise the new interval applies
+        from its next deadline on.
+        """
+        shorter = interval < self.interval_of(dpid)
+        self._intervals[dpid] = interval
+        deadline = self._deadlines.get(dpid)
+        if deadline is None or not shorter:
+            return
+        next_deadline = self.next_deadline(dpid, self._clock())
+        if next_deadline < deadline:
+            self._push(dpid, next_deadline)
+            if self._wakeup:
+                self._wakeup.set()
+
+    def phase(self, dpid):
+        """Return the offset of a switch within its interval."""
+        return zlib.crc32(dpid.encode()) / 2**32 * self.interval_of(dpid)
+
+    def next_deadline(self, dpid, now):
+        """Return the next time after ``now`` in the phase of a switch."""
+        interval = self.interval_of(dpid)
+        return now + ((self.phase(dpid) - now) % interval or interval)
+
+    def add(self, dpid):
+        """Schedule a switch, unless it is already scheduled."""
+        if dpid in self._deadlines:
+            return
+        self._push(dpid, self.next_deadline(dpid, self._clock()))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def remove(self, dpid):
+        """Stop calling the callback for a switch."""
+        # Its heap entry is skipped once it is popped
+        self._deadlines.pop(dpid, None)
+        self._intervals.pop(dpid, None)
+
+    def _push(self, dpid, deadline):
+        self._deadlines[dpid] = deadline
+        heapq.heappush(self._heap, (deadline, dpid))
+
+    async def run(self):
+        """Call the callback of each switch at its deadlines, forever."""
+        self._wakeup = asyncio.Event()
+        while True:
+            while self._heap and self._heap[0][0] <= self._clock():
+                deadline, dpid = heapq.heappop(self._heap)
+                if self._deadlines.get(dpid) != deadline:
+                    continue
+                # Late deadlines skip to the next slot instead of bursting
+                self._push(dpid, self.next_deadline(dpid, self._clock()))
+                try:
+                    await self._callback(dpid)
+                except (PackException, KeyError, ValueError) as exc:
+                    log.exception(f'Switch {dpid}: failed to request stats:'
+                                  f' {exc}')
+
+            self._wakeup.clear()
+            timeout = None
+            if self._heap:
+                timeout = max(self._heap[0][0] - self._clock(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class AdaptiveInterval:
+    """Adapt the stats interval of a switch to its flow stats replies.
+
+    The interval grows for switches whose flow stats replies are large or
+    slow to complete and shrinks for switches whose flows churn a lot,
+    moving halfway towards its target at each reply and always staying
+    within ``floor`` and ``ceiling``.
+    """
+
+    #: Number of flows a reply can have without lengthening the interval
+    large_table = 10000
+    #: Maximum fraction of the interval spent waiting for a reply
+    busy_ratio = 0.1
+    #: How much the interval shrinks with the fraction of churned flows
+    churn_weight = 5
+
+    def __init__(self, base=None, floor=None, ceiling=None):
+        """Use the ``STATS_INTERVAL*`` settings by default."""
+        self.base = base or settings.STATS_INTERVAL
+        self.floor = floor or settings.STATS_INTERVAL_MIN
+        self.ceiling = ceiling or settings.STATS_INTERVAL_MAX
+
+    def target(self, n_flows, duration, churn):
+        """Return the interval fitting a flow stats reply.
+
+        Args:
+            n_flows (int): Number of flows in the reply.
+            duration (float): Seconds from the request to the last reply.
+            churn (int): Number of flows added or removed since the
+                previous reply.
+        """
+        interval = max(self.base, duration / self.busy_ratio,
+                       self.base * n_flows / self.large_table)
+        interval /= 1 + self.churn_weight * churn / max(n_flows, 1)
+        return min(max(interval, self.floor), self.ceiling)
+
+    def update(self, interval, n_flows, duration, churn):
+        """Return the next interval of a switch given its current one."""
+        interval = (interval + self.target(n_flows, duration, churn)) / 2
+        return min(max(interval, self.floor), self.ceiling)
@@ -2,9 +2,54 @@
 #: Pooling frequency
 STATS_INTERVAL = 60
 
-#: Maximum number of cycles to skip the stats request in case of
-#: overlapping/pending stats replies
-STATS_REQ_SKIP = 5
+#: Adapt the pooling interval of each switch to the size, duration and churn
+#: of its flow stats replies, between STATS_INTERVAL_MIN and
+#: STATS_INTERVAL_MAX seconds. Disabled by default, every switch is polled
+#: every STATS_INTERVAL seconds
+STATS_ADAPTIVE_INTERVAL = False
+STATS_INTERVAL_MIN = 15
+STATS_INTERVAL_MAX = 600
+
+#: Filters of the flow stats requests, each a dict with any of the
+#: table_id, cookie, cookie_mask, out_port and out_group fields of a
+#: FlowStatsFilter. A request per filter is sent instead of requesting all
+#: the flows
+STATS_FLOW_FILTERS = []
+#: With filters, request all the flows of a switch once every this many
+#: polls, 0 to only request them at the first poll
+STATS_FLOW_FULL_POLLS = 10
+#: Poll the aggregate stats of all the flows of each switch instead of its
+#: flow stats, except once every this many polls or when the aggregate flow
+#: count changes, 0 to always poll flow stats
+STATS_AGGREGATE_POLLS = 0
+
+#: Only send the stats of the ports whose counters changed since the
+#: previous port stats of their switch, durations aside, except once every
+#: PORT_STATS_FULL_POLLS polls, 0 to only send them all at the first poll
+PORT_STATS_CHANGED_ONLY = False
+PORT_STATS_FULL_POLLS = 10
+
+#: Seconds to wait for all the replies to a multipart request
+MULTIPART_TIMEOUT = 120
+#: Maximum number of entries assembled from the replies to a single
+#: multipart request
+MULTIPART_MAX_ENTRIES = 1000000
+#: Maximum number of multipart requests of the same type waiting for their
+#: replies from a switch, the oldest ones are evicted
+MULTIPART_MAX_PENDING = 3
+
+#: Seconds Main.arequest waits for the reply to a request, by default
+REQUEST_TIMEOUT = 30
+
+#: Fingerprint version of flow ids and match ids: 1 for the md5sum of the
+#: flow JSON, 2 for the blake2b digest of a binary encoding of the flow,
+#: faster to compute again since the encodings of its fields are kept.
+#: Changing it changes the ids of all the flows
+FLOW_ID_VERSION = 1
+
+#: Maximum number of matches, instructions and actions each kept to be
+#: shared by the flows read from flow stats replies
+INTERN_TABLE_SIZE = 65536
 
 #: All OpenFlow Versions
 ALL_OPENFLOW_VERSIONS = [0x01, 0x02, 0x03, 0x04, 0x05, 0x06]
@@ -21,3 +66,15 @@ SEND_ECHO_REQUESTS = True
 
 #: Send Set Config messages right after the OpenFlow handshake
 SEND_SET_CONFIG = True
+
+#: Maximum number of raw data chunks queued per connection. Further chunks
+#: wait in memory for the queued ones to be processed
+INGEST_QUEUE_SIZE = 128
+
+#: Maximum number of (switch, MAC address) pairs kept to avoid sending the
+#: same kytos/of_core.reachable.mac event again for every packet in
+REACHABLE_MAC_CACHE_SIZE = 65536
+
+#: Seconds until a MAC address seen again on the same switch port is
+#: reported again by a kytos/of_core.reachable.mac event
+REACHABLE_MAC_CACHE_TTL = 60
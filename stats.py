@@ -0,0 +1,301 @@
+"""Polling of the flow, aggregate and port stats of each switch."""
+import time
+from collections import defaultdict
+
+from pyof.v0x04.controller2switch.common import MultipartType
+
+from kytos.core import KytosEvent, log
+from napps.kytos.of_core import settings
+from napps.kytos.of_core.flow import FlowTable, flows_delta
+from napps.kytos.of_core.port_stats import PortStatsRates
+from napps.kytos.of_core.reassembly import MultipartGroup
+from napps.kytos.of_core.scheduler import AdaptiveInterval
+from napps.kytos.of_core.utils import aemit_message_out
+from napps.kytos.of_core.v0x04 import utils as of_core_v0x04_utils
+from napps.kytos.of_core.v0x04.flow import FlowStatsCache, FlowStatsFilter
+
+
+class StatsPoller:
+    """Send the stats requests of each poll of a switch and their events.
+
+    A poll requests the flow stats of a switch, or its aggregate stats
+    between flow stats polls, and its port stats. The replies assembled by
+    the multipart reassembler update the flows of the switch, adapt its
+    stats interval in the stats scheduler and are sent as events.
+    """
+
+    def __init__(self, controller, multipart, scheduler):
+        """Create the poller of the switches of a controller.
+
+        Args:
+            controller (:class:`~kytos.core.controller.Controller`): Sends
+                the requests and gets the stats events.
+            multipart (:class:`MultipartReassembler`): Assembles the
+                replies of the requests.
+            scheduler (:class:`StatsScheduler`): Schedules the polls, with
+                the stats interval adapted to each switch.
+        """
+        self.controller = controller
+        self._multipart = multipart
+        self._scheduler = scheduler
+        self._interval = AdaptiveInterval()
+        self._flow_stats_caches = defaultdict(FlowStatsCache)
+        self._flow_tables = {}
+        self._flow_stats_filters = {
+            'settings': tuple(FlowStatsFilter(**fields) for fields
+                              in settings.STATS_FLOW_FILTERS)}
+        self._flow_polls = defaultdict(int)
+        self._flow_bases = {}
+        self._aggregate_polls = {}
+        self._flow_counts = {}
+        self._port_stats_rates = PortStatsRates()
+        self._port_stats_polls = defaultdict(int)
+
+    async def poll(self, switch):
+        """Send the flow and port stats requests to a connected switch.
+
+        Requests are sent even if previous ones are still waiting for their
+        replies, which are evicted if they take too long.
+        """
+        of_version = switch.connection.protocol.version
+        if of_version == 0x04:
+            if self._is_aggregate_poll(switch):
+                await self._arequest_multipart(
+                    switch, MultipartType.OFPMP_AGGREGATE,
+                    self._on_aggregate_stats)
+            else:
+                await self._request_flow_stats(switch)
+            await self._arequest_multipart(
+                switch, MultipartType.OFPMP_PORT_STATS, self._on_port_stats)
+
+    def remove(self, dpid):
+        """Forget the flows and the polls of a switch."""
+        self._flow_stats_caches.pop(dpid, None)
+        self._flow_tables.pop(dpid, None)
+        self._flow_polls.pop(dpid, None)
+        self._flow_bases.pop(dpid, None)
+        self._aggregate_polls.pop(dpid, None)
+        self._flow_counts.pop(dpid, None)
+        self._port_stats_rates.remove(dpid)
+        self._port_stats_polls.pop(dpid, None)
+
+    def flows(self, packet, switch):
+        """Return the flows of a raw flow stats reply of a switch.
+
+        The flows of its previous replies are reused, see
+        :class:`FlowStatsCache`.
+        """
+        return self._flow_stats_caches[switch.id].flows(packet, switch)
+
+    def set_flow_stats_filters(self, owner, filters):
+        """Set the flow stats filters of a NApp consuming flow stats.
+
+        Once any NApp or ``settings.STATS_FLOW_FILTERS`` sets filters, the
+        flows of each switch are polled with a request per filter, and the
+        flows selected are merged into the flows of the switch. Flows left
+        out by all the filters keep their stats from the last poll of all
+        the flows.
+
+        Args:
+            owner (str): Name of the NApp setting the filters.
+            filters (list): :class:`FlowStatsFilter` instances or dicts with
+                their fields, an empty list removes the filters of
+                ``owner``.
+        """
+        filters = tuple(flow_filter if isinstance(flow_filter,
+                                                  FlowStatsFilter)
+                        else FlowStatsFilter(**flow_filter)
+                        for flow_filter in filters)
+        if filters:
+            self._flow_stats_filters[owner] = filters
+        else:
+            self._flow_stats_filters.pop(owner, None)
+
+    def flow_stats_filters(self):
+        """Return the flow stats filters of all NApps, without repeats."""
+        return list(dict.fromkeys(
+            flow_filter for filters in self._flow_stats_filters.values()
+            for flow_filter in filters))
+
+    async def _arequest_multipart(self, switch, multipart_type, callback):
+        """Send a multipart request, its replies go to ``callback``."""
+        request = of_core_v0x04_utils.multipart_stats_request(multipart_type)
+        self._multipart.expect(switch, int(request.header.xid),
+                               multipart_type, callback)
+        await aemit_message_out(self.controller, switch.connection, request)
+
+    def _is_aggregate_poll(self, switch):
+        """Return whether to poll the aggregate stats instead of flows.
+
+        With ``settings.STATS_AGGREGATE_POLLS``, flow stats are polled at
+        the first poll of a switch and once every that many polls.
+        """
+        aggregate_polls = settings.STATS_AGGREGATE_POLLS
+        polls = self._aggregate_polls.get(switch.id)
+        if aggregate_polls and polls is not None and polls < aggregate_polls:
+            self._aggregate_polls[switch.id] = polls + 1
+            return True
+        self._aggregate_polls[switch.id] = 1
+        return False
+
+    async def _request_flow_stats(self, switch):
+        """Send the flow stats requests of a poll of a switch.
+
+        A request is sent per flow stats filter, all of them completing
+        together. The first poll of a switch and every
+        ``settings.STATS_FLOW_FULL_POLLS`` polls request all the flows.
+        """
+        filters = self.flow_stats_filters()
+        poll = self._flow_polls[switch.id]
+        self._flow_polls[switch.id] += 1
+        full_polls = settings.STATS_FLOW_FULL_POLLS
+        if not filters or not poll or (full_polls and
+                                       not poll % full_polls):
+            filters = [FlowStatsFilter()]
+            callback = self._on_flow_stats
+        else:
+            callback = self._on_flow_slice_stats
+        group = MultipartGroup(switch, callback, self._on_flow_stats_evicted)
+        requests = []
+        for flow_filter in filters:
+            request = of_core_v0x04_utils.multipart_stats_request(
+                MultipartType.OFPMP_FLOW, flow_filter.as_of_request())
+            group.add(self._multipart.expect(
+                switch, int(request.header.xid), MultipartType.OFPMP_FLOW,
+                group.complete, on_evict=group.evict,
+                max_pending=settings.MULTIPART_MAX_PENDING * len(filters)))
+            requests.append(request)
+        for request in requests:
+            await aemit_message_out(self.controller, switch.connection,
+                                    request)
+
+    async def _on_flow_stats(self, request):
+        """Update switch flows after all replies are received."""
+        self._flow_bases.pop(request.switch.id, None)
+        self._flow_counts[request.switch.id] = len(request.entries)
+        await self._set_switch_flows(request, request.entries)
+
+    async def _on_flow_slice_stats(self, request):
+        """Merge the flows of filtered flow stats into the switch flows."""
+        flows = self._merge_flow_slice(request.switch, request.entries)
+        await self._set_switch_flows(request, flows, merge=True)
+
+    def _merge_flow_slice(self, switch, flows):
+        """Return the flows of a switch with a new slice of its flows.
+
+        Flows of the last full poll make the base, from which the flows
+        found by filtered polls are moved to the slice, so that they are
+        replaced by each new slice and removed if they are gone. A flow
+        selected by several filters is kept once.
+        """
+        base = self._flow_bases.get(switch.id)
+        if base is None:
+            base = {flow.id: flow for flow in switch.flows}
+            self._flow_bases[switch.id] = base
+        flow_slice = {flow.id: flow for flow in flows}
+        for flow_id in flow_slice:
+            base.pop(flow_id, None)
+        return list(base.values()) + list(flow_slice.values())
+
+    async def _set_switch_flows(self, request, flows, merge=False):
+        """Set the flows of a switch and send the flow stats events.
+
+        The flows replace those of the switch at once, in a new
+        :class:`FlowTable`. The flows of a filtered poll, ``merge``, are
+        added to the cached flows instead of replacing them.
+        """
+        switch = request.switch
+        switch.flows = FlowTable(flows)
+        self._flow_stats_caches[switch.id].commit(merge)
+        duration = time.monotonic() - request.started
+        delta_event = self._update_flow_table(switch, flows, duration)
+        event_raw = KytosEvent(
+            name='kytos/of_core.flow_stats.received',
+            content={'switch': switch, 'replies_flows': flows})
+        await self.controller.buffers.app.aput(event_raw)
+        if delta_event:
+            await self.controller.buffers.app.aput(delta_event)
+
+    def _on_flow_stats_evicted(self, request):
+        """Keep the cached flows of incomplete flow stats replies."""
+        cache = self._flow_stats_caches.get(request.switch.id)
+        if cache:
+            cache.discard()
+
+    def _update_flow_table(self, switch, flows, duration):
+        """Diff the flows of a switch against its previous flow stats.
+
+        Return a ``kytos/of_core.flow_stats.delta`` event with the added,
+        removed and changed flows, or None if nothing changed.
+        """
+        old_table = self._flow_tables.get(switch.id)
+        table, added, removed, changed = flows_delta(old_table or {}, flows)
+        self._flow_tables[switch.id] = table
+        churn = len(added) + len(removed) if old_table is not None else 0
+        self._adapt_stats_interval(switch, len(flows), duration, churn)
+        if not (added or removed or changed):
+            return None
+        return KytosEvent(name='kytos/of_core.flow_stats.delta',
+                          content={'switch': switch, 'added': added,
+                                   'removed': removed, 'changed': changed})
+
+    def _adapt_stats_interval(self, switch, n_flows, duration, churn):
+        """Adapt the stats interval of a switch to its last flow stats."""
+        if not settings.STATS_ADAPTIVE_INTERVAL:
+            return
+        current = self._scheduler.interval_of(switch.id)
+        interval = self._interval.update(current, n_flows, duration, churn)
+        self._scheduler.set_interval(switch.id, interval)
+        log.debug('Switch %s: stats interval %.1fs (%d flows, %.3fs reply,'
+                  ' %d churned)', switch.id, interval, n_flows, duration,
+                  churn)
+
+    async def _on_aggregate_stats(self, request):
+        """Send an event with the aggregate stats of the flows of a switch.
+
+        Flow stats are requested right away if the flow count changed.
+        """
+        switch, stats = request.switch, request.entries[0]
+        flow_count = int(stats.flow_count)
+        event = KytosEvent(name='kytos/of_core.aggregate_stats',
+                           content={'switch': switch,
+                                    'packet_count': int(stats.packet_count),
+                                    'byte_count': int(stats.byte_count),
+                                    'flow_count': flow_count})
+        await self.controller.buffers.app.aput(event)
+        last_count = self._flow_counts.get(switch.id)
+        self._flow_counts[switch.id] = flow_count
+        if last_count is not None and last_count != flow_count:
+            self._aggregate_polls[switch.id] = 1
+            await self._request_flow_stats(switch)
+
+    async def _on_port_stats(self, request):
+        """Send an event with the port stats and rates of all replies.
+
+        With ``settings.PORT_STATS_CHANGED_ONLY``, only the ports whose
+        counters changed are sent, but for the first poll of a switch and
+        once every ``settings.PORT_STATS_FULL_POLLS`` polls.
+        """
+        switch, port_stats = request.switch, request.entries
+        port_rates = self._port_stats_rates.update(switch.id, port_stats)
+        poll = self._port_stats_polls[switch.id]
+        self._port_stats_polls[switch.id] += 1
+        full_polls = settings.PORT_STATS_FULL_POLLS
+        full = bool(not settings.PORT_STATS_CHANGED_ONLY or not poll or
+                    (full_polls and not poll % full_polls))
+        if not full:
+            changed = port_rates['changed']
+            port_rates = {name: column[changed]
+                          for name, column in port_rates.items()}
+            port_nos = set(port_rates['port_no'].tolist())
+            port_stats = [stats for stats in port_stats
+                          if int(stats.port_no) in port_nos]
+        port_stats_event = KytosEvent(
+            name="kytos/of_core.port_stats",
+            content={
+                'switch': switch,
+                'port_stats': port_stats,
+                'port_rates': port_rates,
+                'full': full
+                })
+        await self.controller.buffers.app.aput(port_stats_event)
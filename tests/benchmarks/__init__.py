@@ -0,0 +1,17 @@
+"""Benchmarks of of_core hot paths.
+
+They are skipped unless the ``OF_CORE_BENCHMARKS`` environment variable is
+set, e.g. ``OF_CORE_BENCHMARKS=1 python3 -m pytest tests/benchmarks -s``.
+"""
+import os
+import timeit
+
+import pytest
+
+benchmark = pytest.mark.skipif(not os.environ.get('OF_CORE_BENCHMARKS'),
+                               reason='OF_CORE_BENCHMARKS is not set')
+
+
+def measure(func, repeat=5, number=1):
+    """Return the best time in seconds of a single call to ``func``."""
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
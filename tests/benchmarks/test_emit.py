@@ -0,0 +1,82 @@
+"""Benchmark building and emitting the KytosEvent of a message."""
+from types import SimpleNamespace
+
+import pytest
+from pyof.v0x04.common.header import Type
+from pyof.v0x04.symmetric.echo_request import EchoRequest
+
+from kytos.core import KytosEvent
+from napps.kytos.of_core.msg_prios import OF_MSG_PRIOS
+from napps.kytos.of_core.utils import LazyMessage, _emit_message
+from tests.benchmarks import benchmark, measure
+
+pytestmark = benchmark
+
+
+def legacy_of_msg_prio(msg_type):
+    """of_msg_prio as it was before OF_MSG_PRIOS, building it every call."""
+    prios = dict(OF_MSG_PRIOS.items())
+    return prios.get(msg_type, 0)
+
+
+def legacy_emit_message(controller, connection, message, direction):
+    """_emit_message as it was before OF_EVENTS."""
+    if direction == 'in':
+        address_type = 'source'
+        message_buffer = controller.buffers.msg_in
+    else:
+        address_type = 'destination'
+        message_buffer = controller.buffers.msg_out
+
+    name = message.header.message_type.name.lower()
+    # pylint: disable=consider-using-f-string
+    hex_version = 'v0x%0.2x' % (message.header.version + 0)
+    priority = legacy_of_msg_prio(message.header.message_type.value)
+    of_event = KytosEvent(
+        name=f"kytos/of_core.{hex_version}.messages.{direction}.{name}",
+        priority=priority,
+        content={'message': message,
+                 address_type: connection})
+    message_buffer.put(of_event)
+
+
+def get_controller():
+    """Return a controller whose buffers only collect events."""
+    msg_in, msg_out = [], []
+    buffers = SimpleNamespace(msg_in=SimpleNamespace(put=msg_in.append),
+                              msg_out=SimpleNamespace(put=msg_out.append))
+    return SimpleNamespace(buffers=buffers, msg_in=msg_in, msg_out=msg_out)
+
+
+@pytest.mark.parametrize('direction', ['in', 'out'])
+def test_emit_message_cost(direction):
+    """Compare the cost per message of emitting an echo request."""
+    packet = EchoRequest(xid=1).pack()
+    message = EchoRequest()
+    message.unpack(packet)
+    connection = object()
+    number = 10000
+
+    controller = get_controller()
+    before = measure(lambda: legacy_emit_message(controller, connection,
+                                                 message, direction),
+                     number=number)
+    after = measure(lambda: _emit_message(controller, connection,
+                                          message, direction),
+                    number=number)
+    lazy_message = LazyMessage(packet, None)
+    lazy = measure(lambda: _emit_message(controller, connection,
+                                         lazy_message, direction),
+                   number=number)
+
+    print(f'\nemit {direction} per message: before {before * 1e9:.0f} ns, '
+          f'after {after * 1e9:.0f} ns, lazy {lazy * 1e9:.0f} ns')
+
+    controller = get_controller()
+    legacy_emit_message(controller, connection, message, direction)
+    _emit_message(controller, connection, message, direction)
+    _emit_message(controller, connection, lazy_message, direction)
+    events = getattr(controller, f'msg_{direction}')
+    assert len({event.name for event in events}) == 1
+    assert {event.priority for event in events} == {
+        OF_MSG_PRIOS[Type.OFPT_ECHO_REQUEST.value]}
@@ -0,0 +1,68 @@
+"""Benchmark computing the ids of flows."""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from napps.kytos.of_core.v0x04.flow import Action
+from napps.kytos.of_core.v0x04.flow import Flow as Flow04
+from napps.kytos.of_core.v0x04.flow import InstructionApplyAction
+from napps.kytos.of_core.v0x04.flow import Match as Match04
+from tests.benchmarks import benchmark, measure
+
+pytestmark = benchmark
+
+
+def get_flows(n_flows, frozen):
+    """Return ``n_flows`` flows with a match and two actions each.
+
+    Frozen matches and instructions are like the shared ones of flows from
+    flow stats.
+    """
+    switch = SimpleNamespace(id='00:00:00:00:00:00:00:01')
+    flows = []
+    for i in range(n_flows):
+        actions = [Action.from_dict({'action_type': 'set_vlan',
+                                     'vlan_id': 5}),
+                   Action.from_dict({'action_type': 'output', 'port': 2})]
+        match = Match04(in_port=i % 48 + 1, dl_vlan=i % 4000 + 1)
+        instruction = InstructionApplyAction(actions)
+        if frozen:
+            match.freeze()
+            instruction.freeze()
+        flows.append(Flow04(switch, priority=100, cookie=i, match=match,
+                            instructions=[instruction]))
+    return flows
+
+
+def measure_first(version, frozen, n_flows, repeat=3):
+    """Return the best time in seconds of the first ids of new flows."""
+    times = []
+    for _ in range(repeat):
+        flows = get_flows(n_flows, frozen)
+        start = time.perf_counter()
+        for flow in flows:
+            flow.get_id(version)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+@pytest.mark.parametrize('frozen', (False, True))
+def test_flow_id(frozen, n_flows=100000):
+    """Compare ids/sec of the JSON and md5 ids and of the binary ids.
+
+    Version 2 ids are measured for new flows and once the encodings of
+    their fields are kept.
+    """
+    flows = get_flows(n_flows, frozen)
+    rates = {}
+    for version in (1, 2):
+        elapsed = measure(lambda: [flow.get_id(version) for flow in flows],
+                          repeat=3)
+        rates[version] = n_flows / elapsed
+    first_rate = n_flows / measure_first(2, frozen, n_flows)
+
+    print(f'\nflow ids {n_flows} flows, frozen {frozen}: version 1 '
+          f'{rates[1]:.0f} ids/s, version 2 {first_rate:.0f} ids/s for new '
+          f'flows, {rates[2]:.0f} ids/s again')
+    assert len({flow.get_id(2) for flow in flows}) == n_flows
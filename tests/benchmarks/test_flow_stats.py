@@ -0,0 +1,108 @@
+"""Benchmark building the flows of a flow stats reply."""
+import gc
+import tracemalloc
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from pyof.v0x04.controller2switch.multipart_reply import MultipartReply
+
+from napps.kytos.of_core.v0x04.flow import Flow as Flow04
+from napps.kytos.of_core.v0x04.flow import FlowStatsCache, InternTable
+from tests.benchmarks import benchmark, measure
+from tests.helpers import get_flow_stats_reply
+
+pytestmark = benchmark
+
+
+def get_replies(n_flows, per_reply=500):
+    """Return packed flow stats replies of ``n_flows`` flows in total."""
+    return [get_flow_stats_reply(10, range(first, min(first + per_reply,
+                                                      n_flows + 1)))
+            for first in range(1, n_flows + 1, per_reply)]
+
+
+def rebuild_flows(packets, switch):
+    """Unpack replies and build their flows the way it was done before."""
+    flows = []
+    for packet in packets:
+        reply = MultipartReply()
+        reply.unpack(packet[8:])
+        flows.extend(Flow04.from_of_flow_stats(of_flow_stats, switch)
+                     for of_flow_stats in reply.body)
+    return flows
+
+
+def cached_flows(cache, packets, switch):
+    """Build the flows of replies with a FlowStatsCache."""
+    flows = []
+    for packet in packets:
+        flows.extend(cache.flows(packet, switch))
+    cache.commit()
+    return flows
+
+
+@pytest.mark.parametrize('n_flows', [100, 10000])
+def test_flow_stats_cache(n_flows):
+    """Compare flows/sec of rebuilding and of updating cached flows."""
+    switch = SimpleNamespace(id='00:00:00:00:00:00:00:01')
+    packets = get_replies(n_flows)
+
+    before = measure(lambda: rebuild_flows(packets, switch), repeat=3)
+    cache = FlowStatsCache()
+    cached_flows(cache, packets, switch)
+    after = measure(lambda: cached_flows(cache, packets, switch), repeat=3)
+
+    print(f'\nflow stats {n_flows} flows: before {n_flows / before:.0f} '
+          f'flows/s, after {n_flows / after:.0f} flows/s')
+    assert [flow.as_dict() for flow in rebuild_flows(packets, switch)] == [
+        flow.as_dict() for flow in cached_flows(cache, packets, switch)]
+
+
+def test_flow_stats_interning(n_flows=10000, n_switches=4):
+    """Compare flows/sec and memory of flows built with interned fields."""
+    packets = get_replies(n_flows)
+    switches = [SimpleNamespace(id=f'00:00:00:00:00:00:00:{dpid:02x}')
+                for dpid in range(1, n_switches + 1)]
+
+    before = measure(lambda: rebuild_flows(packets, switches[0]), repeat=3)
+    after = measure(lambda: cached_flows(FlowStatsCache(), packets,
+                                         switches[0]), repeat=3)
+    print(f'\nflow stats {n_flows} new flows: before {n_flows / before:.0f} '
+          f'flows/s, interned {n_flows / after:.0f} flows/s')
+
+    sizes = []
+    for build in (lambda switch: rebuild_flows(packets, switch),
+                  lambda switch: cached_flows(FlowStatsCache(), packets,
+                                              switch)):
+        gc.collect()
+        tracemalloc.start()
+        flows = [build(switch) for switch in switches]
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        del flows
+    print(f'flows of {n_switches} switches: before {sizes[0] / 2**20:.0f} '
+          f'MiB, interned {sizes[1] / 2**20:.0f} MiB')
+    assert sizes[1] < sizes[0]
+
+
+def decoded_flows(packets, switch):
+    """Build the flows of replies with empty intern tables."""
+    with patch.multiple('napps.kytos.of_core.v0x04.flow',
+                        INTERNED_MATCHES=InternTable(),
+                        INTERNED_INSTRUCTIONS=InternTable(),
+                        INTERNED_ACTIONS=InternTable()):
+        return cached_flows(FlowStatsCache(), packets, switch)
+
+
+def test_flow_stats_decoder(n_flows=10000):
+    """Compare flows/sec of pyof and of decoding flows from entry bytes."""
+    switch = SimpleNamespace(id='00:00:00:00:00:00:00:01')
+    packets = get_replies(n_flows)
+
+    before = measure(lambda: rebuild_flows(packets, switch), repeat=3)
+    after = measure(lambda: decoded_flows(packets, switch), repeat=3)
+    print(f'\nflow stats {n_flows} new flows: before {n_flows / before:.0f} '
+          f'flows/s, decoded {n_flows / after:.0f} flows/s')
+    assert [flow.as_dict() for flow in rebuild_flows(packets, switch)] == [
+        flow.as_dict() for flow in decoded_flows(packets, switch)]
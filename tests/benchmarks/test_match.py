@@ -0,0 +1,38 @@
+"""Benchmark the memory used by matches."""
+import gc
+import tracemalloc
+
+from napps.kytos.of_core.v0x04.flow import Match as Match04
+from tests.benchmarks import benchmark
+
+pytestmark = benchmark
+
+
+class DenseMatch:  # pylint: disable=too-few-public-methods
+    """Match storing every field as an attribute, as it used to."""
+
+    def __init__(self, **kwargs):
+        # pylint: disable=protected-access
+        for name in Match04._field_index:
+            setattr(self, name, kwargs.get(name))
+
+
+def allocated(build, n_matches):
+    """Return the bytes allocated by ``n_matches`` matches of ``build``."""
+    gc.collect()
+    tracemalloc.start()
+    matches = [build(in_port=i % 48 + 1, dl_vlan=i % 4000 + 1)
+               for i in range(n_matches)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del matches
+    return size
+
+
+def test_match_memory(n_matches=1000000):
+    """Compare the memory of dense and sparse matches."""
+    dense = allocated(DenseMatch, n_matches)
+    sparse = allocated(Match04, n_matches)
+    print(f'\nmatches {n_matches}: dense {dense / 2**20:.0f} MiB, '
+          f'sparse {sparse / 2**20:.0f} MiB')
+    assert sparse < dense
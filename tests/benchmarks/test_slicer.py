@@ -0,0 +1,67 @@
+"""Benchmark slicing raw chunks into OpenFlow packets."""
+import struct
+
+import pytest
+
+from napps.kytos.of_core import settings
+from napps.kytos.of_core.utils import ReceiveBuffer, of_slicer
+from tests.benchmarks import benchmark, measure
+
+pytestmark = benchmark
+
+
+def legacy_of_slicer(remaining_data):
+    """of_slicer as it was before ReceiveBuffer, copying after each packet."""
+    data_len = len(remaining_data)
+    pkts = []
+    while data_len > 3:
+        length_field = struct.unpack('!H', remaining_data[2:4])[0]
+        ofver = remaining_data[0]
+        if ofver not in settings.ALL_OPENFLOW_VERSIONS or length_field == 0:
+            remaining_data = remaining_data[4:]
+            data_len = len(remaining_data)
+            continue
+        if data_len >= length_field:
+            pkts.append(remaining_data[:length_field])
+            remaining_data = remaining_data[length_field:]
+            data_len = len(remaining_data)
+        else:
+            break
+    return pkts, remaining_data
+
+
+def slice_chunk(rx_buffer, data):
+    """Feed a chunk and slice it the way Main._process_raw_data does."""
+    rx_buffer.feed(data)
+    packets, _ = of_slicer(rx_buffer)
+    return packets
+
+
+@pytest.mark.parametrize('n_msgs', [1, 100, 10000])
+@pytest.mark.parametrize('partial', [False, True])
+def test_of_slicer_throughput(n_msgs, partial):
+    """Compare bytes/sec of slicing a chunk with ``n_msgs`` echo replies.
+
+    A chunk ending on a packet boundary is fed to the same buffer on every
+    call, as a connection's buffer is in Main. With ``partial``, the chunk
+    ends with a partial packet, so each call feeds a new buffer to keep the
+    next call from starting in the middle of a packet.
+    """
+    echo_reply = b'\x04\x03\x00\x10\x00\x00\x00\x01kytosd13'
+    data = echo_reply * n_msgs + (echo_reply[:4] if partial else b'')
+    number = max(1, 1000 // n_msgs)
+
+    before = measure(lambda: legacy_of_slicer(data), number=number)
+    if partial:
+        after = measure(lambda: slice_chunk(ReceiveBuffer(), data),
+                        number=number)
+    else:
+        rx_buffer = ReceiveBuffer()
+        after = measure(lambda: slice_chunk(rx_buffer, data), number=number)
+        assert not rx_buffer.remaining_data
+
+    print(f'\nof_slicer {n_msgs} msgs/chunk, partial={partial}: '
+          f'before {len(data) / before / 1e6:.1f} MB/s, '
+          f'after {len(data) / after / 1e6:.1f} MB/s')
+    packets = slice_chunk(ReceiveBuffer(), data)
+    assert [bytes(pkt) for pkt in packets] == legacy_of_slicer(data)[0]
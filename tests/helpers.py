@@ -2,6 +2,13 @@
 from unittest.mock import MagicMock, Mock
 
 from pyof.utils import unpack
+from pyof.v0x04.common.action import ActionOutput
+from pyof.v0x04.common.flow_instructions import InstructionApplyAction
+from pyof.v0x04.common.flow_match import Match, OxmOfbMatchField, OxmTLV
+from pyof.v0x04.controller2switch.common import MultipartType
+from pyof.v0x04.controller2switch.multipart_reply import (FlowStats,
+                                                          MultipartReply,
+                                                          PortStats)
 
 from kytos.core.connection import Connection, ConnectionState
 from kytos.core.interface import Interface
@@ -42,3 +49,33 @@ def get_kytos_event_mock(**kwargs):
     event.content = {'destination': destination,
                      'message': message}
     return event
+
+
+def get_flow_stats_reply(packet_count, in_ports=(1, 2)):
+    """Return a packed flow stats reply with a flow per in_port."""
+    body = []
+    for in_port in in_ports:
+        match = Match(oxm_match_fields=[OxmTLV(
+            oxm_field=OxmOfbMatchField.OFPXMT_OFB_IN_PORT,
+            oxm_value=in_port.to_bytes(4, 'big'))])
+        instruction = InstructionApplyAction(actions=[ActionOutput(port=3)])
+        entry = FlowStats(length=0, table_id=0, duration_sec=packet_count,
+                          duration_nsec=0, priority=100, idle_timeout=0,
+                          hard_timeout=0, flags=0, cookie=7,
+                          packet_count=packet_count,
+                          byte_count=packet_count * 100, match=match,
+                          instructions=[instruction])
+        entry.length = entry.get_size()
+        body.append(entry)
+    return MultipartReply(xid=1, multipart_type=MultipartType.OFPMP_FLOW,
+                          flags=0, body=body).pack()
+
+
+def get_port_stats(port_no, counter, duration_sec):
+    """Return pyof PortStats with their rx/tx counters set to ``counter``."""
+    counters = {f'{direction}_{name}': counter
+                for direction in ('rx', 'tx')
+                for name in ('packets', 'bytes', 'dropped', 'errors')}
+    return PortStats(port_no=port_no, rx_frame_err=0, rx_over_err=0,
+                     rx_crc_err=0, collisions=0, duration_sec=duration_sec,
+                     duration_nsec=0, **counters)
@@ -3,6 +3,7 @@
 from unittest import TestCase
 from unittest.mock import patch
 
+from pyof.v0x04.controller2switch.common import MultipartType
 from pyof.v0x04.controller2switch.features_reply import \
     FeaturesReply as FReply_v0x04
 from pyof.v0x04.controller2switch.features_request import FeaturesRequest
@@ -27,9 +28,8 @@ class TestAsync:
         # pylint: disable=attribute-defined-outside-init
         self.napp = Main(get_controller_mock())
 
-    @patch("time.sleep")
-    def test_execute(self, mock_sleep):
-        """Test 'execute' main method."""
+    async def test_on_stats_deadline(self):
+        """Test requesting stats of a switch at its scheduler deadline."""
         dpid_01 = "00:00:00:00:00:00:00:01"
         dpid_02 = "00:00:00:00:00:00:00:02"
         sw_04 = get_switch_mock(dpid_02)
@@ -39,16 +39,14 @@ class TestAsync:
                                                         sw_04.connection)
         sw_.is_connected = lambda: True
         # pylint: disable=protected-access
-        self.napp.request_flow_list = self.napp._request_flow_list
-        self.napp.execute()
-        mock_sleep.assert_called()
+        await self.napp._on_stats_deadline(dpid_02)
         expected = [
             'kytos/of_core.v0x04.messages.out.ofpt_echo_request',
             'kytos/of_core.v0x04.messages.out.ofpt_multipart_request',
             'kytos/of_core.v0x04.messages.out.ofpt_multipart_request',
         ]
         for message in expected:
-            of_event = self.napp.controller.buffers.msg_out.get()
+            of_event = await self.napp.controller.buffers.msg_out.aget()
             assert of_event.name == message
 
     async def test_handle_hello_raw_in(self):
@@ -63,6 +61,8 @@ class TestAsync:
                            content={'source': switch.connection,
                                     'new_data': data})
         await self.napp.on_raw_in(event)
+        # pylint: disable=protected-access
+        await self.napp._ingest_workers[switch.connection.id].join()
         expected = [
             'kytos/of_core.v0x04.messages.out.ofpt_hello',
             'kytos/of_core.v0x04.messages.out.ofpt_features_request'
@@ -90,6 +90,8 @@ class TestAsync:
                            content={'source': switch.connection,
                                     'new_data': data})
         await self.napp.on_raw_in(event)
+        # pylint: disable=protected-access
+        await self.napp._ingest_workers[switch.connection.id].join()
         of_event = await self.napp.controller.buffers.msg_in.aget()
         event = 'kytos/of_core.v0x04.messages.in.ofpt_port_status'
         assert of_event.name == event
@@ -117,6 +119,8 @@ class TestAsync:
                            content={'source': switch.connection,
                                     'new_data': data})
         await self.napp.on_raw_in(event)
+        # pylint: disable=protected-access
+        await self.napp._ingest_workers[switch.connection.id].join()
         of_event = await self.napp.controller.buffers.msg_in.aget()
         event = 'kytos/of_core.v0x04.messages.in.ofpt_packet_in'
         assert of_event.name == event
@@ -207,8 +211,11 @@ class TestAsync:
         data += b'\x00\x0c\x02\x1e\xd7\x00\x04\x00\x18\x00\x00\x00\x00\x00\x00'
         data += b'\x00\x10\xff\xff\xff\xfd\xff\xff\x00\x00\x00\x00\x00\x00'
 
+        xid = 0xACC8DF58
         # pylint: disable=protected-access
-        xid = self.napp._multipart_replies_xids[switch.dpid]["flows"]
+        self.napp._multipart.expect(switch.connection.switch, xid,
+                                    MultipartType.OFPMP_FLOW,
+                                    self.napp._stats_poller._on_flow_stats)
         # pylint: enable=protected-access
         multipart_reply = MultipartReply(xid=xid)
         multipart_reply.unpack(data[8:])
@@ -234,7 +241,7 @@ class TestAsync:
         event_switch = stats_desc_event.source.switch
         await self.napp._handle_multipart_reply(reply, event_switch)
         # pylint: disable=protected-access
-        assert xid not in self.napp._multipart_replies_xids
+        assert not self.napp._multipart.pending(target_switch.id)
         assert len(target_switch.flows) > 0
         assert (multipart_desc.body.mfr_desc.value ==
                 target_switch.description["manufacturer"])
@@ -4,6 +4,7 @@ from unittest.mock import MagicMock
 import pytest
 from pyof.foundation.basic_types import UBInt32
 
+from napps.kytos.of_core.flow import ActionBase
 from napps.kytos.of_core.v0x04.flow import Action as Action04
 
 # pylint: disable=protected-access,unnecessary-lambda-assignment
@@ -70,3 +71,28 @@ def test_add_experimenter_classes():
     Action04.add_experimenter_classes(experimenter, func)
     assert Action04._experimenter_classes[experimenter] == func
     assert Action04.get_experimenter_class(experimenter, b'\xff') == resp
+
+
+def test_slotted_actions():
+    """Test actions are slotted and serialized in field order."""
+    action = Action04.from_dict({'action_type': 'set_vlan', 'vlan_id': 5})
+    assert not hasattr(action, '__dict__')
+    assert list(action.as_dict().items()) == [('vlan_id', 5),
+                                              ('action_type', 'set_vlan')]
+
+    class ActionExperimenterMock(ActionBase):
+        """Action of another NApp without fields."""
+
+        def __init__(self, value):
+            self.action_type = 'experimenter_mock'
+            self.value = value
+
+        def as_of_action(self):
+            """Return no pyof action."""
+
+        @classmethod
+        def from_of_action(cls, of_action):
+            """Return no action."""
+
+    assert ActionExperimenterMock(3).as_dict() == {
+        'action_type': 'experimenter_mock', 'value': 3}
@@ -1,12 +1,28 @@
 """Tests for high-level Flow of OpenFlow 1.3."""
+from copy import copy, deepcopy
+from types import SimpleNamespace
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
 import pytest
+from pyof.foundation.basic_types import UBInt64
+from pyof.v0x04.common.action import ActionOutput as OFActionOutput
+from pyof.v0x04.controller2switch.common import MultipartType
+from pyof.v0x04.controller2switch.multipart_reply import \
+    FlowStats as OFFlowStats
+from pyof.v0x04.controller2switch.multipart_reply import MultipartReply
 
 from kytos.lib.helpers import get_connection_mock, get_switch_mock
+from napps.kytos.of_core.flow import FlowTable, flows_delta, pack_values
+from napps.kytos.of_core.v0x04.flow import (Action, ActionOutput,
+                                            InstructionApplyAction)
 from napps.kytos.of_core.v0x04.flow import Flow as Flow04
+from napps.kytos.of_core.v0x04.flow import (FlowStatsCache, FlowStatsFilter,
+                                            InstructionGotoTable, InternTable)
 from napps.kytos.of_core.v0x04.flow import Match as Match04
+from napps.kytos.of_core.v0x04.flow import flow_stats_entries
+from tests.helpers import get_flow_stats_reply
+from tests.unit import test_match
 
 
 @pytest.mark.parametrize(
@@ -38,6 +54,104 @@ def test_equivalent_flow_ids(flow1_dict, flow2_dict):
     flow2 = Flow04.from_dict(flow2_dict, switch)
     assert flow1.as_dict(include_id=False) == flow2.as_dict(include_id=False)
     assert flow1.id == flow2.id
+    assert flow1.get_id(2) == flow2.get_id(2)
+    assert flow1.get_match_id(2) == flow2.get_match_id(2)
+
+
+def test_pack_values():
+    """Test the encoding of version 2 ids is canonical and unambiguous."""
+    assert pack_values({'a': 1, 'b': 'x'}) == pack_values({'b': 'x', 'a': 1})
+    assert pack_values({'a': 1, 'b': 2}) == pack_values({'b': 2, 'a': 1})
+    values = [1, '1', True, None, -1, 1 << 64, 1.5, [1], (1,), {'a': 1},
+              {'a': '1'}, {'a': -1}, {'a': [1]}, ['a', 'b'], ['ab'],
+              {'a': 1, 'b': 2}, {'a\0b': 2}]
+    encodings = [pack_values(value) for value in values]
+    assert len(set(encodings)) == len(values) - 1
+    assert pack_values([1]) == pack_values((1,))
+
+
+def test_packed_fields():
+    """Test encodings of fields are kept until they are changed."""
+    match = Match04(in_port=1)
+    packed = match.packed()
+    assert match.packed() is packed
+    match.dl_vlan = 2
+    assert match.packed() == pack_values({'in_port': 1, 'dl_vlan': 2})
+    assert copy(match).packed() == match.packed()
+
+    action = ActionOutput(1)
+    instruction = InstructionApplyAction([action])
+    packed = instruction.packed()
+    action.port = 2
+    assert instruction.packed() != packed
+    packed = instruction.packed()
+    instruction.actions.append(ActionOutput(3))
+    assert instruction.packed() != packed
+
+    instruction.freeze()
+    assert instruction.packed() is instruction.packed()
+    assert copy(instruction).packed() == instruction.packed()
+
+
+def test_flows_delta():
+    """Test the delta of a flow table is computed from flow ids."""
+    flows = [MagicMock(id=str(i)) for i in range(3)]
+    for flow in flows:
+        flow.stats.packet_count = flow.stats.byte_count = 0
+    table, added, removed, changed = flows_delta({}, flows[:2])
+    assert (added, removed, changed) == (flows[:2], [], [])
+    assert table == {'0': (flows[0], 0, 0), '1': (flows[1], 0, 0)}
+
+    flows[1].stats.byte_count = 64
+    table, added, removed, changed = flows_delta(table, flows[1:])
+    assert (added, removed, changed) == ([flows[2]], [flows[0]], [flows[1]])
+    assert table['1'] == (flows[1], 0, 64)
+
+
+def test_flow_table():
+    """Test the indexes of a flow table follow its flows."""
+    flows = [MagicMock(id=str(i), match_id=str(i % 2), cookie=i % 3,
+                       table_id=i % 2, priority=i) for i in range(6)]
+    table = FlowTable(flows)
+    assert table == flows
+    assert table.get('4') is flows[4]
+    assert table.get('6') is None
+    assert table.by_match_id('1') == flows[1::2]
+    assert table.by_cookie(2) == [flows[2], flows[5]]
+    assert table.by_table(0) == [flows[4], flows[2], flows[0]]
+    assert table.by_table(2) == []
+
+    flow = MagicMock(id='6', match_id='2', cookie=2, table_id=0, priority=3)
+    table.append(flow)
+    assert table.get('6') is flow
+    assert table.by_table(0) == [flows[4], flow, flows[2], flows[0]]
+    del table[:]
+    assert table.get('6') is None
+
+
+def test_slotted_flow():
+    """Test flows and their stats are slotted with the same dicts."""
+    switch = MagicMock(id="00:00:00:00:00:00:00:01")
+    flow = Flow04.from_dict({"match": {"in_port": 1}, "priority": 10,
+                             "stats": {"packet_count": 2, "byte_count": 3},
+                             "_id": "ignored",
+                             "instructions": [{"instruction_type": "meter",
+                                               "meter_id": 4}]}, switch)
+    assert not hasattr(flow, '__dict__')
+    assert not hasattr(flow.stats, '__dict__')
+    assert list(flow.as_dict()) == [
+        'switch', 'table_id', 'match', 'priority', 'idle_timeout',
+        'hard_timeout', 'cookie', 'id', 'stats', 'cookie_mask',
+        'instructions']
+    assert list(flow.as_dict()['stats'].items()) == [('byte_count', 3),
+                                                     ('packet_count', 2)]
+    assert flow.as_dict()['instructions'] == [{'instruction_type': 'meter',
+                                               'meter_id': 4}]
+
+    of_stats = SimpleNamespace(byte_count=UBInt64(30),
+                               packet_count=UBInt64(20), cookie=UBInt64(1))
+    flow.stats.update(of_stats)
+    assert flow.stats.as_dict() == {'byte_count': 30, 'packet_count': 20}
 
 
 class TestFlowFactory(TestCase):
@@ -217,6 +331,98 @@ class TestFlow(TestCase):
             mock_switch, **flow_two
         ).match_id
 
+    @staticmethod
+    def test_memoized_ids():
+        """Test ids are memoized until a hashed attribute changes."""
+        dpid = "00:00:00:00:00:00:00:01"
+        mock_switch = get_switch_mock(dpid, 0x04)
+        mock_switch.id = dpid
+        flow = Flow04(mock_switch, match=Match04(in_port=1).freeze(),
+                      priority=10)
+        flow_id, match_id = flow.id, flow.match_id
+
+        with patch.object(Flow04, 'as_json') as mock_as_json:
+            flow.stats.packet_count = 5
+            flow.stats = MagicMock()
+            assert (flow.id, flow.match_id) == (flow_id, match_id)
+            mock_as_json.assert_not_called()
+
+        for name, value in (('priority', 20), ('cookie', 0x10),
+                            ('table_id', 1),
+                            ('match', Match04(in_port=2).freeze())):
+            setattr(flow, name, value)
+            assert flow.match_id != match_id
+            assert flow.id != flow_id
+            flow_id, match_id = flow.id, flow.match_id
+
+        for name, value in (('instructions',
+                             [InstructionGotoTable(2).freeze()]),
+                            ('hard_timeout', 30), ('cookie_mask', 0xff)):
+            setattr(flow, name, value)
+            assert flow.id != flow_id
+            assert flow.match_id == match_id
+            flow_id = flow.id
+
+    @staticmethod
+    def test_ids_of_changed_fields():
+        """Test ids follow matches and instructions changed in place."""
+        dpid = "00:00:00:00:00:00:00:01"
+        mock_switch = get_switch_mock(dpid, 0x04)
+        mock_switch.id = dpid
+        action = ActionOutput(10)
+        instruction = InstructionApplyAction([action])
+        flow = Flow04(mock_switch, match=Match04(in_port=1), priority=10,
+                      instructions=[instruction])
+        flow_id, match_id = flow.id, flow.match_id
+
+        flow.match.in_port = 2
+        assert flow.match_id != match_id
+        assert flow.id != flow_id
+        flow_id = flow.id
+
+        action.port = 20
+        assert flow.id != flow_id
+        flow_id = flow.id
+
+        flow.match.freeze()
+        instruction.freeze()
+        assert instruction.actions == (action,)
+        assert action.frozen
+        assert flow.id == flow_id
+        flow.instructions.append(InstructionGotoTable(2).freeze())
+        assert flow.id != flow_id
+
+    @staticmethod
+    def test_id_versions():
+        """Test flow ids of each fingerprint version."""
+        dpid = "00:00:00:00:00:00:00:01"
+        mock_switch = get_switch_mock(dpid, 0x04)
+        mock_switch.id = dpid
+        flow = Flow04(mock_switch, match=Match04(in_port=1), priority=10,
+                      instructions=[InstructionGotoTable(1)])
+        ids = {version: (flow.get_id(version), flow.get_match_id(version))
+               for version in (1, 2)}
+        assert ids[1] != ids[2]
+        assert all(len(flow_id) == 32 for pair in ids.values()
+                   for flow_id in pair)
+        assert (flow.id, flow.match_id) == ids[1]
+
+        with patch('napps.kytos.of_core.flow.settings.FLOW_ID_VERSION', 2):
+            flow.priority = 10
+            assert (flow.id, flow.match_id) == ids[2]
+            for name, value in (('hard_timeout', 5), ('cookie_mask', 1),
+                                ('instructions', [InstructionGotoTable(2)])):
+                setattr(flow, name, value)
+                assert flow.id != ids[2][0]
+                assert flow.match_id == ids[2][1]
+            flow.match = Match04(in_port=2)
+            assert flow.match_id != ids[2][1]
+
+        with pytest.raises(ValueError):
+            flow.get_id(3)
+        with pytest.raises(ValueError):
+            flow.get_match_id(3)
+
 
 class TestFlowBase(TestCase):
     """Test FlowBase Class."""
@@ -245,6 +451,32 @@ class TestFlowBase(TestCase):
             flow_2 = Flow04.from_dict(flow_dict, mock_switch)
             self.assertEqual(flow_1 == flow_2, True)
 
+    def test__hash__(self):
+        """Test equal flows are hashed alike, whatever their stats."""
+        mock_switch = get_switch_mock("00:00:00:00:00:00:00:01")
+        mock_switch.id = "00:00:00:00:00:00:00:01"
+        flow_dict = {'match': {'in_port': 1}, 'priority': 2,
+                     'actions': [{'action_type': 'output', 'port': 2}]}
+        flow_1 = Flow04.from_dict(flow_dict, mock_switch)
+        flow_2 = Flow04.from_dict(flow_dict, mock_switch)
+        flow_2.stats.packet_count = 10
+        flow_3 = Flow04.from_dict({**flow_dict, 'priority': 3}, mock_switch)
+
+        self.assertEqual(hash(flow_1), hash(flow_2))
+        self.assertEqual({flow_1, flow_2, flow_3}, {flow_1, flow_3})
+        self.assertIn(flow_2, {flow_1: 'flow'})
+        self.assertNotIn(flow_3, {flow_1})
+
+        # Ids of flows with frozen fields are memoized
+        for flow in (flow_1, flow_2):
+            flow.match.freeze()
+            for instruction in flow.instructions:
+                instruction.freeze()
+            self.assertEqual(flow.id, flow_1.id)
+        with patch.object(Flow04, 'as_dict') as mock_as_dict:
+            self.assertEqual(flow_1, flow_2)
+            mock_as_dict.assert_not_called()
+
     def test__eq__success_with_different_flows(self):
         """Test success case to __eq__ override with different flows."""
         mock_switch = get_switch_mock("00:00:00:00:00:00:00:01")
@@ -308,3 +540,237 @@ class TestFlowBase(TestCase):
             flow_2 = "any_string_object"
             with self.assertRaises(ValueError):
                 return flow_1 == flow_2
+
+
+class TestFlowStatsCache(TestCase):
+    """Test FlowStatsCache."""
+
+    def setUp(self):
+        """Create an empty cache and a switch."""
+        self.cache = FlowStatsCache()
+        self.switch = get_switch_mock("00:00:00:00:00:00:00:01", 0x04)
+
+    def test_flow_stats_entries(self):
+        """Test raw entries are sliced from a flow stats reply."""
+        packet = get_flow_stats_reply(10)
+        entries = list(flow_stats_entries(packet))
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(sum(len(entry) for entry in entries),
+                         len(packet) - 16)
+        self.assertEqual(len(list(flow_stats_entries(packet[:-1]))), 1)
+
+    def test_flows(self):
+        """Test unchanged flows are reused with their counters updated."""
+        flows = self.cache.flows(get_flow_stats_reply(10), self.switch)
+        self.cache.commit()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.assertEqual([flow.match.in_port for flow in flows], [1, 2])
+        self.assertEqual(flows[0].stats.packet_count, 10)
+
+        new_flows = self.cache.flows(get_flow_stats_reply(20, (1, 4)),
+                                     self.switch)
+        self.cache.commit()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+        self.assertIs(new_flows[0], flows[0])
+        self.assertEqual(new_flows[0].stats.packet_count, 20)
+        self.assertEqual(new_flows[0].stats.byte_count, 2000)
+        self.assertEqual(new_flows[0].stats.duration_sec, 20)
+        self.assertEqual(new_flows[1].match.in_port, 4)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_commit_merge(self):
+        """Test the flows of a slice are merged into the cached flows."""
+        flows = self.cache.flows(get_flow_stats_reply(10, (1, 2, 3)),
+                                 self.switch)
+        self.cache.commit()
+        slice_flows = self.cache.flows(get_flow_stats_reply(20, (2, 4)),
+                                       self.switch)
+        self.cache.commit(merge=True)
+        self.assertEqual(len(self.cache), 4)
+        self.assertIs(slice_flows[0], flows[1])
+
+        new_flows = self.cache.flows(get_flow_stats_reply(30, (1, 2, 3, 4)),
+                                     self.switch)
+        self.cache.commit()
+        self.assertEqual((self.cache.hits, self.cache.misses), (5, 4))
+        self.assertEqual(new_flows[:3], flows)
+        self.assertIs(new_flows[3], slice_flows[1])
+
+    def test_discard(self):
+        """Test the flows of an incomplete reply are kept cached."""
+        self.cache.flows(get_flow_stats_reply(10), self.switch)
+        self.cache.commit()
+        self.cache.flows(get_flow_stats_reply(20, (1,)), self.switch)
+        self.cache.discard()
+        self.assertEqual(len(self.cache), 2)
+
+    def test_interned(self):
+        """Test flows of all switches share matches and instructions."""
+        tables = [InternTable() for _ in range(3)]
+        with patch.multiple('napps.kytos.of_core.v0x04.flow',
+                            INTERNED_MATCHES=tables[0],
+                            INTERNED_INSTRUCTIONS=tables[1],
+                            INTERNED_ACTIONS=tables[2]):
+            packet = get_flow_stats_reply(10, (1, 2, 1))
+            flows = self.cache.flows(packet, self.switch)
+            other_switch = get_switch_mock("00:00:00:00:00:00:00:02", 0x04)
+            other_flows = FlowStatsCache().flows(packet, other_switch)
+
+        reply = MultipartReply()
+        reply.unpack(packet[8:])
+        self.assertEqual([flow.as_dict() for flow in flows],
+                         [Flow04.from_of_flow_stats(of_flow_stats,
+                                                    self.switch).as_dict()
+                          for of_flow_stats in reply.body])
+        self.assertIs(flows[2].match, flows[0].match)
+        self.assertIs(other_flows[1].match, flows[1].match)
+        self.assertIs(other_flows[1].instructions[0], flows[0].instructions[0])
+        self.assertIsNot(other_flows[1].instructions, flows[0].instructions)
+        self.assertIsInstance(flows[0].instructions[0].actions, tuple)
+        self.assertEqual([len(table) for table in tables], [2, 1, 1])
+        self.assertEqual(tables[0].metrics, {'size': 2, 'hits': 4,
+                                             'misses': 2, 'evictions': 0,
+                                             'hit_rate': 4 / 6})
+
+    def test_decoder(self):
+        """Test flows decoded from the entry bytes match the pyof ones."""
+        actions = [{"action_type": "output", "port": 3},
+                   {"action_type": "set_queue", "queue_id": 2},
+                   {"action_type": "pop_vlan"},
+                   {"action_type": "push_vlan", "tag_type": "s"},
+                   {"action_type": "push_vlan", "tag_type": "c"},
+                   {"action_type": "set_vlan", "vlan_id": 100}]
+        instructions = [{"instruction_type": "apply_actions",
+                         "actions": actions},
+                        {"instruction_type": "write_actions",
+                         "actions": actions[:2]},
+                        {"instruction_type": "clear_actions", "actions": []},
+                        {"instruction_type": "write_metadata",
+                         "metadata": 0xab, "metadata_mask": 0xff},
+                        {"instruction_type": "meter", "meter_id": 4},
+                        {"instruction_type": "goto_table", "table_id": 2}]
+        flows = [Flow04.from_dict({"match": match, "table_id": 1,
+                                   "priority": 10, "idle_timeout": 20,
+                                   "hard_timeout": 30, "cookie": 40,
+                                   "instructions": instructions},
+                                  self.switch)
+                 for match in ({}, {"in_port": 1, "dl_vlan": 105},
+                               test_match.TestMatch.EXPECTED_OF_13)]
+        body = []
+        for flow in flows:
+            flow_mod = flow.as_of_add_flow_mod()
+            entry = OFFlowStats(length=0, table_id=flow.table_id,
+                                duration_sec=5, duration_nsec=6,
+                                priority=flow.priority,
+                                idle_timeout=flow.idle_timeout,
+                                hard_timeout=flow.hard_timeout, flags=0,
+                                cookie=flow.cookie, packet_count=7,
+                                byte_count=8, match=flow_mod.match,
+                                instructions=flow_mod.instructions)
+            entry.length = entry.get_size()
+            body.append(entry)
+        packet = MultipartReply(xid=1,
+                                multipart_type=MultipartType.OFPMP_FLOW,
+                                flags=0, body=body).pack()
+
+        class CustomOutput(ActionOutput):
+            """An action class set by another NApp."""
+
+            __slots__ = ()
+
+        def build_flows():
+            """Build the flows of the packet with empty intern tables."""
+            with patch.multiple('napps.kytos.of_core.v0x04.flow',
+                                INTERNED_MATCHES=InternTable(),
+                                INTERNED_INSTRUCTIONS=InternTable(),
+                                INTERNED_ACTIONS=InternTable()), \
+                    patch('napps.kytos.of_core.v0x04.flow.OFFlowStats',
+                          side_effect=OFFlowStats) as of_flow_stats:
+                return (FlowStatsCache().flows(packet, self.switch),
+                        of_flow_stats.call_count)
+
+        decoded, unpacked = build_flows()
+        self.assertEqual(unpacked, 0)
+        with patch.dict(Action._action_class, {OFActionOutput: CustomOutput}):
+            fallback, unpacked = build_flows()
+        self.assertEqual(unpacked, 1)
+
+        reply = MultipartReply()
+        reply.unpack(packet[8:])
+        expected = [Flow04.from_of_flow_stats(of_flow_stats,
+                                              self.switch).as_dict()
+                    for of_flow_stats in reply.body]
+        self.assertEqual([flow.as_dict() for flow in decoded], expected)
+        self.assertEqual([flow.match.as_dict() for flow in decoded],
+                         [flow.match.as_dict() for flow in flows])
+        self.assertEqual([flow.as_dict() for flow in fallback], expected)
+        self.assertIsInstance(fallback[0].instructions[0].actions[0],
+                              CustomOutput)
+
+    def test_intern_table(self):
+        """Test the least recently used objects are evicted."""
+        table = InternTable(capacity=2)
+        matches = [Match04(in_port=port) for port in range(3)]
+        table.add(b'a', matches[0])
+        table.add(b'b', matches[1])
+        self.assertIs(table.get(b'a'), matches[0])
+        table.add(b'c', matches[2])
+        self.assertIsNone(table.get(b'b'))
+        self.assertEqual(table.metrics, {'size': 2, 'hits': 1, 'misses': 1,
+                                         'evictions': 1, 'hit_rate': 0.5})
+        self.assertTrue(all(match.frozen for match in matches))
+
+    def test_frozen(self):
+        """Test changing a shared field of a flow leaves other flows as is."""
+        with patch.multiple('napps.kytos.of_core.v0x04.flow',
+                            INTERNED_MATCHES=InternTable(),
+                            INTERNED_INSTRUCTIONS=InternTable(),
+                            INTERNED_ACTIONS=InternTable()):
+            packet = get_flow_stats_reply(10, (1,))
+            flow = self.cache.flows(packet, self.switch)[0]
+            other_switch = get_switch_mock("00:00:00:00:00:00:00:02", 0x04)
+            other = FlowStatsCache().flows(packet, other_switch)[0]
+        self.assertIs(flow.match, other.match)
+        other_id = other.id
+        instruction = flow.instructions[0]
+
+        with self.assertRaises(AttributeError):
+            flow.match.in_port = 5
+        with self.assertRaises(AttributeError):
+            instruction.actions.append(instruction.actions[0])
+        with self.assertRaises(AttributeError):
+            instruction.actions[0].port = 5
+
+        match = copy(flow.match)
+        match.in_port = 5
+        flow.match = match
+        actions = deepcopy(instruction.actions)
+        actions[0].port = 5
+        flow.instructions[0] = InstructionApplyAction(list(actions))
+        self.assertEqual(flow.match.in_port, 5)
+        self.assertEqual(other.match.in_port, 1)
+        self.assertEqual(other.instructions[0].actions[0].port, 3)
+        self.assertEqual(other.id, other_id)
+        self.assertFalse(flow.instructions[0].frozen)
+
+
+class TestFlowStatsFilter(TestCase):
+    """Test FlowStatsFilter."""
+
+    def test_as_of_request(self):
+        """Test the request body selects the flows of the filter."""
+        request = FlowStatsFilter().as_of_request()
+        self.assertEqual((request.table_id, request.out_port,
+                          request.out_group, request.cookie,
+                          request.cookie_mask),
+                         (0xff, 0xffffffff, 0xffffffff, 0, 0))
+
+        flow_filter = FlowStatsFilter(table_id=2, cookie=0xab00,
+                                      cookie_mask=0xff00, out_port=3)
+        request = flow_filter.as_of_request()
+        self.assertEqual((request.table_id, request.out_port,
+                          request.out_group, request.cookie,
+                          request.cookie_mask),
+                         (2, 3, 0xffffffff, 0xab00, 0xff00))
+        self.assertEqual(len(request.pack()), 40)
+        self.assertEqual(flow_filter, FlowStatsFilter(**flow_filter._asdict()))
@@ -1,16 +1,26 @@
 """Test Main methods."""
+import asyncio
 from unittest import TestCase
-from unittest.mock import MagicMock, PropertyMock, create_autospec, patch
+from unittest.mock import AsyncMock, MagicMock, PropertyMock, patch
 
 import pytest
-from pyof.foundation.network_types import Ethernet
+from pyof.foundation.exceptions import UnpackException
+from pyof.utils import unpack
+from pyof.v0x04.common.header import Type
 from pyof.v0x04.common.port import PortState
+from pyof.v0x04.controller2switch.barrier_request import BarrierRequest
 from pyof.v0x04.controller2switch.common import MultipartType
+from pyof.v0x04.controller2switch.flow_mod import FlowMod
 
 from kytos.core.connection import ConnectionState
 from kytos.lib.helpers import (get_connection_mock, get_controller_mock,
                                get_kytos_event_mock, get_switch_mock)
-from napps.kytos.of_core.utils import NegotiationException
+from napps.kytos.of_core.transactions import (ErrorReplyException,
+                                              TransactionAborted)
+from napps.kytos.of_core.utils import LazyMessage, NegotiationException
+from napps.kytos.of_core.v0x04.flow import FlowStatsFilter
+from napps.kytos.of_core.v0x04.utils import multipart_stats_request
+from tests.helpers import get_flow_stats_reply
 
 # pylint: disable=protected-access, invalid-name
 
@@ -18,55 +28,352 @@ from napps.kytos.of_core.utils import NegotiationException
 class TestNApp:
     """Test NApp Main class, pytest test suite. """
 
+    @patch('napps.kytos.of_core.main.Main._process_raw_data')
+    async def test_on_raw_in(self, mock_process_raw_data, napp):
+        """Test on_raw_in queues data to the connection's ingest worker."""
+        mock_connection = MagicMock()
+        name = 'kytos/core.openflow.raw.in'
+        content = {'source': mock_connection, 'new_data': b'\x04'}
+        mock_event = get_kytos_event_mock(name=name, content=content)
+
+        await napp.on_raw_in(mock_event)
+        await napp.on_raw_in(mock_event)
+        worker = napp._ingest_workers[mock_connection.id]
+        await worker.join()
+        assert len(napp._ingest_workers) == 1
+        assert mock_process_raw_data.call_count == 2
+        mock_process_raw_data.assert_called_with(mock_connection,
+                                                 worker.rx_buffer)
+        assert worker.rx_buffer.remaining_data == b'\x04\x04'
+        metrics = napp.ingest_metrics()[mock_connection.id]
+        assert metrics['processed_chunks'] == 2
+        assert metrics['queue_size'] == 0
+
+        # Raw data of a lost connection doesn't start a new worker
+        napp._ingest_workers.pop(mock_connection.id).stop()
+        mock_connection.is_alive.return_value = False
+        await napp.on_raw_in(mock_event)
+        assert not napp._ingest_workers
+        napp.shutdown()
+
     @patch('napps.kytos.of_core.main.Main.process_multipart_messages')
     @patch('napps.kytos.of_core.main.of_slicer')
     @patch('napps.kytos.of_core.main.Main._negotiate')
-    @patch('napps.kytos.of_core.main.Main.aemit_message_in')
-    async def test_on_raw_in(
+    @patch('napps.kytos.of_core.main.Main.aemit_messages_in')
+    async def test_process_raw_data(
         self,
-        mock_aemit_message_in,
+        mock_aemit_messages_in,
         mock_negotiate,
         mock_of_slicer,
         mock_process_multipart_messages,
         napp,
     ):
-        """Test on_raw_in."""
-
-        mock_packets = MagicMock()
-        mock_data = MagicMock()
+        """Test _process_raw_data."""
+        hello = (b'\x04\x00\x00\x10\x00\x00\x00\x01'
+                 b'\x00\x01\x00\x08\x00\x00\x00\x10')
+        port_status = b'\x04\x0c\x00\x08\x00\x00\x00\x02'
+        rx_buffer = MagicMock()
         mock_connection = MagicMock()
-        mock_connection.is_new.side_effect = [True, False, True, False]
+        mock_connection.is_new.side_effect = [True, False]
         mock_connection.is_during_setup.return_value = False
-        mock_of_slicer.return_value = [[mock_packets, mock_packets], b'']
-        name = 'kytos/core.openflow.raw.in'
-        content = {'source': mock_connection, 'new_data': mock_data}
-        mock_event = get_kytos_event_mock(name=name, content=content)
+        mock_of_slicer.return_value = [[hello, port_status], b'']
 
-        await napp.on_raw_in(mock_event)
-        mock_negotiate.assert_called()
-        mock_aemit_message_in.assert_called()
+        await napp._process_raw_data(mock_connection, rx_buffer)
+        hello_message = mock_negotiate.call_args[0][1]
+        assert hello_message.versions == [4]
+        mock_connection.set_setup_state.assert_called_once()
+        mock_connection.protocol.unpack.assert_called_once_with(port_status)
+        mock_aemit_messages_in.assert_called_once_with(
+            mock_connection, [mock_connection.protocol.unpack.return_value])
 
         # Test Fail
+        mock_aemit_messages_in.reset_mock()
         mock_negotiate.side_effect = NegotiationException('Foo')
-        await napp.on_raw_in(mock_event)
+        mock_connection.is_new.side_effect = [True]
+        await napp._process_raw_data(mock_connection, rx_buffer)
         assert mock_connection.close.call_count == 1
+        mock_aemit_messages_in.assert_called_once_with(mock_connection, [])
 
         mock_connection.close.call_count = 0
+        mock_connection.is_new.side_effect = None
+        mock_connection.is_new.return_value = False
         mock_connection.protocol.unpack.side_effect = AttributeError()
-        await napp.on_raw_in(mock_event)
+        await napp._process_raw_data(mock_connection, rx_buffer)
         assert mock_connection.close.call_count == 1
+        # The hello before the port status has no listener, so it's lazy
+        emitted = mock_aemit_messages_in.call_args[0][1]
+        assert [message.message_type for message in emitted] == \
+            [Type.OFPT_HELLO]
 
-        # test message type OFPT_MULTIPART_REPLY
-        mock_message = MagicMock()
-        mock_message.header.xid = 0xABC
-        mock_message.header.message_type.name = 'ofpt_multipart_reply'
-        mock_connection.protocol.unpack.side_effect = [mock_message]*2
-        mock_connection.is_new.side_effect = [False, False]
-        mock_process_multipart_messages.call_count = 0
-        messages = {0xABC: [mock_message]*2}
-        await napp.on_raw_in(mock_event)
-        mock_process_multipart_messages.assert_called_with(mock_connection,
-                                                           messages)
+    @patch('napps.kytos.of_core.main.Main.process_multipart_messages')
+    @patch('napps.kytos.of_core.main.of_slicer')
+    @patch('napps.kytos.of_core.main.Main.aemit_messages_in')
+    async def test_process_raw_data_closed(
+        self,
+        mock_aemit_messages_in,
+        mock_of_slicer,
+        mock_process_multipart_messages,
+        napp,
+    ):
+        """Test messages before a frame that closes the connection."""
+        port_status = b'\x04\x0c\x00\x08\x00\x00\x00\x02'
+        rx_buffer = MagicMock()
+        mock_connection = MagicMock()
+        mock_connection.is_new.return_value = False
+        mock_connection.is_during_setup.return_value = False
+        message = MagicMock()
+        mock_connection.protocol.unpack.side_effect = [message,
+                                                       UnpackException()]
+        mock_of_slicer.return_value = [[port_status, port_status,
+                                        port_status], b'']
+
+        await napp._process_raw_data(mock_connection, rx_buffer)
+        mock_connection.close.assert_called_once()
+        mock_aemit_messages_in.assert_called_once_with(mock_connection,
+                                                       [message])
+        mock_process_multipart_messages.assert_not_called()
+        rx_buffer.unread.assert_not_called()
+
+    @patch('napps.kytos.of_core.main.Main.process_multipart_messages')
+    @patch('napps.kytos.of_core.main.of_slicer')
+    @patch('napps.kytos.of_core.main.Main.aemit_messages_in')
+    async def test_process_raw_data_batch(
+        self,
+        mock_aemit_messages_in,
+        mock_of_slicer,
+        mock_process_multipart_messages,
+        napp,
+    ):
+        """Test the messages of an established connection are batched."""
+        port_status = b'\x04\x0c\x00\x08\x00\x00\x00\x02'
+        multipart_reply = (b'\x04\x13\x00\x10\x00\x00\x0a\xbc'
+                           b'\x00\x0d\x00\x00\x00\x00\x00\x00')
+        rx_buffer = MagicMock()
+        mock_connection = MagicMock()
+        mock_connection.is_new.return_value = False
+        mock_connection.is_during_setup.return_value = False
+        messages = [MagicMock() for _ in range(4)]
+        mock_connection.protocol.unpack.side_effect = messages
+        mock_of_slicer.return_value = [[port_status, multipart_reply,
+                                        port_status, multipart_reply], b'']
+
+        await napp._process_raw_data(mock_connection, rx_buffer)
+        mock_aemit_messages_in.assert_called_once_with(
+            mock_connection, [messages[0], messages[2]])
+        mock_process_multipart_messages.assert_called_once_with(
+            mock_connection, {0xABC: [messages[1], messages[3]]})
+        rx_buffer.unread.assert_called_once_with([])
+
+    def test_set_flow_stats_filters(self, napp):
+        """Test the flow stats filters of all NApps."""
+        assert not napp.flow_stats_filters()
+        napp.set_flow_stats_filters('a', [FlowStatsFilter(table_id=1),
+                                          {'cookie': 1, 'cookie_mask': 1}])
+        napp.set_flow_stats_filters('b', [{'table_id': 1}])
+        assert napp.flow_stats_filters() == [
+            FlowStatsFilter(table_id=1),
+            FlowStatsFilter(cookie=1, cookie_mask=1)]
+        napp.set_flow_stats_filters('a', [])
+        assert napp.flow_stats_filters() == [FlowStatsFilter(table_id=1)]
+
+    @patch('napps.kytos.of_core.main.aemit_message_out')
+    async def test_arequest_stats(self, mock_aemit_message_out, napp,
+                                  switch_one):
+        """Test arequest_stats."""
+        xid = await napp.arequest_stats(switch_one, MultipartType.OFPMP_GROUP)
+        request = mock_aemit_message_out.call_args[0][2]
+        assert xid == int(request.header.xid)
+        assert request.multipart_type == MultipartType.OFPMP_GROUP
+        pending = napp._multipart.get(switch_one.id, xid,
+                                      MultipartType.OFPMP_GROUP)
+        assert pending.callback == napp._on_stats
+
+        with pytest.raises(ValueError):
+            await napp.arequest_stats(switch_one, MultipartType.OFPMP_FLOW)
+
+    @patch('napps.kytos.of_core.main.aemit_message_out')
+    async def test_arequest(self, mock_aemit_message_out, napp, switch_one):
+        """Test arequest resolves with the reply to a barrier request."""
+        request = BarrierRequest(xid=5)
+        task = asyncio.create_task(napp.arequest(switch_one, request))
+        await asyncio.sleep(0)
+        mock_aemit_message_out.assert_called_with(
+            napp.controller, switch_one.connection, request)
+        reply = MagicMock()
+        napp._settle_transaction(switch_one, Type.OFPT_ECHO_REPLY.value, 6,
+                                 MagicMock())
+        napp._settle_transaction(switch_one, Type.OFPT_PACKET_IN.value, 5,
+                                 MagicMock())
+        await asyncio.sleep(0)
+        assert not task.done()
+        napp._settle_transaction(switch_one, Type.OFPT_BARRIER_REPLY.value,
+                                 5, reply)
+        assert await task is reply
+        assert len(napp._transactions) == 0
+
+        with pytest.raises(ValueError):
+            await napp.arequest(switch_one, FlowMod())
+        assert len(napp._transactions) == 0
+
+    @patch('napps.kytos.of_core.main.aemit_message_out')
+    async def test_arequest_multipart(self, mock_aemit_message_out, napp,
+                                      switch_one):
+        """Test arequest resolves with the entries of all the replies."""
+        request = multipart_stats_request(MultipartType.OFPMP_TABLE)
+        xid = int(request.header.xid)
+        task = asyncio.create_task(napp.arequest(switch_one, request))
+        await asyncio.sleep(0)
+        mock_aemit_message_out.assert_called()
+        for flags, body in ((1, ["A"]), (0, ["B"])):
+            reply = MagicMock(body=body)
+            reply.header.xid = xid
+            reply.multipart_type = MultipartType.OFPMP_TABLE
+            reply.flags.value = flags
+            napp._settle_transaction(switch_one,
+                                     Type.OFPT_MULTIPART_REPLY.value, xid,
+                                     reply)
+            await napp._handle_multipart_reply(reply, switch_one)
+        assert await task == ["A", "B"]
+        assert not napp._multipart.pending(switch_one.id)
+
+    @patch('napps.kytos.of_core.main.aemit_message_out')
+    async def test_arequest_flow_stats(self, _, napp):
+        """Test flow stats requests resolve with pyof entries, uncached."""
+        switch = get_switch_mock("00:00:00:00:00:00:00:01", 0x04)
+        request = multipart_stats_request(MultipartType.OFPMP_FLOW)
+        request.header.xid = 1
+        task = asyncio.create_task(napp.arequest(switch, request))
+        await asyncio.sleep(0)
+        packet = get_flow_stats_reply(10)
+        reply = LazyMessage(packet, unpack)
+        await napp._handle_multipart_reply(reply, switch)
+        entries = await task
+        assert [entry.match.oxm_match_fields[0].oxm_value
+                for entry in entries] == [b'\x00\x00\x00\x01',
+                                          b'\x00\x00\x00\x02']
+        assert switch.id not in napp._stats_poller._flow_stats_caches
+
+    @patch('napps.kytos.of_core.main.aemit_message_out')
+    async def test_arequest_error(self, _, napp, switch_one):
+        """Test arequest fails on an error reply."""
+        request = multipart_stats_request(MultipartType.OFPMP_GROUP)
+        xid = int(request.header.xid)
+        task = asyncio.create_task(napp.arequest(switch_one, request))
+        await asyncio.sleep(0)
+        napp._settle_transaction(switch_one, Type.OFPT_ERROR.value, xid,
+                                 MagicMock(error_type=1, code=2))
+        with pytest.raises(ErrorReplyException):
+            await task
+        assert not napp._multipart.pending(switch_one.id)
+        assert len(napp._transactions) == 0
+
+    @patch('napps.kytos.of_core.main.aemit_message_out')
+    async def test_arequest_timeout_and_abort(self, _, napp, switch_one):
+        """Test arequest fails on timeout or when the switch disconnects."""
+        with pytest.raises(asyncio.TimeoutError):
+            await napp.arequest(switch_one, BarrierRequest(), timeout=0.01)
+        assert len(napp._transactions) == 0
+
+        # An explicit zero timeout isn't replaced by the default one
+        with patch('napps.kytos.of_core.main.settings') as mock_settings:
+            mock_settings.REQUEST_TIMEOUT = 60
+            task = asyncio.create_task(
+                napp.arequest(switch_one, BarrierRequest(), timeout=0))
+            await asyncio.wait([task], timeout=1)
+            assert isinstance(task.exception(), asyncio.TimeoutError)
+
+        task = asyncio.create_task(napp.arequest(switch_one,
+                                                 BarrierRequest()))
+        await asyncio.sleep(0)
+        event = MagicMock()
+        event.content["destination"].switch = switch_one
+        await napp.on_openflow_connection_error(event)
+        with pytest.raises(TransactionAborted):
+            await task
+
+    @patch('napps.kytos.of_core.main.Main._request_flow_list')
+    async def test_on_handshake_completed_request_flow_list(
+        self, mock_request_flow_list, napp, switch_one
+    ):
+        """Test the switch stats are requested and scheduled."""
+        event = MagicMock(content={'switch': switch_one})
+        switch_one.is_enabled.return_value = True
+        await napp.on_handshake_completed_request_flow_list(event)
+        mock_request_flow_list.assert_called_with(switch_one)
+        assert switch_one.id in napp._stats_scheduler
+
+        mock_request_flow_list.call_count = 0
+        switch_one.is_enabled.return_value = False
+        await napp.on_handshake_completed_request_flow_list(event)
+        mock_request_flow_list.assert_not_called()
+
+    @patch('napps.kytos.of_core.v0x04.utils.asend_echo')
+    @patch('napps.kytos.of_core.main.Main._request_flow_list')
+    async def test_on_stats_deadline(
+        self, mock_request_flow_list, mock_asend_echo, napp, switch_one
+    ):
+        """Test _on_stats_deadline."""
+        switch_one.is_connected.return_value = True
+        napp.controller.switches = {switch_one.id: switch_one}
+        napp._stats_scheduler.add(switch_one.id)
+        await napp._on_stats_deadline(switch_one.id)
+        mock_request_flow_list.assert_called_with(switch_one)
+        mock_asend_echo.assert_called_with(napp.controller, switch_one)
+
+        switch_one.is_connected.return_value = False
+        await napp._on_stats_deadline(switch_one.id)
+        assert mock_request_flow_list.call_count == 1
+        assert switch_one.id not in napp._stats_scheduler
+
+    async def test_run_stats_scheduler(self, napp, switch_one):
+        """Test _run_stats_scheduler schedules the connected switches."""
+        switch_one.is_connected.return_value = True
+        napp.controller.switches = {switch_one.id: switch_one}
+        napp._stats_scheduler = MagicMock(run=AsyncMock())
+        await napp._run_stats_scheduler()
+        napp._stats_scheduler.add.assert_called_once_with(switch_one.id)
+        napp._stats_scheduler.run.assert_called()
+
+    def test_unpack_message(self, napp):
+        """Test _unpack_message only unpacks messages with consumers."""
+        echo_reply = b'\x04\x03\x00\x08\x00\x00\x00\x01'
+        of_header = (4, 3, 8, 1)
+        connection = MagicMock()
+        napp._consumers = MagicMock()
+
+        napp._consumers.has_consumers.return_value = False
+        message = napp._unpack_message(connection, echo_reply, of_header)
+        assert isinstance(message, LazyMessage)
+        assert message.packet == echo_reply
+        connection.protocol.unpack.assert_not_called()
+        napp._consumers.has_consumers.assert_called_with(
+            'kytos/of_core.v0x04.messages.in.ofpt_echo_reply')
+
+        napp._consumers.has_consumers.return_value = True
+        message = napp._unpack_message(connection, echo_reply, of_header)
+        assert message == connection.protocol.unpack.return_value
+        connection.protocol.unpack.assert_called_with(echo_reply)
+
+    def test_unpack_message_internal_types(self, napp):
+        """Test _unpack_message always unpacks of_core's own messages."""
+        port_status = b'\x04\x0c\x00\x08\x00\x00\x00\x01'
+        connection = MagicMock()
+        napp._consumers = MagicMock()
+        napp._consumers.has_consumers.return_value = False
+        message = napp._unpack_message(connection, port_status, (4, 12, 8, 1))
+        assert message == connection.protocol.unpack.return_value
+        napp._consumers.has_consumers.assert_not_called()
+
+    def test_unpack_message_flow_stats(self, napp):
+        """Test _unpack_message keeps flow stats replies raw."""
+        packet = get_flow_stats_reply(10)
+        connection = MagicMock()
+        message = napp._unpack_message(connection, packet,
+                                       (4, 19, len(packet), 1))
+        assert isinstance(message, LazyMessage)
+        assert napp._multipart_header(message) == (
+            MultipartType.OFPMP_FLOW, 0, 1)
+        connection.protocol.unpack.assert_not_called()
 
     @patch('pyof.utils.v0x04.asynchronous.error_msg.ErrorMsg')
     @patch('napps.kytos.of_core.main.Main.aemit_message_out')
@@ -156,130 +463,134 @@ class TestNApp:
         mock_send_features_request.assert_called_with(mock_event.destination)
 
     @patch('napps.kytos.of_core.main.Main._handle_multipart_reply')
-    @patch('napps.kytos.of_core.main.Main.aemit_message_in')
+    @patch('napps.kytos.of_core.main.Main.aemit_messages_in')
     async def test_process_multipart_messages(
         self,
-        mock_aemit_message_in,
+        mock_aemit_messages_in,
         mock_handle_multipart_reply,
         switch_one,
         napp
     ):
         """Test process_multipart_messages."""
-        dpid = switch_one.id
         mock_connection = MagicMock()
         mock_connection.switch = switch_one
-        napp._multipart_replies_xids = {dpid: {0xABC: 0}}
         mock_message = MagicMock()
         messages = {0xABC: [mock_message]*2}
         await napp.process_multipart_messages(mock_connection, messages)
-        assert mock_aemit_message_in.call_count == len(messages[0xABC])
+        mock_aemit_messages_in.assert_called_once_with(mock_connection,
+                                                       messages[0xABC])
         assert mock_handle_multipart_reply.call_count == len(messages[0xABC])
 
-    @patch('napps.kytos.of_core.main.Main._handle_multipart_flow_stats')
     @patch('napps.kytos.of_core.v0x04.utils.handle_port_desc')
     async def test_handle_multipart_reply(
         self,
-        mock_of_core_v0x04_utils,
-        mock_from_of_flow_stats_v0x04,
+        mock_handle_port_desc,
         switch_one,
         napp,
     ):
         """Test handle multipart reply."""
-        flow_msg = MagicMock()
-        flow_msg.multipart_type = MultipartType.OFPMP_FLOW
-        await napp._handle_multipart_reply(flow_msg, switch_one)
-        mock_from_of_flow_stats_v0x04.assert_called_with(
-            flow_msg, switch_one.connection.switch)
+        callback = AsyncMock()
+        request = napp._multipart.expect(switch_one, 0xABC,
+                                         MultipartType.OFPMP_PORT_STATS,
+                                         callback)
+        port_stats_msg = MagicMock()
+        port_stats_msg.body = ["A", "B"]
+        port_stats_msg.header.xid = 0xABC
+        port_stats_msg.multipart_type = MultipartType.OFPMP_PORT_STATS
+        port_stats_msg.flags.value = 1
+        await napp._handle_multipart_reply(port_stats_msg, switch_one)
+        callback.assert_not_called()
+        port_stats_msg.flags.value = 0
+        await napp._handle_multipart_reply(port_stats_msg, switch_one)
+        callback.assert_awaited_once_with(request)
+        assert request.entries == ["A", "B", "A", "B"]
+
+        # Replies not expected by of_core
+        await napp._handle_multipart_reply(port_stats_msg, switch_one)
+        callback.assert_awaited_once()
 
         ofpmp_port_desc = MagicMock()
         ofpmp_port_desc.body = "A"
         ofpmp_port_desc.multipart_type = MultipartType.OFPMP_PORT_DESC
         await napp._handle_multipart_reply(ofpmp_port_desc, switch_one)
-        mock_of_core_v0x04_utils.assert_called_with(
-            napp.controller, switch_one.connection.switch,
-            ofpmp_port_desc.body)
+        mock_handle_port_desc.assert_called_with(
+            napp.controller, switch_one, ofpmp_port_desc.body)
 
         ofpmp_desc = MagicMock()
         ofpmp_desc.body = "A"
         ofpmp_desc.multipart_type = MultipartType.OFPMP_DESC
         await napp._handle_multipart_reply(ofpmp_desc, switch_one)
-        assert switch_one.update_description.call_count == 1
+        switch_one.update_description.assert_called_once_with("A")
 
-    @patch('napps.kytos.of_core.main.log')
-    @patch('kytos.core.buffers.KytosEventBuffer.aput')
-    @patch('napps.kytos.of_core.main.Main._update_switch_flows')
     @patch('napps.kytos.of_core.v0x04.flow.Flow.from_of_flow_stats')
-    @patch('napps.kytos.of_core.main.Main._is_multipart_reply_ours')
-    async def test_on_multipart_flow_stats(
-        self,
-        mock_is_multipart_reply_ours,
-        mock_from_of_flow_stats_v0x04,
-        mock_update_switch_flows,
-        mock_buffer_aput,
-        mock_log,
-        switch_one,
-        napp
-    ):
-        """Test on multipart flow stats."""
-        mock_is_multipart_reply_ours.return_value = True
-        mock_from_of_flow_stats_v0x04.return_value = "ABC"
-
-        flow_msg = MagicMock()
-        flow_msg.body = "A"
-        flow_msg.flags.value = 2
-        flow_msg.body_type = MultipartType.OFPMP_FLOW
-        flow_msg.header.xid = 0xABC
-
-        dpid = switch_one.id
-        xid_flows = 0xABC
-        napp._multipart_replies_xids = {dpid: {'flows': xid_flows}}
-
-        await napp._handle_multipart_flow_stats(flow_msg, switch_one)
-
-        mock_is_multipart_reply_ours.assert_called_with(flow_msg,
-                                                        switch_one,
-                                                        'flows')
-        mock_from_of_flow_stats_v0x04.assert_called_with(flow_msg.body,
-                                                         switch_one)
-        mock_update_switch_flows.assert_called_with(switch_one)
-        assert mock_buffer_aput.call_count == 1
-        kytos_event = mock_buffer_aput.call_args[0][0]
-        assert kytos_event.name == 'kytos/of_core.flow_stats.received'
-        assert kytos_event.content['switch'] == switch_one
-        assert "replies_flows" in kytos_event.content
-
-        # Test when update_switch_flows fails
-        mock_update_switch_flows.side_effect = KeyError()
-        mock_buffer_aput.call_count = 0
-        mock_log.error.call_count = 0
-        await napp._handle_multipart_flow_stats(flow_msg, switch_one)
-        assert mock_log.error.call_count == 1
-        mock_buffer_aput.assert_not_called()
-
-    @patch('napps.kytos.of_core.main.Main._new_port_stats')
-    @patch('napps.kytos.of_core.main.Main._is_multipart_reply_ours')
-    async def test_handle_multipart_port_stats(
-        self,
-        mock_is_multipart_reply_ours,
-        mock_new_port_stats,
-        switch_one,
-        napp,
-    ):
-        """Test handle multipart flow stats."""
-        mock_is_multipart_reply_ours.return_value = True
+    def test_multipart_entries(self, mock_from_of_flow_stats, switch_one,
+                               napp):
+        """Test the entries of each type of multipart reply."""
+        reply = MagicMock(body=["A", "B"])
+        mock_from_of_flow_stats.side_effect = lambda stats, _: stats.lower()
+        request = MagicMock(multipart_type=MultipartType.OFPMP_FLOW,
+                            raw=False)
+        assert napp._multipart_entries(reply, switch_one,
+                                       request) == ["a", "b"]
+        request.raw = True
+        assert napp._multipart_entries(reply, switch_one,
+                                       request) == ["A", "B"]
+        request.multipart_type = MultipartType.OFPMP_DESC
+        assert napp._multipart_entries(reply, switch_one,
+                                       request) == [reply.body]
+        request.multipart_type = MultipartType.OFPMP_TABLE
+        assert napp._multipart_entries(reply, switch_one,
+                                       request) == ["A", "B"]
 
-        port_stats_msg = MagicMock()
-        port_stats_msg.body = "A"
-        port_stats_msg.flags.value = 2
-        port_stats_msg.multipart_type = MultipartType.OFPMP_PORT_STATS
+    @patch('kytos.core.buffers.KytosEventBuffer.aput')
+    async def test_on_multipart_flow_stats_cached(self, mock_buffer_aput,
+                                                  napp):
+        """Test raw flow stats replies reuse the flows of the last reply."""
+        switch = get_switch_mock("00:00:00:00:00:00:00:01", 0x04)
+        replies_flows = []
+        for packet_count in (10, 20):
+            napp._multipart.expect(switch, 1, MultipartType.OFPMP_FLOW,
+                                   napp._stats_poller._on_flow_stats)
+            packet = get_flow_stats_reply(packet_count)
+            reply = LazyMessage(packet, None)
+            await napp._handle_multipart_reply(reply, switch)
+            received, delta = [call[0][0] for call
+                               in mock_buffer_aput.call_args_list[-2:]]
+            replies_flows.append(received.content['replies_flows'])
+            assert delta.name == 'kytos/of_core.flow_stats.delta'
+            assert switch.flows == replies_flows[-1]
+            assert not reply.is_unpacked
+
+        assert replies_flows[1][0] is replies_flows[0][0]
+        assert replies_flows[1][0].stats.packet_count == 20
+        assert delta.content['changed'] == replies_flows[1]
+        cache = napp._stats_poller._flow_stats_caches[switch.id]
+        assert (cache.hits, cache.misses) == (2, 2)
+        metrics = napp.intern_metrics()
+        assert set(metrics) == {'matches', 'instructions', 'actions'}
+        assert metrics['instructions']['size'] >= 1
 
-        await napp._handle_multipart_port_stats(port_stats_msg,
-                                                switch_one)
+    @patch('kytos.core.buffers.KytosEventBuffer.aput')
+    async def test_on_stats(self, mock_buffer_aput, switch_one, napp):
+        """Test _on_stats."""
+        request = MagicMock(switch=switch_one, entries=["A"],
+                            multipart_type=MultipartType.OFPMP_METER)
+        await napp._on_stats(request)
+        kytos_event = mock_buffer_aput.call_args[0][0]
+        assert kytos_event.name == 'kytos/of_core.meter_stats'
+        assert kytos_event.content == {'switch': switch_one,
+                                       'meter_stats': ["A"]}
 
-        mock_is_multipart_reply_ours.assert_called_with(port_stats_msg,
-                                                        switch_one,
-                                                        'ports')
-        mock_new_port_stats.assert_called_with(switch_one)
+    @patch('napps.kytos.of_core.v0x04.utils.handle_port_desc')
+    async def test_on_port_desc_and_desc(self, mock_handle_port_desc,
+                                         switch_one, napp):
+        """Test _on_port_desc and _on_desc."""
+        request = MagicMock(switch=switch_one, entries=["A", "B"])
+        await napp._on_port_desc(request)
+        mock_handle_port_desc.assert_called_with(napp.controller, switch_one,
+                                                 ["A", "B"])
+        await napp._on_desc(request)
+        switch_one.update_description.assert_called_with("A")
 
     @patch('napps.kytos.of_core.main.Main.update_port_status')
     @patch('napps.kytos.of_core.main.Main.update_links')
@@ -308,6 +619,41 @@ class TestNApp:
         mock_update_links.assert_called_with(msg_packet_in_mock,
                                              mock_packet_in_connection)
 
+    @patch('napps.kytos.of_core.main.Main.update_port_status')
+    @patch('napps.kytos.of_core.main.Main.update_links')
+    @patch('napps.kytos.of_core.main.aemit_messages_in')
+    async def test_aemit_messages_in(
+        self,
+        mock_aemit_messages_in,
+        mock_update_links,
+        mock_update_port_status,
+        napp
+    ):
+        """Test aemit_messages_in."""
+        mock_connection = MagicMock()
+        msg_port_mock = MagicMock()
+        msg_port_mock.header.message_type.name = 'ofpt_port_status'
+        msg_packet_in_mock = MagicMock()
+        msg_packet_in_mock.header.message_type.name = 'ofpt_packet_in'
+        messages = [msg_port_mock, msg_packet_in_mock]
+        await napp.aemit_messages_in(mock_connection, messages)
+        mock_aemit_messages_in.assert_called_once_with(napp.controller,
+                                                       mock_connection,
+                                                       messages)
+        mock_update_port_status.assert_called_with(msg_port_mock,
+                                                   mock_connection)
+        mock_update_links.assert_called_with(msg_packet_in_mock,
+                                             mock_connection)
+
+        mock_aemit_messages_in.call_count = 0
+        await napp.aemit_messages_in(mock_connection, [])
+        assert mock_aemit_messages_in.call_count == 0
+
+        # Received before the connection was closed
+        mock_connection.is_alive.return_value = False
+        await napp.aemit_messages_in(mock_connection, messages)
+        assert mock_aemit_messages_in.call_count == 1
+
     @patch('napps.kytos.of_core.main.aemit_message_out')
     async def test_emit_message_out(self, mock_aemit_message_out, napp):
         """Test emit message_out."""
@@ -322,13 +668,20 @@ class TestNApp:
         dpid = "1"
         event, switch = MagicMock(), MagicMock(id=dpid)
         event.content["source"].switch = switch
-        napp._multipart_replies_xids[dpid] = {"flows": 2, "ports": 3}
-        napp._multipart_replies_flows[dpid] = [MagicMock()]
-        napp._multipart_replies_ports[dpid] = [MagicMock()]
+        on_evict = MagicMock()
+        napp._multipart.expect(switch, 2, MultipartType.OFPMP_FLOW,
+                               AsyncMock(), on_evict=on_evict)
+        napp._stats_poller._flow_stats_caches[dpid] = MagicMock()
+        napp._stats_poller._flow_tables[dpid] = {}
+        worker = MagicMock()
+        napp._ingest_workers[event.content["source"].id] = worker
         await napp.on_connection_lost(event)
-        assert dpid not in napp._multipart_replies_xids
-        assert dpid not in napp._multipart_replies_flows
-        assert dpid not in napp._multipart_replies_ports
+        worker.stop.assert_called()
+        assert not napp._ingest_workers
+        assert not napp._multipart.pending(dpid)
+        on_evict.assert_called()
+        assert dpid not in napp._stats_poller._flow_stats_caches
+        assert dpid not in napp._stats_poller._flow_tables
 
         # To also cover the early return
         event = MagicMock()
@@ -342,13 +695,12 @@ class TestNApp:
         dpid = "1"
         event, switch = MagicMock(), MagicMock(id=dpid)
         event.content["destination"].switch = switch
-        napp._multipart_replies_xids[dpid] = {"flows": 2, "ports": 3}
-        napp._multipart_replies_flows[dpid] = [MagicMock()]
-        napp._multipart_replies_ports[dpid] = [MagicMock()]
+        napp._multipart.expect(switch, 2, MultipartType.OFPMP_FLOW,
+                               AsyncMock())
+        napp._multipart.expect(switch, 3, MultipartType.OFPMP_PORT_STATS,
+                               AsyncMock())
         await napp.on_openflow_connection_error(event)
-        assert dpid not in napp._multipart_replies_xids
-        assert dpid not in napp._multipart_replies_flows
-        assert dpid not in napp._multipart_replies_ports
+        assert not napp._multipart.pending(dpid)
 
 
 class TestMain(TestCase):
@@ -368,111 +720,39 @@ class TestMain(TestCase):
         self.addCleanup(patch.stopall)
         self.napp = Main(get_controller_mock())
 
-    @patch('napps.kytos.of_core.v0x04.utils.send_echo')
-    def test_execute(self, mock_of_core_v0x04_utils):
-        """Test execute."""
-        self.napp.request_flow_list = MagicMock()
-        self.switch_v0x04.is_connected.return_value = True
-        self.napp.controller.switches = {"00:00:00:00:00:00:00:01":
-                                         self.switch_v0x04}
+    @patch('napps.kytos.of_core.main.asyncio.run_coroutine_threadsafe')
+    def test_execute(self, mock_run_coroutine_threadsafe):
+        """Test execute starts the stats scheduler in the controller loop."""
         self.napp.execute()
-        mock_of_core_v0x04_utils.assert_called()
-        assert self.napp.request_flow_list.call_count == 1
-
-    @patch('napps.kytos.of_core.main.settings')
-    def test_check_overlapping_multipart_request(self, mock_settings):
-        """Test check_overlapping_multipart_request."""
-        mock_settings.STATS_REQ_SKIP = 3
-        dpid = '00:00:00:00:00:00:00:01'
-        mock_switch = get_switch_mock(dpid)
-        mock_switch.id = dpid
-
-        # Case 1: skipped due to delayed flow stats
-        self.napp._multipart_replies_xids = {dpid: {'flows': 0xABC}}
-        self.assertTrue(self.napp._check_overlapping_multipart_request(
-                                        mock_switch))
-        self.assertEqual(self.napp._multipart_replies_xids[dpid]['skipped'], 1)
-
-        # Case 2: skipped due to delayed port stats
-        self.napp._multipart_replies_xids = {dpid: {'ports': 0xABC,
-                                                    'skipped': 1}}
-        self.assertTrue(self.napp._check_overlapping_multipart_request(
-                                        mock_switch))
-        self.assertEqual(self.napp._multipart_replies_xids[dpid]['skipped'], 2)
-
-        # Case 3: delayed port or flow stats but already skipped X times
-        self.napp._multipart_replies_flows = {dpid: mock_switch}
-        self.napp._multipart_replies_ports = {dpid: mock_switch}
-        self.napp._multipart_replies_xids = {dpid: {'flows': 0xABC,
-                                                    'ports': 0xABC,
-                                                    'skipped': 3}}
-        self.assertFalse(self.napp._check_overlapping_multipart_request(
-                                        mock_switch))
-        self.assertEqual(self.napp._multipart_replies_flows, {})
-        self.assertEqual(self.napp._multipart_replies_ports, {})
-
-    @patch('napps.kytos.of_core.main.settings')
-    def test_get_switch_req_stats_delay(self, mock_settings):
-        """Test _get_switch_req_stats_delay."""
-        mock_settings.STATS_INTERVAL = 60
-        dpid = '00:00:00:00:00:00:00:01'
-        mock_switch = get_switch_mock(dpid)
-        mock_switch.id = dpid
-
-        # Case 1: switch already known
-        self.napp.switch_req_stats_delay = {dpid: 9}
-        self.assertEqual(self.napp._get_switch_req_stats_delay(mock_switch), 9)
-
-        # Case 2: switch unknown, it should have a new delay based on
-        # STATS_INTERVAL
-        self.napp.switch_req_stats_delay = {}
-        self.assertEqual(self.napp._get_switch_req_stats_delay(mock_switch), 3)
-
-        # Case 3: switch unknown but there are other switches, it should have
-        # a new delay based on STATS_INTERVAL and different from others
-        dpid2 = '00:00:00:00:00:00:00:02'
-        mock_sw2 = get_switch_mock(dpid2)
-        mock_sw2.id = dpid2
-        self.napp.switch_req_stats_delay = {dpid: 3, 'last': 3}
-        self.assertEqual(self.napp._get_switch_req_stats_delay(mock_sw2), 6)
-
-    @patch('time.sleep', return_value=None)
-    @patch('napps.kytos.of_core.main.Main.'
-           '_check_overlapping_multipart_request')
-    @patch('napps.kytos.of_core.v0x04.utils.update_flow_list')
-    def test_request_flow_list(self, *args):
-        """Test request flow list."""
-        (mock_update_flow_list_v0x04, mock_check_overlapping_multipart_request,
-            _) = args
-        mock_update_flow_list_v0x04.return_value = 0xABC
-        mock_check_overlapping_multipart_request.return_value = False
-        self.napp._request_flow_list(self.switch_v0x04)
-        mock_update_flow_list_v0x04.assert_called_with(self.napp.controller,
-                                                       self.switch_v0x04)
-
-        mock_update_flow_list_v0x04.call_count = 0
-        mock_check_overlapping_multipart_request.return_value = True
-        self.napp._request_flow_list(self.switch_v0x04)
-        mock_update_flow_list_v0x04.assert_not_called()
-
-    @patch('time.sleep', return_value=None)
-    @patch('napps.kytos.of_core.v0x04.utils.update_flow_list')
-    def test_on_handshake_completed_request_flow_list(self, *args):
-        """Test request flow list."""
-        (mock_update_flow_list_v0x04, _) = args
-        mock_update_flow_list_v0x04.return_value = 0xABC
-        sw = self.switch_v0x04
-        self.napp.handle_handshake_completed_request_flow_list(sw)
-        mock_update_flow_list_v0x04.assert_called_with(self.napp.controller,
-                                                       self.switch_v0x04)
+        coroutine, loop = mock_run_coroutine_threadsafe.call_args[0]
+        coroutine.close()
+        self.assertEqual(loop, self.napp.controller.loop)
+        self.assertEqual(self.napp._stats_scheduler_future,
+                         mock_run_coroutine_threadsafe.return_value)
+
+        self.napp.shutdown()
+        self.napp._stats_scheduler_future.cancel.assert_called()
+
+    @patch('napps.kytos.of_core.main.log')
+    def test_on_stats_scheduler_done(self, mock_log):
+        """Test the error that stopped the stats scheduler is logged."""
+        future = MagicMock()
+        future.cancelled.return_value = False
+        future.exception.return_value = None
+        self.napp._on_stats_scheduler_done(future)
+        mock_log.error.assert_not_called()
+
+        future.exception.return_value = RuntimeError()
+        self.napp._on_stats_scheduler_done(future)
+        mock_log.error.assert_called_once()
 
     @patch('kytos.core.buffers.KytosEventBuffer.put')
     @patch('napps.kytos.of_core.v0x04.utils.send_set_config')
-    @patch('napps.kytos.of_core.v0x04.utils.send_desc_request')
+    @patch('napps.kytos.of_core.main.emit_message_out')
     @patch('napps.kytos.of_core.v0x04.utils.handle_features_reply')
     def test_handle_features_reply(self, *args):
         """Test handle features reply."""
-        (mock_freply_v0x04, mock_send_desc_request_v0x04,
+        (mock_freply_v0x04, mock_emit_message_out,
          mock_send_set_config_v0x04, mock_buffers_put) = args
         mock_freply_v0x04.return_value = self.switch_v0x04.connection.switch
         name = 'kytos/of_core.v0x04.messages.in.ofpt_features_reply'
@@ -486,42 +766,22 @@ class TestMain(TestCase):
         count = self.switch_v0x04.connection.switch.update_lastseen.call_count
         self.assertEqual(count, 1)
         mock_freply_v0x04.assert_called_with(self.napp.controller, event)
-        mock_send_desc_request_v0x04.assert_called_with(
-            self.napp.controller, self.switch_v0x04.connection.switch)
+        requests = [call[0][2] for call
+                    in mock_emit_message_out.call_args_list]
+        self.assertEqual([request.multipart_type for request in requests],
+                         [MultipartType.OFPMP_PORT_DESC,
+                          MultipartType.OFPMP_DESC])
+        switch = self.switch_v0x04.connection.switch
+        self.assertEqual(
+            [(pending.xid, pending.multipart_type) for pending
+             in self.napp._multipart.pending(switch.id)],
+            [(int(request.header.xid), request.multipart_type)
+             for request in requests])
         mock_send_set_config_v0x04.assert_called_with(
             self.napp.controller, self.switch_v0x04.connection.switch)
 
         mock_buffers_put.assert_called()
 
-    def test_update_switch_flows(self):
-        """Test update_switch_flows."""
-        dpid = '00:00:00:00:00:00:00:01'
-        mock_switch = get_switch_mock(dpid)
-        mock_switch.id = dpid
-        self.napp._multipart_replies_flows = {dpid: mock_switch}
-        self.napp._multipart_replies_xids = {dpid: {'flows': 0xABC}}
-        self.napp._update_switch_flows(mock_switch)
-        self.assertEqual(self.napp._multipart_replies_xids, {dpid: {}})
-        self.assertEqual(self.napp._multipart_replies_flows, {})
-
-    def test_is_multipart_reply_ours(self):
-        """Test _is_multipart_reply_ours."""
-        dpid_a = '00:00:00:00:00:00:00:01'
-        dpid_b = '00:00:00:00:00:00:00:02'
-        mock_switch = get_switch_mock(dpid_a)
-        mock_reply = MagicMock()
-        mock_reply.header.xid = mock_switch
-        type(mock_switch).id = PropertyMock(side_effect=[dpid_a,
-                                                         dpid_a, dpid_b])
-        self.napp._multipart_replies_xids = {dpid_a: {'flows': mock_switch}}
-        response = self.napp._is_multipart_reply_ours(
-            mock_reply, mock_switch, 'flows')
-        self.assertEqual(response, True)
-
-        response = self.napp._is_multipart_reply_ours(
-            mock_reply, mock_switch, 'flows')
-        self.assertEqual(response, False)
-
     @patch('napps.kytos.of_core.main.Main.update_port_status')
     @patch('napps.kytos.of_core.main.Main.update_links')
     def test_emit_message_in(self, *args):
@@ -599,20 +859,43 @@ class TestMain(TestCase):
         self.assertEqual(mock_log.debug.call_count, 1)
 
     @patch('kytos.core.buffers.KytosEventBuffer.put')
-    @patch('napps.kytos.of_core.main.Ethernet')
-    def test_update_links(self, *args):
+    def test_update_links(self, mock_buffer_put):
         """Test update_links."""
-        (mock_ethernet, mock_buffer_put) = args
-        ethernet = create_autospec(Ethernet)
-        ethernet.ether_type = "A"
-        mock_ethernet.side_effect = ethernet
+        arp = (b'\xff\xff\xff\xff\xff\xff\xf2\x0b\xa4\x7d\xf8\xea'
+               b'\x08\x06' + bytes(28))
         mock_message = MagicMock()
+        mock_message.data.value = arp
+        mock_message.in_port = 1
         mock_s = MagicMock()
-        mock_s.switch.get_interface_by_port_no.side_effect = [AttributeError(),
-                                                              True]
         self.napp.update_links(mock_message, mock_s)
-        mock_ethernet.assert_called()
-        mock_buffer_put.assert_called()
+        mock_buffer_put.assert_called_once()
+        event = mock_buffer_put.call_args[0][0]
+        self.assertEqual(event.content['reachable_mac'], 'f2:0b:a4:7d:f8:ea')
+        self.assertEqual(event.content['port'],
+                         mock_s.switch.get_interface_by_port_no.return_value)
+        mock_s.switch.get_interface_by_port_no.assert_called_with(1)
+
+        # Already reachable from the same port
+        self.napp.update_links(mock_message, mock_s)
+        mock_buffer_put.assert_called_once()
+
+        # Moved to another port
+        mock_message.in_port = MagicMock(value=2)
+        self.napp.update_links(mock_message, mock_s)
+        self.assertEqual(mock_buffer_put.call_count, 2)
+        mock_s.switch.get_interface_by_port_no.assert_called_with(2)
+
+    @patch('kytos.core.buffers.KytosEventBuffer.put')
+    def test_update_links_skipped(self, mock_buffer_put):
+        """Test update_links skips LLDP, IPv6 and truncated frames."""
+        header = b'\x01\x80\xc2\x00\x00\x0e\xf2\x0b\xa4\x7d\xf8\xea'
+        vlan = b'\x81\x00\x00\x0a'
+        mock_message = MagicMock()
+        for frame in (header + b'\x88\xcc', header + vlan + b'\x86\xdd',
+                      header + vlan):
+            mock_message.data.value = frame
+            self.napp.update_links(mock_message, MagicMock())
+        mock_buffer_put.assert_not_called()
 
     @patch('kytos.core.buffers.KytosEventBuffer.put')
     def test_send_specific_port_mod(self, mock_buffer_put):
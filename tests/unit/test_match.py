@@ -1,4 +1,6 @@
 """Test Match abstraction for v0x04."""
+import copy
+import pickle
 from unittest import TestCase
 from unittest.mock import MagicMock, PropertyMock, patch
 
@@ -90,3 +92,29 @@ class TestMatch(TestCase):
         match_values = {'in_port': 1, 'dl_vlan': 2}
         match_04 = Match04(**match_values)
         self.assertEqual(len(match_04.as_dict()), len(match_values))
+
+    def test_sparse_fields(self):
+        """Test only the fields that are set are stored, in field order."""
+        match = Match04(dl_vlan=2, in_port=1)
+        self.assertFalse(hasattr(match, '__dict__'))
+        self.assertEqual(match.in_port, 1)
+        self.assertIsNone(match.tp_src)
+        with self.assertRaises(AttributeError):
+            _ = match.unknown
+
+        match.tp_src = 80
+        match.dl_src = '11:22:33:44:55:66'
+        match.other = 3
+        self.assertEqual(list(match.as_dict()),
+                         ['in_port', 'dl_src', 'dl_vlan', 'tp_src', 'other'])
+        match.dl_vlan = None
+        self.assertEqual(match.as_dict(), {'in_port': 1, 'tp_src': 80,
+                                           'dl_src': '11:22:33:44:55:66',
+                                           'other': 3})
+
+        for clone in (copy.copy(match), copy.deepcopy(match),
+                      pickle.loads(pickle.dumps(match))):
+            clone.in_port = 2
+            self.assertEqual(clone.as_dict()['in_port'], 2)
+            self.assertEqual(clone.tp_src, 80)
+        self.assertEqual(match.in_port, 1)
@@ -0,0 +1,71 @@
+"""Test port_stats module."""
+import numpy as np
+
+from napps.kytos.of_core.port_stats import COUNTERS, PortStatsRates
+from tests.helpers import get_port_stats
+
+# pylint: disable=attribute-defined-outside-init
+
+
+class TestPortStatsRates:
+    """Test PortStatsRates."""
+
+    def setup_method(self):
+        """Create the rates with a fake clock."""
+        self.now = 100.0
+        self.rates = PortStatsRates(clock=lambda: self.now)
+        self.dpid = '00:00:00:00:00:00:00:01'
+
+    def test_update(self):
+        """Test the rates of ports found in the previous reply."""
+        rates = self.rates.update(self.dpid, [get_port_stats(2, 100, 10),
+                                              get_port_stats(1, 100, 10)])
+        assert list(rates['port_no']) == [1, 2]
+        assert np.isnan(rates['rx_bytes']).all()
+
+        rates = self.rates.update(self.dpid, [get_port_stats(1, 300, 20),
+                                              get_port_stats(3, 0, 20),
+                                              get_port_stats(2, 150, 20)])
+        assert list(rates['port_no']) == [1, 2, 3]
+        assert rates['changed'].all()
+        for name in COUNTERS:
+            np.testing.assert_array_equal(rates[name], [20, 5, np.nan])
+
+    def test_changed(self):
+        """Test ports are changed if any of their counters moved."""
+        self.rates.update(self.dpid, [get_port_stats(1, 100, 10),
+                                      get_port_stats(2, 100, 10)])
+        port_stats = [get_port_stats(1, 100, 20), get_port_stats(2, 100, 20)]
+        port_stats[1].rx_errors = 101
+        rates = self.rates.update(self.dpid, port_stats)
+        assert rates['changed'].tolist() == [False, True]
+
+        port_stats = [get_port_stats(1, 100, 30), get_port_stats(2, 100, 30)]
+        port_stats[0].collisions = 1
+        port_stats[1].rx_errors = 101
+        rates = self.rates.update(self.dpid, port_stats)
+        assert rates['changed'].tolist() == [True, False]
+        assert set(rates) == {'port_no', 'changed', *COUNTERS}
+
+    def test_wrap_and_reset(self):
+        """Test 64-bit counters wrap and port resets give no rates."""
+        self.rates.update(self.dpid, [get_port_stats(1, 2**64 - 10, 10),
+                                      get_port_stats(2, 100, 10),
+                                      get_port_stats(3, 100, 10)])
+        rates = self.rates.update(self.dpid, [get_port_stats(1, 20, 20),
+                                              get_port_stats(2, 200, 5),
+                                              get_port_stats(3, 50, 20)])
+        np.testing.assert_array_equal(rates['tx_packets'], [3, np.nan,
+                                                            np.nan])
+
+    def test_without_durations(self):
+        """Test the reply times are used if switches have no durations."""
+        self.rates.update(self.dpid, [get_port_stats(1, 0, 0)])
+        self.now += 4
+        rates = self.rates.update(self.dpid, [get_port_stats(1, 100, 0)])
+        assert rates['rx_packets'][0] == 25
+
+        self.rates.remove(self.dpid)
+        assert not self.rates
+        rates = self.rates.update(self.dpid, [])
+        assert not len(rates['port_no'])
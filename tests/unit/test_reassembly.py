@@ -0,0 +1,154 @@
+"""Test reassembly module."""
+from unittest.mock import AsyncMock, MagicMock
+
+from napps.kytos.of_core.reassembly import MultipartGroup, MultipartReassembler
+
+# pylint: disable=attribute-defined-outside-init
+
+
+class TestMultipartReassembler:
+    """Test MultipartReassembler."""
+
+    def setup_method(self):
+        """Create a reassembler with a fake clock."""
+        self.now = 1000.0
+        self.reassembler = MultipartReassembler(timeout=10, max_entries=5,
+                                                max_pending=2,
+                                                clock=lambda: self.now)
+        self.switch = MagicMock(id='00:00:00:00:00:00:00:01')
+
+    async def test_feed(self):
+        """Test the entries of all replies are passed to the callback."""
+        callback = AsyncMock()
+        request = self.reassembler.expect(self.switch, 1, 1, callback)
+        assert self.reassembler.get(self.switch.id, 1, 1) is request
+        assert self.reassembler.get(self.switch.id, 1, 4) is None
+
+        assert not await self.reassembler.feed(request, [1, 2], True)
+        callback.assert_not_called()
+        assert await self.reassembler.feed(request, [3], False)
+        callback.assert_awaited_once_with(request)
+        assert request.entries == [1, 2, 3]
+        assert request.replies == 2
+        assert self.reassembler.get(self.switch.id, 1, 1) is None
+        assert len(self.reassembler) == 0
+        assert self.reassembler.completed == 1
+
+    async def test_concurrent_requests(self):
+        """Test requests in flight at once are assembled separately."""
+        callback = AsyncMock()
+        flows_1 = self.reassembler.expect(self.switch, 1, 1, callback)
+        ports = self.reassembler.expect(self.switch, 2, 4, callback)
+        flows_2 = self.reassembler.expect(self.switch, 3, 1, callback)
+        assert len(self.reassembler) == 3
+
+        await self.reassembler.feed(flows_1, [1], True)
+        await self.reassembler.feed(flows_2, [2], False)
+        await self.reassembler.feed(ports, [3], False)
+        await self.reassembler.feed(flows_1, [4], False)
+        assert [call.args[0] for call in callback.await_args_list] == [
+            flows_2, ports, flows_1]
+        assert flows_1.entries == [1, 4]
+
+    async def test_max_entries(self):
+        """Test requests with too many entries are evicted."""
+        on_evict = MagicMock()
+        callback = AsyncMock()
+        request = self.reassembler.expect(self.switch, 1, 1, callback,
+                                          on_evict=on_evict)
+        assert not await self.reassembler.feed(request, range(6), True)
+        on_evict.assert_called_once_with(request)
+        assert self.reassembler.get(self.switch.id, 1, 1) is None
+        assert not await self.reassembler.feed(request, [], False)
+        callback.assert_not_called()
+        assert self.reassembler.evicted == 1
+
+    def test_max_pending(self):
+        """Test the oldest requests of a type are evicted."""
+        on_evict = MagicMock()
+        requests = [self.reassembler.expect(self.switch, xid, 1, AsyncMock(),
+                                            on_evict=on_evict)
+                    for xid in range(3)]
+        self.reassembler.expect(self.switch, 3, 4, AsyncMock())
+        on_evict.assert_called_once_with(requests[0])
+        assert [request.xid for request
+                in self.reassembler.pending(self.switch.id)] == [1, 2, 3]
+
+        self.reassembler.expect(self.switch, 4, 1, AsyncMock(),
+                                max_pending=4)
+        assert on_evict.call_count == 1
+
+    def test_evict_expired(self):
+        """Test requests are evicted after their deadline."""
+        old = self.reassembler.expect(self.switch, 1, 1, AsyncMock())
+        self.now += 5
+        new = self.reassembler.expect(self.switch, 2, 4, AsyncMock(),
+                                      timeout=20)
+        self.now += 5
+        assert self.reassembler.evict_expired(self.switch.id) == [old]
+        assert self.reassembler.pending(self.switch.id) == [new]
+        self.now += 20
+        assert self.reassembler.evict_expired() == [new]
+        assert len(self.reassembler) == 0
+
+        expired = self.reassembler.expect(self.switch, 3, 1, AsyncMock(),
+                                          timeout=0)
+        assert expired.deadline == self.now
+
+    def test_discard(self):
+        """Test discarding the requests of a switch."""
+        on_evict = MagicMock()
+        request = self.reassembler.expect(self.switch, 1, 1, AsyncMock(),
+                                          on_evict=on_evict)
+        self.reassembler.discard(self.switch.id)
+        on_evict.assert_called_once_with(request)
+        assert not self.reassembler.pending(self.switch.id)
+
+    async def test_cancel(self):
+        """Test cancelled requests are neither completed nor evicted."""
+        on_evict = MagicMock()
+        callback = AsyncMock()
+        request = self.reassembler.expect(self.switch, 1, 1, callback,
+                                          on_evict=on_evict)
+        assert self.reassembler.cancel(request)
+        assert not self.reassembler.cancel(request)
+        assert not await self.reassembler.feed(request, [1], False)
+        callback.assert_not_called()
+        on_evict.assert_not_called()
+
+
+class TestMultipartGroup:
+    """Test MultipartGroup."""
+
+    def setup_method(self):
+        """Create a reassembler and a group of two requests."""
+        self.reassembler = MultipartReassembler(timeout=10, max_entries=5,
+                                                max_pending=2)
+        self.switch = MagicMock(id='00:00:00:00:00:00:00:01')
+        self.callback, self.on_evict = AsyncMock(), MagicMock()
+        self.group = MultipartGroup(self.switch, self.callback,
+                                    self.on_evict)
+        self.requests = []
+        for xid in (1, 2):
+            request = self.reassembler.expect(
+                self.switch, xid, 1, self.group.complete,
+                on_evict=self.group.evict)
+            self.group.add(request)
+            self.requests.append(request)
+
+    async def test_complete(self):
+        """Test the group completes with the entries of all requests."""
+        await self.reassembler.feed(self.requests[1], [3], False)
+        self.callback.assert_not_called()
+        await self.reassembler.feed(self.requests[0], [1, 2], False)
+        self.callback.assert_awaited_once_with(self.group)
+        assert self.group.entries == [1, 2, 3]
+        assert self.group.started == self.requests[0].started
+
+    async def test_evict(self):
+        """Test the group is evicted once, and then never completes."""
+        await self.reassembler.feed(self.requests[0], range(6), True)
+        self.reassembler.discard(self.switch.id)
+        self.on_evict.assert_called_once_with(self.group)
+        await self.group.complete(self.requests[1])
+        self.callback.assert_not_called()
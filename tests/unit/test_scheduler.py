@@ -0,0 +1,132 @@
+"""Test scheduler module."""
+import asyncio
+from unittest import TestCase
+from unittest.mock import AsyncMock
+
+from napps.kytos.of_core.scheduler import AdaptiveInterval, StatsScheduler
+
+
+class TestStatsScheduler(TestCase):
+    """Test StatsScheduler deadlines."""
+
+    def setUp(self):
+        """Create a scheduler with a fake clock."""
+        self.now = 1000.0
+        self.scheduler = StatsScheduler(AsyncMock(), interval=60,
+                                        clock=lambda: self.now)
+
+    def test_phase(self):
+        """Test each switch has a stable phase within the interval."""
+        dpids = [f'00:00:00:00:00:00:00:{i:02x}' for i in range(1, 100)]
+        phases = [self.scheduler.phase(dpid) for dpid in dpids]
+        self.assertEqual(phases, [self.scheduler.phase(dpid)
+                                  for dpid in dpids])
+        self.assertTrue(all(0 <= phase < 60 for phase in phases))
+        self.assertGreater(len({int(phase) for phase in phases}), 30)
+
+    def test_next_deadline(self):
+        """Test the next deadline is the next slot of the switch phase."""
+        dpid = '00:00:00:00:00:00:00:01'
+        phase = self.scheduler.phase(dpid)
+        deadline = self.scheduler.next_deadline(dpid, self.now)
+        self.assertTrue(self.now < deadline <= self.now + 60)
+        self.assertAlmostEqual(deadline % 60, phase)
+        self.assertEqual(self.scheduler.next_deadline(dpid, deadline),
+                         deadline + 60)
+
+    def test_add_remove(self):
+        """Test adding and removing switches."""
+        dpid = '00:00:00:00:00:00:00:01'
+        self.scheduler.add(dpid)
+        self.scheduler.add(dpid)
+        self.assertIn(dpid, self.scheduler)
+        self.assertEqual(len(self.scheduler), 1)
+        self.scheduler.remove(dpid)
+        self.assertNotIn(dpid, self.scheduler)
+        self.scheduler.remove(dpid)
+
+    def test_set_interval(self):
+        """Test per switch intervals and their rescheduling."""
+        dpid = '00:00:00:00:00:00:00:01'
+        self.scheduler.add(dpid)
+        deadline = self.scheduler._deadlines[dpid]
+        self.assertEqual(self.scheduler.intervals, {dpid: 60})
+
+        self.scheduler.set_interval(dpid, 120)
+        self.assertEqual(self.scheduler.interval_of(dpid), 120)
+        self.assertEqual(self.scheduler._deadlines[dpid], deadline)
+        self.assertTrue(deadline < self.scheduler.next_deadline(dpid, deadline)
+                        <= deadline + 120)
+
+        self.scheduler.set_interval(dpid, 1e-3)
+        self.assertLess(self.scheduler._deadlines[dpid], deadline)
+
+        self.scheduler.remove(dpid)
+        self.assertEqual(self.scheduler.intervals, {})
+        self.assertEqual(self.scheduler.interval_of(dpid), 60)
+
+
+class TestAdaptiveInterval(TestCase):
+    """Test AdaptiveInterval policy."""
+
+    def setUp(self):
+        """Create a policy with a 60s base interval."""
+        self.policy = AdaptiveInterval(base=60, floor=15, ceiling=600)
+
+    def test_target(self):
+        """Test the target interval of different replies."""
+        self.assertEqual(self.policy.target(10, 0.01, 0), 60)
+        self.assertEqual(self.policy.target(50000, 0.5, 0), 300)
+        self.assertEqual(self.policy.target(100, 20, 0), 200)
+        self.assertEqual(self.policy.target(200000, 0.5, 0), 600)
+        self.assertEqual(self.policy.target(100, 0.01, 10), 40)
+        self.assertEqual(self.policy.target(10, 0.01, 10), 15)
+
+    def test_update(self):
+        """Test the interval converges to its target within its bounds."""
+        interval = 60
+        for _ in range(20):
+            interval = self.policy.update(interval, 50000, 0.5, 0)
+        self.assertAlmostEqual(interval, 300, places=3)
+        self.assertEqual(self.policy.update(60, 200000, 0.5, 0), 330)
+        self.assertEqual(self.policy.update(15, 10, 0.01, 10), 15)
+
+
+async def test_run():
+    """Test the callback is called for each switch at its deadlines."""
+    callback = AsyncMock()
+    scheduler = StatsScheduler(callback, interval=0.05)
+    task = asyncio.create_task(scheduler.run())
+    scheduler.add('00:00:00:00:00:00:00:01')
+    scheduler.add('00:00:00:00:00:00:00:02')
+    await asyncio.sleep(0.12)
+    scheduler.remove('00:00:00:00:00:00:00:02')
+    calls = callback.call_count
+    await asyncio.sleep(0.12)
+    task.cancel()
+
+    dpids = [call[0][0] for call in callback.call_args_list]
+    assert dpids[:calls].count('00:00:00:00:00:00:00:01') >= 2
+    assert dpids[:calls].count('00:00:00:00:00:00:00:02') >= 2
+    assert '00:00:00:00:00:00:00:02' not in dpids[calls:]
+    assert dpids[calls:].count('00:00:00:00:00:00:00:01') >= 2
+
+
+async def test_run_callback_error():
+    """Test a failing callback doesn't stop the other switches."""
+    dpids = []
+
+    async def callback(dpid):
+        dpids.append(dpid)
+        if dpid == 'bad':
+            raise KeyError(dpid)
+
+    scheduler = StatsScheduler(callback, interval=0.05)
+    task = asyncio.create_task(scheduler.run())
+    scheduler.add('bad')
+    scheduler.add('00:00:00:00:00:00:00:01')
+    await asyncio.sleep(0.12)
+    task.cancel()
+
+    assert dpids.count('bad') >= 2
+    assert dpids.count('00:00:00:00:00:00:00:01') >= 2
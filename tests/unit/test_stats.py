@@ -0,0 +1,262 @@
+"""Test stats module."""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pyof.v0x04.controller2switch.common import MultipartType
+
+from napps.kytos.of_core.flow import FlowTable
+from napps.kytos.of_core.reassembly import MultipartReassembler
+from napps.kytos.of_core.scheduler import StatsScheduler
+from napps.kytos.of_core.stats import StatsPoller
+from tests.helpers import get_port_stats
+
+# pylint: disable=protected-access, redefined-outer-name
+
+
+@pytest.fixture
+def poller(controller):
+    """StatsPoller fixture."""
+    return StatsPoller(controller, MultipartReassembler(),
+                       StatsScheduler(AsyncMock()))
+
+
+class TestStatsPoller:
+    """Test StatsPoller methods."""
+
+    @patch('napps.kytos.of_core.stats.aemit_message_out')
+    async def test_poll(self, mock_aemit_message_out, poller, switch_one):
+        """Test poll."""
+        await poller.poll(switch_one)
+        assert mock_aemit_message_out.call_count == 2
+        flow_request, port_request = [
+            call[0][2] for call in mock_aemit_message_out.call_args_list]
+        pending = poller._multipart.pending(switch_one.id)
+        assert [(request.xid, request.multipart_type) for request
+                in pending] == [
+            (int(flow_request.header.xid), MultipartType.OFPMP_FLOW),
+            (int(port_request.header.xid), MultipartType.OFPMP_PORT_STATS)]
+
+        # Requests are sent even if the previous ones are still pending
+        await poller.poll(switch_one)
+        assert mock_aemit_message_out.call_count == 4
+        assert len(poller._multipart.pending(switch_one.id)) == 4
+
+    @patch('napps.kytos.of_core.stats.settings')
+    @patch('napps.kytos.of_core.stats.aemit_message_out')
+    async def test_request_flow_stats(self, mock_aemit_message_out,
+                                      mock_settings, poller, switch_one):
+        """Test flow stats are requested with a request per filter."""
+        mock_settings.STATS_FLOW_FULL_POLLS = 3
+        mock_settings.MULTIPART_MAX_PENDING = 3
+        poller.set_flow_stats_filters('napp', [{'table_id': 1},
+                                               {'table_id': 2}])
+
+        def sent_table_ids():
+            table_ids = [call[0][2].body.table_id for call
+                         in mock_aemit_message_out.call_args_list]
+            mock_aemit_message_out.reset_mock()
+            return table_ids
+
+        # The first poll and every third poll request all the flows
+        for table_ids in ([0xff], [1, 2], [1, 2], [0xff]):
+            await poller._request_flow_stats(switch_one)
+            assert sent_table_ids() == table_ids
+
+        # Up to 3 requests of a poll of all flows, 6 of a filtered poll
+        pending = poller._multipart.pending(switch_one.id)
+        assert len(pending) == 3
+        assert pending[-1].callback.__self__.callback == poller._on_flow_stats
+        assert pending[-2].callback.__self__.callback == \
+            poller._on_flow_slice_stats
+
+        poller.set_flow_stats_filters('napp', [])
+        await poller._request_flow_stats(switch_one)
+        assert sent_table_ids() == [0xff]
+
+    @patch('napps.kytos.of_core.stats.settings')
+    @patch('napps.kytos.of_core.stats.StatsPoller._request_flow_stats')
+    @patch('napps.kytos.of_core.stats.aemit_message_out')
+    async def test_poll_aggregate(self, mock_aemit_message_out,
+                                  mock_request_flow_stats, mock_settings,
+                                  poller, switch_one):
+        """Test aggregate stats are polled between flow stats polls."""
+        mock_settings.STATS_AGGREGATE_POLLS = 3
+        for _ in range(7):
+            await poller.poll(switch_one)
+        # Flow stats at the first poll and once every 3 polls
+        assert mock_request_flow_stats.call_count == 3
+        multipart_types = [call[0][2].multipart_type for call
+                           in mock_aemit_message_out.call_args_list]
+        assert multipart_types.count(MultipartType.OFPMP_AGGREGATE) == 4
+        assert multipart_types.count(MultipartType.OFPMP_PORT_STATS) == 7
+
+        mock_settings.STATS_AGGREGATE_POLLS = 0
+        assert not poller._is_aggregate_poll(switch_one)
+
+    @patch('napps.kytos.of_core.stats.StatsPoller._request_flow_stats')
+    @patch('kytos.core.buffers.KytosEventBuffer.aput')
+    async def test_on_aggregate_stats(self, mock_buffer_aput,
+                                      mock_request_flow_stats, poller,
+                                      switch_one):
+        """Test aggregate stats events and flow stats on count changes."""
+        stats = MagicMock(packet_count=10, byte_count=1000, flow_count=2)
+        request = MagicMock(switch=switch_one, entries=[stats])
+        await poller._on_aggregate_stats(request)
+        event = mock_buffer_aput.call_args[0][0]
+        assert event.name == 'kytos/of_core.aggregate_stats'
+        assert event.content == {'switch': switch_one, 'packet_count': 10,
+                                 'byte_count': 1000, 'flow_count': 2}
+        await poller._on_aggregate_stats(request)
+        mock_request_flow_stats.assert_not_called()
+
+        stats.flow_count = 3
+        await poller._on_aggregate_stats(request)
+        mock_request_flow_stats.assert_called_once_with(switch_one)
+        assert poller._aggregate_polls[switch_one.id] == 1
+
+    @patch('napps.kytos.of_core.stats.StatsPoller._set_switch_flows')
+    async def test_on_flow_slice_stats(self, mock_set_switch_flows, poller,
+                                       switch_one):
+        """Test filtered flow stats are merged into the switch flows."""
+        flows = [MagicMock(id=str(i)) for i in range(4)]
+        switch_one.flows = flows[:3]
+        request = MagicMock(switch=switch_one, entries=[flows[1], flows[3]])
+        await poller._on_flow_slice_stats(request)
+        mock_set_switch_flows.assert_called_with(
+            request, [flows[0], flows[2], flows[1], flows[3]], merge=True)
+
+        # Flows of the last slice are gone if they are not found again
+        switch_one.flows = mock_set_switch_flows.call_args[0][1]
+        request.entries = [flows[3]]
+        await poller._on_flow_slice_stats(request)
+        mock_set_switch_flows.assert_called_with(
+            request, [flows[0], flows[2], flows[3]], merge=True)
+
+        # A flow selected by two filters is kept once
+        request.entries = [flows[3], MagicMock(id='3'), flows[1]]
+        await poller._on_flow_slice_stats(request)
+        mock_set_switch_flows.assert_called_with(
+            request, [flows[0], flows[2], request.entries[1], flows[1]],
+            merge=True)
+
+        request.entries = flows[:2]
+        await poller._on_flow_stats(request)
+        assert switch_one.id not in poller._flow_bases
+        mock_set_switch_flows.assert_called_with(request, flows[:2])
+
+    @patch('napps.kytos.of_core.stats.settings.STATS_ADAPTIVE_INTERVAL',
+           True)
+    def test_adapt_stats_interval(self, poller, switch_one):
+        """Test the stats interval adapts to the flow stats replies."""
+        poller._scheduler.add(switch_one.id)
+        poller._adapt_stats_interval(switch_one, 100, 30, 20)
+        # Halfway from 60s to the 300s a 30s reply needs, halved by churn
+        assert poller._scheduler.intervals == {switch_one.id: 105}
+
+    @patch('napps.kytos.of_core.stats.settings')
+    def test_adapt_stats_interval_disabled(self, mock_settings, poller,
+                                           switch_one):
+        """Test the stats interval is kept if it is not adaptive."""
+        mock_settings.STATS_ADAPTIVE_INTERVAL = False
+        poller._scheduler.add(switch_one.id)
+        poller._adapt_stats_interval(switch_one, 100, 30, 20)
+        assert poller._scheduler.intervals == {
+            switch_one.id: poller._scheduler.interval}
+
+    @patch('napps.kytos.of_core.stats.StatsPoller._adapt_stats_interval')
+    def test_update_flow_table(self, mock_adapt_stats_interval, poller,
+                               switch_one):
+        """Test the delta event between two flow stats of a switch."""
+        flows = [MagicMock(id=str(i)) for i in range(4)]
+        for flow in flows:
+            flow.stats.packet_count = flow.stats.byte_count = 0
+        event = poller._update_flow_table(switch_one, flows[:3], 1)
+        assert event.name == 'kytos/of_core.flow_stats.delta'
+        assert event.content == {'switch': switch_one, 'added': flows[:3],
+                                 'removed': [], 'changed': []}
+        mock_adapt_stats_interval.assert_called_with(switch_one, 3, 1, 0)
+
+        assert poller._update_flow_table(switch_one, flows[:3], 1) is None
+
+        flows[1].stats.packet_count = 1
+        event = poller._update_flow_table(switch_one, flows[1:], 2)
+        assert event.content == {'switch': switch_one, 'added': [flows[3]],
+                                 'removed': [flows[0]],
+                                 'changed': [flows[1]]}
+        mock_adapt_stats_interval.assert_called_with(switch_one, 3, 2, 2)
+
+    @patch('napps.kytos.of_core.stats.StatsPoller._update_flow_table')
+    @patch('kytos.core.buffers.KytosEventBuffer.aput')
+    async def test_on_flow_stats(
+        self,
+        mock_buffer_aput,
+        mock_update_flow_table,
+        switch_one,
+        poller
+    ):
+        """Test _on_flow_stats."""
+        mock_update_flow_table.return_value = None
+        request = poller._multipart.expect(switch_one, 0xABC,
+                                           MultipartType.OFPMP_FLOW,
+                                           poller._on_flow_stats)
+        request.entries = ["ABC"]
+        await poller._on_flow_stats(request)
+
+        assert switch_one.flows == ["ABC"]
+        assert isinstance(switch_one.flows, FlowTable)
+        assert mock_update_flow_table.call_args[0][:2] == (switch_one,
+                                                           ["ABC"])
+        assert mock_buffer_aput.call_count == 1
+        kytos_event = mock_buffer_aput.call_args[0][0]
+        assert kytos_event.name == 'kytos/of_core.flow_stats.received'
+        assert kytos_event.content == {'switch': switch_one,
+                                       'replies_flows': ["ABC"]}
+
+        delta_event = MagicMock()
+        mock_update_flow_table.return_value = delta_event
+        await poller._on_flow_stats(request)
+        assert mock_buffer_aput.call_args[0][0] is delta_event
+
+    def test_on_flow_stats_evicted(self, switch_one, poller):
+        """Test the flow cache drops the flows of evicted requests."""
+        cache = poller._flow_stats_caches[switch_one.id] = MagicMock()
+        poller._on_flow_stats_evicted(MagicMock(switch=switch_one))
+        cache.discard.assert_called()
+
+    @patch('kytos.core.buffers.KytosEventBuffer.aput')
+    async def test_on_port_stats(self, mock_buffer_aput, switch_one, poller):
+        """Test _on_port_stats."""
+        poller._port_stats_rates = MagicMock()
+        request = MagicMock(switch=switch_one, entries=["A", "B"])
+        await poller._on_port_stats(request)
+        poller._port_stats_rates.update.assert_called_with(switch_one.id,
+                                                           ["A", "B"])
+        kytos_event = mock_buffer_aput.call_args[0][0]
+        assert kytos_event.name == 'kytos/of_core.port_stats'
+        assert kytos_event.content == {
+            'switch': switch_one, 'port_stats': ["A", "B"],
+            'port_rates': poller._port_stats_rates.update.return_value,
+            'full': True}
+
+    @patch('napps.kytos.of_core.stats.settings')
+    @patch('kytos.core.buffers.KytosEventBuffer.aput')
+    async def test_on_port_stats_changed_only(self, mock_buffer_aput,
+                                              mock_settings, switch_one,
+                                              poller):
+        """Test only the ports that changed are sent between full polls."""
+        mock_settings.PORT_STATS_CHANGED_ONLY = True
+        mock_settings.PORT_STATS_FULL_POLLS = 3
+        request = MagicMock(switch=switch_one)
+        sent = []
+        for counters in ((1, 1), (1, 2), (2, 3), (2, 3), (2, 3)):
+            request.entries = [get_port_stats(port_no, counter, 10)
+                               for port_no, counter in zip((2, 1), counters)]
+            await poller._on_port_stats(request)
+            content = mock_buffer_aput.call_args[0][0].content
+            sent.append((content['full'],
+                         [int(stats.port_no)
+                          for stats in content['port_stats']],
+                         content['port_rates']['port_no'].tolist()))
+        assert sent == [(True, [2, 1], [1, 2]), (False, [1], [1]),
+                        (False, [2, 1], [1, 2]), (True, [2, 1], [1, 2]),
+                        (False, [], [])]
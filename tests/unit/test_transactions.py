@@ -0,0 +1,77 @@
+"""Test transactions module."""
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from napps.kytos.of_core.transactions import (ErrorReplyException,
+                                              TransactionAborted, Transactions)
+
+# pylint: disable=attribute-defined-outside-init
+
+
+class TestTransactions:
+    """Test Transactions."""
+
+    def setup_method(self):
+        """Create an empty transactions table."""
+        self.transactions = Transactions()
+        self.dpid = '00:00:00:00:00:00:00:01'
+
+    async def test_resolve(self):
+        """Test a future is resolved with the reply to its request."""
+        future = self.transactions.open(self.dpid, 1)
+        assert len(self.transactions) == 1
+        assert not self.transactions.resolve(self.dpid, 2, 'other')
+        assert self.transactions.resolve(self.dpid, 1, 'reply')
+        assert await future == 'reply'
+
+        self.transactions.close(self.dpid, 1)
+        assert len(self.transactions) == 0
+        assert not self.transactions.resolve(self.dpid, 1, 'reply')
+
+    async def test_reply_type(self):
+        """Test only replies of the expected type resolve a request."""
+        future = self.transactions.open(self.dpid, 1, reply_type=21)
+        assert not self.transactions.resolve(self.dpid, 1, 'packet_in', 10)
+        assert not self.transactions.resolve(self.dpid, 1, 'untyped')
+        assert self.transactions.resolve(self.dpid, 1, 'reply', 21)
+        assert await future == 'reply'
+
+        future = self.transactions.open(self.dpid, 2, reply_type=21)
+        assert self.transactions.fail(self.dpid, 2, TransactionAborted('x'))
+        with pytest.raises(TransactionAborted):
+            await future
+
+    async def test_fail(self):
+        """Test a future fails with an error reply."""
+        future = self.transactions.open(self.dpid, 1)
+        error = MagicMock(error_type=1, code=2)
+        self.transactions.fail(self.dpid, 1, ErrorReplyException(error))
+        with pytest.raises(ErrorReplyException) as exc_info:
+            await future
+        assert exc_info.value.error is error
+        assert str(exc_info.value) == 'OFPT_ERROR reply: type 1, code 2'
+
+    async def test_abort(self):
+        """Test aborting all the requests of a switch."""
+        futures = [self.transactions.open(self.dpid, xid) for xid in (1, 2)]
+        other = self.transactions.open('00:00:00:00:00:00:00:02', 1)
+        self.transactions.abort(self.dpid, 'connection lost')
+        for future in futures:
+            with pytest.raises(TransactionAborted):
+                await future
+        assert not other.done()
+
+    async def test_settled_once(self):
+        """Test futures already settled or cancelled are left as they are."""
+        future = self.transactions.open(self.dpid, 1)
+        self.transactions.resolve(self.dpid, 1, 'reply')
+        self.transactions.fail(self.dpid, 1, TransactionAborted('late'))
+        assert await future == 'reply'
+
+        future = self.transactions.open(self.dpid, 2)
+        future.cancel()
+        self.transactions.resolve(self.dpid, 2, 'reply')
+        await asyncio.sleep(0)
+        assert future.cancelled()
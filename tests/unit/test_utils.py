@@ -1,16 +1,24 @@
 """Test utils methods."""
+import asyncio
+import sys
 from unittest import TestCase
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from pyof.v0x04.common.header import Type
+from pyof.v0x04.symmetric.echo_reply import EchoReply
 
 from kytos.lib.helpers import (get_connection_mock, get_controller_mock,
                                get_switch_mock)
 from napps.kytos.of_core.msg_prios import of_msg_prio
-from napps.kytos.of_core.utils import (GenericHello, _emit_message,
-                                       _unpack_int, aemit_message_in,
-                                       aemit_message_out, emit_message_in,
-                                       emit_message_out, of_slicer)
+from napps.kytos.of_core.utils import (OF_EVENTS, ConsumersRegistry,
+                                       GenericHello, IngestWorker, LazyMessage,
+                                       ReachableMacCache, ReceiveBuffer,
+                                       _emit_message, _unpack_int,
+                                       aemit_message_in, aemit_message_out,
+                                       aemit_messages_in, emit_message_in,
+                                       emit_message_out, of_event_name,
+                                       of_slicer, peek_eth_source,
+                                       peek_ether_type, peek_of_header)
 
 
 @patch('kytos.core.buffers.KytosEventBuffer.aput')
@@ -35,6 +43,127 @@ async def test_aemit_message_out(controller, switch_one):
     assert kytos_event.priority == of_msg_prio(Type.OFPT_FLOW_MOD.value)
 
 
+@patch('kytos.core.buffers.KytosEventBuffer.aput')
+async def test_aemit_lazy_message_in(controller, switch_one):
+    """Test aemit_message_in doesn't unpack a LazyMessage."""
+    unpack = MagicMock()
+    echo_reply = b'\x04\x03\x00\x08\x00\x00\x00\x01'
+    message = LazyMessage(echo_reply, unpack)
+    await aemit_message_in(controller, switch_one.connection, message)
+    kytos_event = controller.buffers.msg_in.aput.call_args[0][0]
+    assert kytos_event.name == \
+        'kytos/of_core.v0x04.messages.in.ofpt_echo_reply'
+    assert kytos_event.priority == of_msg_prio(Type.OFPT_ECHO_REPLY.value)
+    assert kytos_event.message is message
+    unpack.assert_not_called()
+
+
+@patch('kytos.core.buffers.KytosEventBuffer.aput')
+async def test_aemit_messages_in(controller, switch_one):
+    """Test aemit_messages_in keeps order and per message priority."""
+    msg_types = [Type.OFPT_PACKET_IN, Type.OFPT_FLOW_MOD, Type.OFPT_PACKET_IN]
+    messages = []
+    for msg_type in msg_types:
+        mock_message = MagicMock()
+        mock_message.header.message_type.value = msg_type.value
+        messages.append(mock_message)
+    await aemit_messages_in(controller, switch_one.connection, messages)
+    assert controller.buffers.msg_in.aput.call_count == len(messages)
+    for call, message, msg_type in zip(
+        controller.buffers.msg_in.aput.call_args_list, messages, msg_types
+    ):
+        kytos_event = call[0][0]
+        assert kytos_event.message is message
+        assert kytos_event.priority == of_msg_prio(msg_type.value)
+
+
+async def test_ingest_worker():
+    """Test IngestWorker keeps chunks in order and waits while full."""
+    release = asyncio.Event()
+    processed = []
+
+    async def process(_connection, rx_buffer):
+        await release.wait()
+        packets, _ = of_slicer(rx_buffer)
+        processed.extend(bytes(packet) for packet in packets)
+
+    worker = IngestWorker(MagicMock(), process, maxsize=1)
+    worker.start()
+    hellos = [bytes([4, 0, 0, 8, 0, 0, 0, xid]) for xid in range(3)]
+    await worker.put(hellos[0][:5])
+    # Waits for the worker to take the first chunk
+    await worker.put(hellos[0][5:] + hellos[1])
+    assert worker.metrics['blocked_puts'] == 1
+    blocked_put = asyncio.create_task(worker.put(hellos[2]))
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert not blocked_put.done()
+    assert worker.metrics['blocked_puts'] == 2
+    assert worker.metrics['queue_size'] == 1
+
+    release.set()
+    await blocked_put
+    await worker.join()
+    assert processed == hellos
+    assert worker.metrics == {'queue_size': 0, 'queue_max_size': 1,
+                              'high_watermark': 1, 'blocked_puts': 2,
+                              'waiting_puts': 0, 'processed_chunks': 3}
+    worker.stop()
+
+
+async def test_ingest_worker_stop():
+    """Test stopping IngestWorker releases the waiting puts."""
+    async def process(_connection, _rx_buffer):
+        await asyncio.Event().wait()
+
+    worker = IngestWorker(MagicMock(), process, maxsize=1)
+    worker.start()
+    await worker.put(b'\x04')
+    await asyncio.sleep(0)
+    await worker.put(b'\x00')
+    waiting_puts = [asyncio.create_task(worker.put(b'\x00'))
+                    for _ in range(3)]
+    await asyncio.sleep(0)
+    assert worker.metrics['waiting_puts'] == 3
+
+    worker.stop()
+    await asyncio.wait_for(asyncio.gather(*waiting_puts), 1)
+    await asyncio.wait_for(worker.join(), 1)
+    assert worker.metrics['waiting_puts'] == 0
+    assert worker.metrics['queue_size'] == 0
+    await worker.put(b'\x00')
+    assert worker.metrics['queue_size'] == 0
+    assert worker.task.cancelled()
+
+
+async def test_ingest_worker_process_error():
+    """Test IngestWorker keeps processing chunks after an error."""
+    process = AsyncMock(side_effect=[ValueError, None])
+    worker = IngestWorker(MagicMock(), process)
+    worker.start()
+    await worker.put(b'\x04')
+    await worker.put(b'\x00')
+    await worker.join()
+    assert process.call_count == 2
+    assert worker.rx_buffer.remaining_data == b'\x04\x00'
+    worker.stop()
+
+
+async def test_ingest_worker_unexpected_error():
+    """Test IngestWorker stops after an unexpected error."""
+    process = AsyncMock(side_effect=RuntimeError)
+    worker = IngestWorker(MagicMock(), process, maxsize=1)
+    worker.start()
+    await worker.put(b'\x04')
+    await asyncio.wait_for(asyncio.gather(worker.task,
+                                          return_exceptions=True), 1)
+    await asyncio.sleep(0)
+    assert worker.stopped
+    await asyncio.wait_for(worker.put(b'\x00'), 1)
+    await asyncio.wait_for(worker.put(b'\x00'), 1)
+    assert worker.metrics['queue_size'] == 0
+
+
 class TestUtils(TestCase):
     """Test utils."""
 
@@ -81,6 +210,17 @@ class TestUtils(TestCase):
         self.assertCountEqual(response[0], [])
         self.assertCountEqual(response[1], [])
 
+    def test_of_slicer_receive_buffer(self):
+        """Test of_slicer walking a ReceiveBuffer."""
+        hello = b'\x04\x00\x00\x08\x00\x00\x00\x01'
+        rx_buffer = ReceiveBuffer(hello + hello[:5])
+        packets, remaining = of_slicer(rx_buffer)
+        self.assertIs(remaining, rx_buffer)
+        self.assertEqual(len(packets), 1)
+        self.assertIsInstance(packets[0], memoryview)
+        self.assertEqual(bytes(packets[0]), hello)
+        self.assertEqual(rx_buffer.remaining_data, hello[:5])
+
     def test_unpack_int(self):
         """Test test_unpack_int."""
         mock_packet = MagicMock()
@@ -110,6 +250,202 @@ class TestUtils(TestCase):
         emit_message_out(self.mock_controller, self.mock_connection, 'in')
         mock_message_in.assert_called()
 
+    def test_peek_of_header(self):
+        """Test peek_of_header."""
+        packet = b'\x04\x13\x00\x10\x00\x00\x0a\xbc' + bytes(8)
+        header = (4, 19, 16, 0xABC)
+        self.assertEqual(peek_of_header(packet), header)
+        self.assertEqual(peek_of_header(memoryview(packet)), header)
+
+    def test_peek_ether_type(self):
+        """Test peek_ether_type skips 802.1Q and QinQ tags."""
+        header = b'\xff' * 6 + b'\xf2\x0b\xa4\x7d\xf8\xea'
+        arp = b'\x08\x06' + bytes(28)
+        self.assertEqual(peek_ether_type(header + arp), 0x0806)
+        dot1q = b'\x81\x00\x00\x0a'
+        self.assertEqual(peek_ether_type(header + dot1q + arp), 0x0806)
+        qinq = b'\x88\xa8\x00\x14' + dot1q
+        self.assertEqual(peek_ether_type(header + qinq + arp), 0x0806)
+        self.assertIsNone(peek_ether_type(header + qinq))
+        self.assertIsNone(peek_ether_type(header[:10]))
+
+    def test_peek_eth_source(self):
+        """Test peek_eth_source."""
+        frame = b'\xff' * 6 + b'\xf2\x0b\xa4\x7d\xf8\xea\x08\x06'
+        self.assertEqual(peek_eth_source(frame), 'f2:0b:a4:7d:f8:ea')
+
+    def test_of_events(self):
+        """Test OF_EVENTS interned event names and priorities."""
+        name, prio = OF_EVENTS[4, Type.OFPT_PACKET_IN.value, 'in']
+        self.assertEqual(name,
+                         'kytos/of_core.v0x04.messages.in.ofpt_packet_in')
+        self.assertIs(name, sys.intern(name))
+        self.assertEqual(prio, of_msg_prio(Type.OFPT_PACKET_IN.value))
+        name, _ = OF_EVENTS[4, Type.OFPT_FLOW_MOD.value, 'out']
+        self.assertEqual(name,
+                         'kytos/of_core.v0x04.messages.out.ofpt_flow_mod')
+
+    def test_of_event_name(self):
+        """Test of_event_name."""
+        self.assertEqual(of_event_name(4, Type.OFPT_ECHO_REQUEST.value, 'in'),
+                         'kytos/of_core.v0x04.messages.in.ofpt_echo_request')
+        with self.assertRaises(ValueError):
+            of_event_name(4, 200, 'in')
+
+
+class TestLazyMessage(TestCase):
+    """Test LazyMessage."""
+
+    echo_reply = b'\x04\x03\x00\x08\x00\x00\x00\x01'
+
+    def test_unpack_on_access(self):
+        """Test the message is unpacked once on attribute access."""
+        unpack = MagicMock()
+        message = LazyMessage(self.echo_reply, unpack)
+        self.assertEqual(message.of_header, (4, 3, 8, 1))
+        self.assertFalse(message.is_unpacked)
+        unpack.assert_not_called()
+
+        self.assertEqual(message.header, unpack.return_value.header)
+        self.assertEqual(message.data, unpack.return_value.data)
+        self.assertTrue(message.is_unpacked)
+        unpack.assert_called_once_with(self.echo_reply)
+
+    def test_message_type(self):
+        """Test the message type and isinstance checks don't unpack it."""
+        unpack = MagicMock(return_value=EchoReply(xid=1))
+        message = LazyMessage(self.echo_reply, unpack)
+        self.assertIsInstance(message, LazyMessage)
+        self.assertNotIsInstance(message, EchoReply)
+        self.assertEqual(message.message_type, Type.OFPT_ECHO_REPLY)
+        unpack.assert_not_called()
+        self.assertEqual(message.header.message_type, Type.OFPT_ECHO_REPLY)
+        unpack.assert_called_once_with(self.echo_reply)
+
+
+class TestConsumersRegistry(TestCase):
+    """Test ConsumersRegistry."""
+
+    def test_has_consumers(self):
+        """Test has_consumers caches until the listeners change."""
+        controller = MagicMock()
+        controller.events_listeners = {
+            'kytos/of_core.v0x04.messages.in.ofpt_echo_request': [],
+        }
+        registry = ConsumersRegistry(controller)
+        echo_reply = 'kytos/of_core.v0x04.messages.in.ofpt_echo_reply'
+        self.assertFalse(registry.has_consumers(echo_reply))
+        self.assertTrue(registry.has_consumers(
+            'kytos/of_core.v0x04.messages.in.ofpt_echo_request'))
+
+        controller.events_listeners['.*.messages.in.ofpt_echo_.*'] = []
+        self.assertFalse(registry.has_consumers(echo_reply))
+        registry.refresh()
+        self.assertTrue(registry.has_consumers(echo_reply))
+
+    def test_refresh_swapped_listener(self):
+        """Test a listener swapped for another one clears the cache."""
+        controller = MagicMock()
+        controller.events_listeners = {'.*.ofpt_echo_request': []}
+        registry = ConsumersRegistry(controller)
+        echo_reply = 'kytos/of_core.v0x04.messages.in.ofpt_echo_reply'
+        self.assertFalse(registry.has_consumers(echo_reply))
+
+        del controller.events_listeners['.*.ofpt_echo_request']
+        controller.events_listeners['.*.ofpt_echo_reply'] = []
+        registry.refresh()
+        self.assertTrue(registry.has_consumers(echo_reply))
+
+
+class TestReachableMacCache(TestCase):
+    """Test ReachableMacCache."""
+
+    def setUp(self):
+        """Create a cache with a fake clock."""
+        self.now = 0
+        self.cache = ReachableMacCache(capacity=2, ttl=10,
+                                       clock=lambda: self.now)
+
+    def test_is_new(self):
+        """Test MACs are new until seen on the same port again."""
+        mac = 'f2:0b:a4:7d:f8:ea'
+        self.assertTrue(self.cache.is_new('dpid', 1, mac))
+        self.assertFalse(self.cache.is_new('dpid', 1, mac))
+        self.assertTrue(self.cache.is_new('other_dpid', 1, mac))
+        # Moved to another port
+        self.assertTrue(self.cache.is_new('dpid', 2, mac))
+        self.assertFalse(self.cache.is_new('dpid', 2, mac))
+        self.assertEqual(self.cache.metrics, {'size': 2, 'hits': 2,
+                                              'misses': 3, 'evictions': 0})
+
+    def test_is_new_expired(self):
+        """Test MACs are new again once their entry expires."""
+        mac = 'f2:0b:a4:7d:f8:ea'
+        self.assertTrue(self.cache.is_new('dpid', 1, mac))
+        self.now = 9
+        self.assertFalse(self.cache.is_new('dpid', 1, mac))
+        self.now = 10
+        self.assertTrue(self.cache.is_new('dpid', 1, mac))
+        self.assertFalse(self.cache.is_new('dpid', 1, mac))
+
+    def test_eviction(self):
+        """Test the least recently seen MAC is evicted."""
+        macs = ['00:00:00:00:00:01', '00:00:00:00:00:02', '00:00:00:00:00:03']
+        self.cache.is_new('dpid', 1, macs[0])
+        self.cache.is_new('dpid', 1, macs[1])
+        self.assertFalse(self.cache.is_new('dpid', 1, macs[0]))
+        self.cache.is_new('dpid', 1, macs[2])
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertFalse(self.cache.is_new('dpid', 1, macs[0]))
+        self.assertTrue(self.cache.is_new('dpid', 1, macs[1]))
+
+
+class TestReceiveBuffer(TestCase):
+    """Test ReceiveBuffer."""
+
+    hello = b'\x04\x00\x00\x08\x00\x00\x00\x01'
+
+    def test_feed_split_packet(self):
+        """Test a packet split across two chunks."""
+        rx_buffer = ReceiveBuffer()
+        rx_buffer.feed(self.hello + self.hello[:3])
+        self.assertEqual([bytes(f) for f in rx_buffer.frames()], [self.hello])
+        self.assertEqual(len(rx_buffer), 3)
+        rx_buffer.feed(self.hello[3:])
+        self.assertEqual([bytes(f) for f in rx_buffer.frames()], [self.hello])
+        self.assertEqual(len(rx_buffer), 0)
+
+    def test_packets_single_packet(self):
+        """Test a chunk with a single packet is returned as it is."""
+        rx_buffer = ReceiveBuffer()
+        rx_buffer.feed(self.hello)
+        packets = rx_buffer.packets()
+        self.assertEqual(len(packets), 1)
+        self.assertIs(packets[0], self.hello)
+        self.assertEqual(len(rx_buffer), 0)
+        rx_buffer.feed(self.hello + self.hello[:3])
+        self.assertEqual([bytes(f) for f in rx_buffer.packets()],
+                         [self.hello])
+        rx_buffer.feed(self.hello[3:])
+        self.assertEqual([bytes(f) for f in rx_buffer.packets()],
+                         [self.hello])
+
+    def test_unread(self):
+        """Test putting packets back in front of the remaining data."""
+        rx_buffer = ReceiveBuffer(self.hello * 2 + b'\x04')
+        frames = list(rx_buffer.frames())
+        rx_buffer.unread(frames[1:])
+        self.assertEqual(rx_buffer.remaining_data, self.hello + b'\x04')
+
+    def test_feed_with_referenced_frame(self):
+        """Test compacting while a frame is still referenced."""
+        rx_buffer = ReceiveBuffer(self.hello * 2)
+        frames = list(rx_buffer.frames())
+        rx_buffer.feed(self.hello)
+        self.assertEqual(bytes(frames[1]), self.hello)
+        self.assertEqual([bytes(f) for f in rx_buffer.frames()], [self.hello])
+
 
 class TestGenericHello(TestCase):
     """Test GenericHello."""
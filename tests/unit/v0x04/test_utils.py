@@ -4,13 +4,16 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 from pyof.v0x04.common.port import PortNo, PortState
+from pyof.v0x04.controller2switch.common import MultipartType
+from pyof.v0x04.controller2switch.multipart_request import FlowStatsRequest
 
 from kytos.lib.helpers import (get_connection_mock, get_controller_mock,
                                get_switch_mock)
-from napps.kytos.of_core.v0x04.utils import (handle_features_reply,
-                                             handle_port_desc, say_hello,
-                                             send_desc_request, send_echo,
-                                             send_port_request,
+from napps.kytos.of_core.v0x04.utils import (asend_echo, handle_features_reply,
+                                             handle_port_desc,
+                                             multipart_stats_request,
+                                             say_hello, send_desc_request,
+                                             send_echo, send_port_request,
                                              send_set_config,
                                              try_to_activate_interface)
 
@@ -22,6 +25,13 @@ async def test_say_hello(mock_aemit_message_out, controller, switch_one):
     mock_aemit_message_out.assert_called()
 
 
+@patch('napps.kytos.of_core.v0x04.utils.aemit_message_out')
+async def test_asend_echo(mock_aemit_message_out, controller, switch_one):
+    """Test asend_echo."""
+    await asend_echo(controller, switch_one)
+    mock_aemit_message_out.assert_called()
+
+
 @patch('kytos.core.buffers.KytosEventBuffer.aput')
 async def test_handle_port_desc(mock_event_buffer, controller, switch_one):
     """Test Handle Port Desc."""
@@ -74,6 +84,30 @@ def test_try_to_activate_interface(state, port_no, should_activate) -> None:
         interface.deactivate.assert_called()
 
 
+@pytest.mark.parametrize("multipart_type,body_type", [
+    (MultipartType.OFPMP_FLOW, 'FlowStatsRequest'),
+    (MultipartType.OFPMP_AGGREGATE, 'AggregateStatsRequest'),
+    (MultipartType.OFPMP_PORT_STATS, 'PortStatsRequest'),
+    (MultipartType.OFPMP_GROUP, 'GroupStatsRequest'),
+    (MultipartType.OFPMP_METER, 'MeterMultipartRequest'),
+    (MultipartType.OFPMP_TABLE, 'bytes'),
+    (MultipartType.OFPMP_DESC, 'bytes'),
+])
+def test_multipart_stats_request(multipart_type, body_type) -> None:
+    """Test multipart_stats_request builds a packable request."""
+    request = multipart_stats_request(multipart_type)
+    assert request.multipart_type == multipart_type
+    assert type(request.body).__name__ == body_type
+    assert request.pack()
+
+
+def test_multipart_stats_request_body() -> None:
+    """Test multipart_stats_request with a filtering body."""
+    body = FlowStatsRequest(table_id=1)
+    request = multipart_stats_request(MultipartType.OFPMP_FLOW, body)
+    assert request.body is body
+
+
 class TestUtils(TestCase):
     """Test utils."""
 
@@ -0,0 +1,89 @@
+"""Futures of the requests sent to switches, resolved by their replies."""
+import asyncio
+
+
+class ErrorReplyException(Exception):
+    """Exception raised when a switch replies to a request with an error."""
+
+    def __init__(self, error):
+        """Keep the OFPT_ERROR message replied by the switch."""
+        super().__init__(f'type {error.error_type}, code {error.code}')
+        self.error = error
+
+    def __str__(self):
+        return "OFPT_ERROR reply: " + super().__str__()
+
+
+class TransactionAborted(Exception):
+    """Exception raised when a request is abandoned before its reply."""
+
+    def __str__(self):
+        return "Request aborted: " + super().__str__()
+
+
+class Transactions:
+    """Table of the futures of the requests waiting for a reply.
+
+    Futures are kept by switch and xid. They are created from the event
+    loop, but can be resolved or failed from any thread.
+    """
+
+    def __init__(self):
+        self._futures = {}
+
+    def __len__(self):
+        return sum(len(futures) for futures in self._futures.values())
+
+    def open(self, dpid, xid, reply_type=None):
+        """Return the future of a request about to be sent to a switch.
+
+        If ``reply_type`` is given, only replies of that type resolve it.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._futures.setdefault(dpid, {})[xid] = (future, reply_type)
+        return future
+
+    def close(self, dpid, xid):
+        """Forget the future of a request, once it is settled or given up."""
+        futures = self._futures.get(dpid, {})
+        futures.pop(xid, None)
+        if not futures:
+            self._futures.pop(dpid, None)
+
+    def resolve(self, dpid, xid, reply, reply_type=None):
+        """Resolve the future of a request with its reply, if any.
+
+        Return True if the reply was awaited. Messages of other types than
+        the reply the request was opened with are ignored.
+        """
+        return self._settle(dpid, xid, reply, None, reply_type)
+
+    def fail(self, dpid, xid, exc):
+        """Fail the future of a request with ``exc``, if any."""
+        return self._settle(dpid, xid, None, exc)
+
+    def abort(self, dpid, reason):
+        """Fail the futures of all the requests of a switch."""
+        for xid in list(self._futures.get(dpid, {})):
+            self.fail(dpid, xid, TransactionAborted(reason))
+
+    def _settle(self, dpid, xid, reply, exc, reply_type=None):
+        future, expected_type = self._futures.get(dpid, {}).get(xid,
+                                                                (None, None))
+        if future is None:
+            return False
+        if exc is None and expected_type not in (None, reply_type):
+            return False
+        future.get_loop().call_soon_threadsafe(_set_future, future, reply,
+                                               exc)
+        return True
+
+
+def _set_future(future, reply, exc):
+    # Whoever awaited it may have given up already
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(reply)
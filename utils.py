@@ -1,35 +1,510 @@
 """of_core utility functions and classes."""
 
+import asyncio
+import re
 import struct
+import sys
+import time
 from collections import OrderedDict
+from threading import Lock
 
 from pyof.foundation.exceptions import PackException, UnpackException
+from pyof.foundation.network_types import EtherType
 from pyof.v0x04.common.header import Type as OFPTYPE
 
-from kytos.core import KytosEvent
+from kytos.core import KytosEvent, log
 from napps.kytos.of_core import settings
 from napps.kytos.of_core.msg_prios import of_msg_prio
 
+#: OpenFlow header: version, type, length and xid
+OF_HEADER = struct.Struct('!BBHI')
+#: Type and flags following the header of a multipart message
+MULTIPART_HEADER = struct.Struct('!HH')
+
+_ETHER_TYPE = struct.Struct('!H')
+_VLAN_TPIDS = (EtherType.VLAN, EtherType.VLAN_QINQ)
+
 
 def of_slicer(remaining_data):
-    """Slice a raw `bytes` instance into OpenFlow packets."""
-    data_len = len(remaining_data)
-    pkts = []
-    while data_len > 3:
-        length_field = struct.unpack('!H', remaining_data[2:4])[0]
-        ofver = remaining_data[0]
-        # sanity checks: badly formatted packet
-        if ofver not in settings.ALL_OPENFLOW_VERSIONS or length_field == 0:
-            remaining_data = remaining_data[4:]
-            data_len = len(remaining_data)
-            continue
-        if data_len >= length_field:
-            pkts.append(remaining_data[:length_field])
-            remaining_data = remaining_data[length_field:]
-            data_len = len(remaining_data)
-        else:
-            break
-    return pkts, remaining_data
+    """Slice a raw `bytes` instance into OpenFlow packets.
+
+    A :class:`ReceiveBuffer` can also be given, in which case the packets
+    are ``memoryview`` frames over the buffer and the buffer itself keeps
+    the remaining data, so nothing is copied while slicing.
+    """
+    if isinstance(remaining_data, ReceiveBuffer):
+        return remaining_data.packets(), remaining_data
+    rx_buffer = ReceiveBuffer(remaining_data)
+    pkts = [bytes(frame) for frame in rx_buffer.frames()]
+    return pkts, rx_buffer.remaining_data
+
+
+class ReceiveBuffer:
+    """Per-connection buffer of raw data received from a switch.
+
+    Data is appended to a ``bytearray`` and consumed by advancing an offset,
+    so slicing a chunk with many messages doesn't copy what is left after
+    each packet. Consumed bytes are only discarded (compacted) when new data
+    is fed, which at that point is at most one partial packet.
+
+    A chunk fed to an empty buffer is kept as it is and only copied to the
+    ``bytearray`` if part of it is still left when more data is fed. A chunk
+    with exactly one packet, the usual case for small control messages, is
+    then yielded as the frame itself.
+    """
+
+    def __init__(self, data=b''):
+        """Start the buffer with optional initial ``data``."""
+        self._data = bytearray(data)
+        self._offset = 0
+
+    def __len__(self):
+        return len(self._data) - self._offset
+
+    @property
+    def remaining_data(self):
+        """Return a copy of the data that hasn't been consumed yet."""
+        return bytes(self._data[self._offset:])
+
+    def feed(self, data):
+        """Append newly received ``data`` to the buffer."""
+        if self._offset >= len(self._data):
+            self._data = bytes(data)
+            self._offset = 0
+            return
+        if self._offset:
+            self._compact()
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data)
+        self._data += data
+
+    def unread(self, packets):
+        """Put ``packets`` back in front of the remaining data."""
+        if not packets:
+            return
+        self._data = bytearray(b''.join(packets)) + \
+            self._data[self._offset:]
+        self._offset = 0
+
+    def packets(self):
+        """Return a list with the frames of the complete OpenFlow packets.
+
+        A chunk that was fed to an empty buffer and holds exactly one packet
+        is returned as it is, without walking it.
+        """
+        data = self._data
+        data_len = len(data)
+        if not self._offset and isinstance(data, bytes) \
+                and 3 < data_len == (data[2] << 8) | data[3] \
+                and data[0] in settings.ALL_OPENFLOW_VERSIONS:
+            self._offset = data_len
+            return [data]
+        return list(self.frames())
+
+    def frames(self):
+        """Yield ``memoryview`` frames of the complete OpenFlow packets.
+
+        The frames are only valid until the buffer is fed again. Each frame
+        is consumed as soon as it is yielded.
+        """
+        data = self._data
+        data_len = len(data)
+        offset = self._offset
+        view = memoryview(data)
+        try:
+            while data_len - offset > 3:
+                length_field = (data[offset + 2] << 8) | data[offset + 3]
+                ofver = data[offset]
+                # sanity checks: badly formatted packet
+                if ofver not in settings.ALL_OPENFLOW_VERSIONS or \
+                        length_field == 0:
+                    offset += 4
+                    self._offset = offset
+                    continue
+                if data_len - offset < length_field:
+                    break
+                frame = view[offset:offset + length_field]
+                offset += length_field
+                self._offset = offset
+                yield frame
+        finally:
+            view.release()
+
+    def _compact(self):
+        """Discard the data that has already been consumed."""
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data[self._offset:])
+            self._offset = 0
+            return
+        try:
+            del self._data[:self._offset]
+        except BufferError:
+            # A frame is still referenced, so leave the old array to it
+            self._data = self._data[self._offset:]
+        self._offset = 0
+
+
+class IngestWorker:
+    """Process the raw data of one connection in its own asyncio task.
+
+    Raw chunks are put in a bounded queue and handed, in arrival order, to
+    ``process(connection, rx_buffer)`` by a task that owns the connection's
+    :class:`ReceiveBuffer`, so a connection whose data takes long to process
+    doesn't hold up the others, and the task yields to the event loop after
+    every chunk.
+
+    Once the queue is full, :meth:`put` waits for the task to catch up.
+    That doesn't slow down the switch, since every raw data event is handled
+    in its own task: the chunks of waiting puts are kept in memory until
+    they are queued. They are counted by the ``waiting_puts`` metric.
+    """
+
+    def __init__(self, connection, process, maxsize=None):
+        """Create the worker of ``connection``, call :meth:`start` to run it.
+
+        Args:
+            connection (Connection): Connection whose data is processed.
+            process (coroutine function): Called with the connection and
+                its receive buffer after each chunk is fed to the buffer.
+            maxsize (int): Maximum number of queued chunks, defaults to
+                ``settings.INGEST_QUEUE_SIZE``.
+        """
+        self.connection = connection
+        self.rx_buffer = ReceiveBuffer()
+        if maxsize is None:
+            maxsize = settings.INGEST_QUEUE_SIZE
+        self.queue = asyncio.Queue(maxsize)
+        self.task = None
+        self.stopped = False
+        self.high_watermark = 0
+        self.blocked_puts = 0
+        self.waiting_puts = 0
+        self.processed_chunks = 0
+        self._process = process
+        # asyncio.Lock is fair, so blocked puts are queued in call order
+        self._put_lock = asyncio.Lock()
+
+    @property
+    def metrics(self):
+        """Return the queue depth metrics of this worker."""
+        return {'queue_size': self.queue.qsize(),
+                'queue_max_size': self.queue.maxsize,
+                'high_watermark': self.high_watermark,
+                'blocked_puts': self.blocked_puts,
+                'waiting_puts': self.waiting_puts,
+                'processed_chunks': self.processed_chunks}
+
+    def start(self):
+        """Start the task that processes the queued chunks."""
+        self.task = asyncio.create_task(self._run())
+        self.task.add_done_callback(self._on_task_done)
+
+    def stop(self):
+        """Cancel the task and drop the queued chunks.
+
+        Waiting puts are released and drop their chunks, as do any later
+        puts.
+        """
+        self.stopped = True
+        if self.task:
+            self.task.cancel()
+        self._drain()
+
+    async def put(self, data):
+        """Queue a raw chunk, waiting while the queue is full.
+
+        The chunk is dropped if the worker is stopped.
+        """
+        self.waiting_puts += 1
+        try:
+            async with self._put_lock:
+                if self.stopped:
+                    return
+                if self.queue.full():
+                    self.blocked_puts += 1
+                await self.queue.put(data)
+                if self.stopped:
+                    self._drain()
+                    return
+                self.high_watermark = max(self.high_watermark,
+                                          self.queue.qsize())
+        finally:
+            self.waiting_puts -= 1
+
+    async def join(self):
+        """Wait until all queued chunks have been processed."""
+        await self.queue.join()
+
+    def _on_task_done(self, task):
+        """Stop the worker if its task ended with an unexpected error."""
+        if task.cancelled() or not task.exception():
+            return
+        log.error(f'Connection {self.connection.id}: stopped processing'
+                  f' raw data: {task.exception()!r}')
+        self.stop()
+
+    def _drain(self):
+        """Drop the queued chunks, waking up a put waiting for room."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+
+    async def _run(self):
+        """Feed the queued chunks to the buffer and process them."""
+        while True:
+            data = await self.queue.get()
+            try:
+                self.rx_buffer.feed(data)
+                await self._process(self.connection, self.rx_buffer)
+            except (PackException, UnpackException, struct.error,
+                    IndexError, KeyError, ValueError) as exc:
+                log.exception(f'Connection {self.connection.id}: failed to'
+                              f' process raw data: {exc}')
+            finally:
+                self.processed_chunks += 1
+                self.queue.task_done()
+            await asyncio.sleep(0)
+
+
+def peek_of_header(packet):
+    """Return version, type, length and xid read from a raw OpenFlow header.
+
+    Nothing is unpacked besides the first 8 bytes of ``packet``.
+    """
+    return OF_HEADER.unpack_from(packet)
+
+
+def peek_multipart_header(packet):
+    """Return multipart type and flags read from a raw multipart message."""
+    return MULTIPART_HEADER.unpack_from(packet, OF_HEADER.size)
+
+
+def peek_ether_type(frame):
+    """Return the ethertype of a raw Ethernet frame, skipping VLAN tags.
+
+    802.1Q and QinQ tags are skipped the same way ``Ethernet.unpack`` does,
+    reading the header in place. Return None if the frame is truncated.
+    """
+    offset = 12
+    try:
+        ether_type, = _ETHER_TYPE.unpack_from(frame, offset)
+        while ether_type in _VLAN_TPIDS:
+            offset += 4
+            ether_type, = _ETHER_TYPE.unpack_from(frame, offset)
+    except struct.error:
+        return None
+    return ether_type
+
+
+def peek_eth_source(frame):
+    """Return the source MAC address of a raw Ethernet frame.
+
+    The address is formatted as ``Ethernet().source.value``, e.g.
+    ``'f2:0b:a4:7d:f8:ea'``.
+    """
+    return frame[6:12].hex(':')
+
+
+def of_event_name(version, msg_type, direction):
+    """Return the KytosEvent name of an OpenFlow message type."""
+    name = OFPTYPE(msg_type).name.lower()
+    return f"kytos/of_core.v0x{version:02x}.messages.{direction}.{name}"
+
+
+class LazyMessage:
+    """OpenFlow message that is only unpacked when it is actually used.
+
+    ``of_header`` is read straight from the raw packet, so the message can
+    be dispatched without unpacking it. The pyof message is unpacked on the
+    first access to any of its attributes, which are then proxied to it.
+    Since isinstance() checks against pyof classes don't unpack it, they
+    don't match; :attr:`message_type` tells the type without unpacking.
+    """
+
+    __slots__ = ('packet', 'of_header', '_unpack', '_message')
+
+    def __init__(self, packet, unpack, of_header=None):
+        """Keep the raw ``packet`` and the ``unpack`` function to use later.
+
+        Args:
+            packet (bytes): Raw OpenFlow message.
+            unpack (callable): Function that returns a pyof message from
+                the raw packet, e.g. ``connection.protocol.unpack``.
+            of_header (tuple): Already peeked header of the packet.
+        """
+        self.packet = packet
+        self.of_header = of_header or peek_of_header(packet)
+        self._unpack = unpack
+        self._message = None
+
+    @property
+    def message(self):
+        """Return the pyof message, unpacking it on first access."""
+        if self._message is None:
+            self._message = self._unpack(self.packet)
+        return self._message
+
+    @property
+    def is_unpacked(self):
+        """Return whether the pyof message has already been unpacked."""
+        return self._message is not None
+
+    @property
+    def message_type(self):
+        """Return the message type read from the raw header."""
+        return OFPTYPE(self.of_header[1])
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.message, name)
+
+
+class ConsumersRegistry:
+    """Tell whether a message event has listeners in the controller.
+
+    Matching an event name against the listeners' patterns is cached. The
+    cache is cleared by :meth:`refresh` whenever the listened patterns have
+    changed, i.e. when NApps are loaded or unloaded.
+    """
+
+    def __init__(self, controller):
+        """Use the ``events_listeners`` of ``controller``."""
+        self.controller = controller
+        self._patterns = None
+        self._cache = {}
+
+    def refresh(self):
+        """Clear the cache if any listened pattern was added or removed.
+
+        The patterns are compared as a whole, so a listener swapped for
+        another one also clears it. Call it once per batch of lookups, e.g.
+        per raw chunk, rather than once per :meth:`has_consumers`.
+        """
+        patterns = tuple(self.controller.events_listeners)
+        if patterns != self._patterns:
+            self._cache.clear()
+            self._patterns = patterns
+
+    def has_consumers(self, event_name):
+        """Return whether any listener pattern matches ``event_name``."""
+        if self._patterns is None:
+            self.refresh()
+        try:
+            return self._cache[event_name]
+        except KeyError:
+            found = any(re.match(pattern, event_name)
+                        for pattern in self._patterns)
+            self._cache[event_name] = found
+            return found
+
+
+class ReachableMacCache:
+    """Bounded, time-aware cache of the MAC addresses seen on each switch.
+
+    Entries are keyed by ``(dpid, mac)`` and store the port the MAC was seen
+    on and when the entry expires, so that a MAC seen again on the same port
+    before ``ttl`` seconds is a hit, while a new, moved or expired MAC is a
+    miss. Once ``capacity`` entries are stored the least recently seen ones
+    are evicted.
+    """
+
+    def __init__(self, capacity=None, ttl=None, clock=time.monotonic):
+        """Create the cache, defaulting to the ``REACHABLE_MAC_*`` settings.
+
+        Args:
+            capacity (int): Maximum number of entries.
+            ttl (float): Seconds until a MAC is reported again.
+            clock (callable): Returns the current time in seconds.
+        """
+        if capacity is None:
+            capacity = settings.REACHABLE_MAC_CACHE_SIZE
+        if ttl is None:
+            ttl = settings.REACHABLE_MAC_CACHE_TTL
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def metrics(self):
+        """Return the cache size and its hit, miss and eviction counters."""
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+    def is_new(self, dpid, port_no, mac):
+        """Store that ``mac`` was seen on a port and return whether it's new.
+
+        A MAC is new if it wasn't in the cache, was last seen on another
+        port of the switch or its entry has expired.
+        """
+        key = (dpid, mac)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == port_no and now < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._entries[key] = (port_no, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+
+def _build_of_events():
+    """Return the event name and priority of every supported message type.
+
+    Event names are interned, so that matching them against listeners and
+    caches compares them by identity most of the time.
+    """
+    of_events = {}
+    for version in settings.OPENFLOW_VERSIONS:
+        for msg_type in OFPTYPE:
+            priority = of_msg_prio(msg_type.value)
+            for direction in ('in', 'out'):
+                name = of_event_name(version, msg_type.value, direction)
+                of_events[version, msg_type.value, direction] = (
+                    sys.intern(name), priority)
+    return of_events
+
+
+#: (version, message type, direction) -> (event name, event priority)
+OF_EVENTS = _build_of_events()
+
+
+def _event_name_and_prio(message, direction):
+    """Return the KytosEvent name and priority of a message.
+
+    The header of a :class:`LazyMessage` is read from its raw packet, so
+    emitting it doesn't unpack the message.
+    """
+    if isinstance(message, LazyMessage):
+        version, msg_type = message.of_header[:2]
+    else:
+        header = message.header
+        version, msg_type = int(header.version), header.message_type.value
+    try:
+        return OF_EVENTS[version, msg_type, direction]
+    except KeyError:
+        pass
+    # pylint: disable=consider-using-f-string
+    hex_version = 'v0x%0.2x' % version
+    name = message.header.message_type.name.lower()
+    return (f"kytos/of_core.{hex_version}.messages.{direction}.{name}",
+            of_msg_prio(msg_type))
 
 
 def _unpack_int(packet, offset=0, size=None):
@@ -40,49 +515,35 @@ def _unpack_int(packet, offset=0, size=None):
     return int.from_bytes(packet[offset:offset + size], byteorder='big')
 
 
-async def _aemit_message(controller, connection, message, direction):
-    """Async emit a KytosEvent for every incoming or outgoing message."""
+def _message_buffer(controller, direction):
+    """Return the controller buffer of incoming or outgoing messages."""
     if direction == 'in':
-        address_type = 'source'
-        message_buffer = controller.buffers.msg_in
-    elif direction == 'out':
-        address_type = 'destination'
-        message_buffer = controller.buffers.msg_out
-    else:
-        raise Exception("direction must be 'in' or 'out'")
+        return controller.buffers.msg_in
+    if direction == 'out':
+        return controller.buffers.msg_out
+    raise Exception("direction must be 'in' or 'out'")
 
-    name = message.header.message_type.name.lower()
-    # pylint: disable=consider-using-f-string
-    hex_version = 'v0x%0.2x' % (message.header.version + 0)
-    priority = of_msg_prio(message.header.message_type.value)
-    of_event = KytosEvent(
-        name=f"kytos/of_core.{hex_version}.messages.{direction}.{name}",
-        priority=priority,
-        content={'message': message,
-                 address_type: connection})
+
+def _message_event(connection, message, direction):
+    """Return the KytosEvent of an incoming or outgoing message."""
+    address_type = 'source' if direction == 'in' else 'destination'
+    name, priority = _event_name_and_prio(message, direction)
+    return KytosEvent(name=name, priority=priority,
+                      content={'message': message,
+                               address_type: connection})
+
+
+async def _aemit_message(controller, connection, message, direction):
+    """Async emit a KytosEvent for every incoming or outgoing message."""
+    message_buffer = _message_buffer(controller, direction)
+    of_event = _message_event(connection, message, direction)
     await message_buffer.aput(of_event)
 
 
 def _emit_message(controller, connection, message, direction):
     """Emit a KytosEvent for every incoming or outgoing message."""
-    if direction == 'in':
-        address_type = 'source'
-        message_buffer = controller.buffers.msg_in
-    elif direction == 'out':
-        address_type = 'destination'
-        message_buffer = controller.buffers.msg_out
-    else:
-        raise Exception("direction must be 'in' or 'out'")
-
-    name = message.header.message_type.name.lower()
-    # pylint: disable=consider-using-f-string
-    hex_version = 'v0x%0.2x' % (message.header.version + 0)
-    priority = of_msg_prio(message.header.message_type.value)
-    of_event = KytosEvent(
-        name=f"kytos/of_core.{hex_version}.messages.{direction}.{name}",
-        priority=priority,
-        content={'message': message,
-                 address_type: connection})
+    message_buffer = _message_buffer(controller, direction)
+    of_event = _message_event(connection, message, direction)
     message_buffer.put(of_event)
 
 
@@ -101,6 +562,20 @@ async def aemit_message_in(controller, connection, message):
     await _aemit_message(controller, connection, message, 'in')
 
 
+async def aemit_messages_in(controller, connection, messages):
+    """Async emit a KytosEvent for each message of a batch, in order.
+
+    Each event keeps its own :func:`of_msg_prio` priority. The core buffers
+    have no bulk put, so every event is still enqueued with its own
+    ``aput``.
+    """
+    of_events = [_message_event(connection, message, 'in')
+                 for message in messages]
+    message_buffer = controller.buffers.msg_in
+    for of_event in of_events:
+        await message_buffer.aput(of_event)
+
+
 async def aemit_message_out(controller, connection, message):
     """Async emit a KytosEvent for every outgoing message."""
     await _aemit_message(controller, connection, message, 'out')
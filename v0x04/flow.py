@@ -1,6 +1,8 @@
 """Deal with OpenFlow 1.3 specificities related to flows."""
+import struct
+from collections import OrderedDict
 from itertools import chain
-from typing import Callable, Optional, Type
+from typing import Callable, NamedTuple, Optional, Type
 
 from pyof.foundation.network_types import EtherType
 from pyof.v0x04.common.action import ActionExperimenter
@@ -24,23 +26,33 @@ from pyof.v0x04.common.flow_instructions import \
 from pyof.v0x04.common.flow_instructions import \
     InstructionWriteMetadata as OFInstructionWriteMetadata
 from pyof.v0x04.common.flow_match import Match as OFMatch
-from pyof.v0x04.common.flow_match import (OxmMatchFields, OxmOfbMatchField,
-                                          OxmTLV, VlanId)
+from pyof.v0x04.common.flow_match import (MatchType, OxmClass, OxmMatchFields,
+                                          OxmOfbMatchField, OxmTLV, VlanId)
+from pyof.v0x04.common.port import PortNo
 from pyof.v0x04.controller2switch.flow_mod import FlowMod
+from pyof.v0x04.controller2switch.group_mod import Group
+from pyof.v0x04.controller2switch.multipart_reply import \
+    FlowStats as OFFlowStats
+from pyof.v0x04.controller2switch.multipart_request import FlowStatsRequest
+from pyof.v0x04.controller2switch.table_mod import Table
 
+from napps.kytos.of_core import settings
 from napps.kytos.of_core.flow import (ActionBase, ActionFactoryBase, FlowBase,
                                       FlowStats, InstructionBase,
                                       InstructionFactoryBase, MatchBase,
-                                      PortStats)
+                                      PortStats, pack_values)
 from napps.kytos.of_core.v0x04.match_fields import MatchFieldFactory
 
 __all__ = ('ActionOutput', 'ActionSetVlan', 'ActionSetQueue', 'ActionPushVlan',
-           'ActionPopVlan', 'Action', 'Flow', 'FlowStats', 'PortStats')
+           'ActionPopVlan', 'Action', 'Flow', 'FlowStats', 'FlowStatsCache',
+           'FlowStatsFilter', 'InternTable', 'PortStats')
 
 
 class Match(MatchBase):
     """High-level Match for OpenFlow 1.3 match fields."""
 
+    __slots__ = ()
+
     @classmethod
     def from_of_match(cls, of_match):
         """Return an instance from a pyof Match."""
@@ -55,18 +67,20 @@ class Match(MatchBase):
     def as_of_match(self):
         """Create an OF Match with TLVs from instance attributes."""
         oxm_fields = OxmMatchFields()
-        for field_name, value in self.__dict__.items():
-            if value is not None:
-                field = MatchFieldFactory.from_name(field_name, value)
-                if field:
-                    tlv = field.as_of_tlv()
-                    oxm_fields.append(tlv)
+        for field_name, value in self._fields.items():
+            field = MatchFieldFactory.from_name(field_name, value)
+            if field:
+                tlv = field.as_of_tlv()
+                oxm_fields.append(tlv)
         return OFMatch(oxm_match_fields=oxm_fields)
 
 
 class ActionOutput(ActionBase):
     """Action with an output port."""
 
+    _fields = ('port', 'action_type')
+    __slots__ = _fields
+
     def __init__(self, port):
         """Require an output port.
 
@@ -89,6 +103,9 @@ class ActionOutput(ActionBase):
 class ActionSetQueue(ActionBase):
     """Action to set a queue for the packet."""
 
+    _fields = ('queue_id', 'action_type')
+    __slots__ = _fields
+
     def __init__(self, queue_id):
         """Require the id of the queue.
 
@@ -111,6 +128,9 @@ class ActionSetQueue(ActionBase):
 class ActionPopVlan(ActionBase):
     """Action to pop the outermost VLAN tag."""
 
+    _fields = ('action_type',)
+    __slots__ = _fields
+
     def __init__(self, *args):  # pylint: disable=unused-argument
         """Initialize the action with the correct action_type."""
         self.action_type = 'pop_vlan'
@@ -128,6 +148,9 @@ class ActionPopVlan(ActionBase):
 class ActionPushVlan(ActionBase):
     """Action to push a VLAN tag."""
 
+    _fields = ('action_type', 'tag_type')
+    __slots__ = _fields
+
     def __init__(self, tag_type):
         """Require a tag_type for the VLAN."""
         self.action_type = 'push_vlan'
@@ -152,6 +175,9 @@ class ActionPushVlan(ActionBase):
 class ActionSetVlan(ActionBase):
     """Action to set VLAN ID."""
 
+    _fields = ('vlan_id', 'action_type')
+    __slots__ = _fields
+
     def __init__(self, vlan_id):
         """Require a VLAN ID."""
         self.vlan_id = vlan_id
@@ -221,6 +247,8 @@ class Action(ActionFactoryBase):
 class InstructionAction(InstructionBase):
     """Base class for instruction dealing with actions."""
 
+    __slots__ = ('instruction_type', 'actions')
+
     _action_factory = Action
     _instruction_type = None
     _of_instruction_class = None
@@ -235,6 +263,28 @@ class InstructionAction(InstructionBase):
                                        for action in self.actions if action]
         return instruction_dict
 
+    def packed(self):
+        """Pack the instruction type and the encodings of the actions.
+
+        Actions keep their own encodings, the instruction only once frozen,
+        since its list of actions can be changed in place.
+        """
+        packed = getattr(self, '_packed', None)
+        if packed is None:
+            actions = [action.packed() for action in self.actions if action]
+            packed = b''.join((pack_values(self.instruction_type),
+                               pack_values(len(actions)), *actions))
+            if self.frozen:
+                object.__setattr__(self, '_packed', packed)
+        return packed
+
+    def freeze(self):
+        """Also freeze the actions and keep them in a tuple."""
+        actions = tuple(action.freeze() if action else action
+                        for action in self.actions)
+        object.__setattr__(self, 'actions', actions)
+        return super().freeze()
+
     @classmethod
     def from_of_instruction(cls, of_instruction):
         """Create high-level Instruction from pyof Instruction."""
@@ -258,6 +308,8 @@ class InstructionAction(InstructionBase):
 class InstructionApplyAction(InstructionAction):
     """Instruct switch to apply the actions."""
 
+    __slots__ = ()
+
     _instruction_type = 'apply_actions'
     _of_instruction_class = OFInstructionApplyAction
 
@@ -265,6 +317,8 @@ class InstructionApplyAction(InstructionAction):
 class InstructionClearAction(InstructionAction):
     """Instruct switch to clear the actions."""
 
+    __slots__ = ()
+
     _instruction_type = 'clear_actions'
     _of_instruction_class = OFInstructionClearAction
 
@@ -272,6 +326,8 @@ class InstructionClearAction(InstructionAction):
 class InstructionWriteAction(InstructionAction):
     """Instruct switch to write the actions."""
 
+    __slots__ = ()
+
     _instruction_type = 'write_actions'
     _of_instruction_class = OFInstructionWriteAction
 
@@ -279,6 +335,9 @@ class InstructionWriteAction(InstructionAction):
 class InstructionGotoTable(InstructionBase):
     """Instruct the switch to move to another table."""
 
+    _fields = ('instruction_type', 'table_id')
+    __slots__ = _fields
+
     def __init__(self, table_id=0):
         self.instruction_type = 'goto_table'
         self.table_id = table_id
@@ -296,6 +355,9 @@ class InstructionGotoTable(InstructionBase):
 class InstructionMeter(InstructionBase):
     """Instruct the switch to apply a meter."""
 
+    _fields = ('instruction_type', 'meter_id')
+    __slots__ = _fields
+
     def __init__(self, meter_id=0):
         self.instruction_type = 'meter'
         self.meter_id = meter_id
@@ -313,6 +375,9 @@ class InstructionMeter(InstructionBase):
 class InstructionWriteMetadata(InstructionBase):
     """Instruct the switch to write metadata."""
 
+    _fields = ('instruction_type', 'metadata', 'metadata_mask')
+    __slots__ = _fields
+
     def __init__(self, metadata=0, metadata_mask=0):
         self.instruction_type = 'write_metadata'
         self.metadata = metadata
@@ -354,6 +419,9 @@ class Flow(FlowBase):
     This is a subclass that only deals with 1.3 flow actions.
     """
 
+    _fields = FlowBase._fields + ('cookie_mask', 'instructions')
+    __slots__ = ('cookie_mask', 'instructions')
+
     _action_factory = Action
     _flow_mod_class = FlowMod
     _match_class = Match
@@ -374,6 +442,23 @@ class Flow(FlowBase):
                                      instruction in self.instructions]
         return flow_dict
 
+    def _frozen_fields(self):
+        """Add the instructions, which are frozen with their actions."""
+        fields = super()._frozen_fields()
+        instructions = tuple(self.instructions)
+        if fields is None or not all(instruction.frozen
+                                     for instruction in instructions):
+            return None
+        return fields + instructions
+
+    def _id_values(self):
+        """Add the cookie mask and instructions to version 2 ids."""
+        instructions = [instruction.packed()
+                        for instruction in self.instructions]
+        return b''.join((super()._id_values(),
+                         pack_values(self.cookie_mask),
+                         pack_values(len(instructions)), *instructions))
+
     @classmethod
     def from_dict(cls, flow_dict, switch):
         """Create a Flow instance from a dictionary."""
@@ -423,3 +508,393 @@ class Flow(FlowBase):
         flow = super().from_of_flow_stats(of_flow_stats, switch)
         flow.instructions = instructions
         return flow
+
+
+class FlowStatsFilter(NamedTuple):
+    """Fields selecting the flows of a flow stats request.
+
+    The defaults select all the flows, as in ``ofp_flow_stats_request``:
+    flows are selected by their table, by their cookie under
+    ``cookie_mask`` and by having an output action to ``out_port`` or a
+    group action to ``out_group``.
+    """
+
+    table_id: int = Table.OFPTT_ALL.value
+    cookie: int = 0
+    cookie_mask: int = 0
+    out_port: int = PortNo.OFPP_ANY.value
+    out_group: int = Group.OFPG_ANY.value
+
+    def as_of_request(self):
+        """Return the pyof FlowStatsRequest body of this filter."""
+        return FlowStatsRequest(table_id=self.table_id,
+                                out_port=self.out_port,
+                                out_group=self.out_group,
+                                cookie=self.cookie,
+                                cookie_mask=self.cookie_mask)
+
+
+#: Offset of the body in a multipart reply
+MULTIPART_BODY_OFFSET = 16
+_ENTRY_LENGTH = struct.Struct('!H')
+_DURATION = struct.Struct('!II')
+_COUNTERS = struct.Struct('!QQ')
+# priority, idle_timeout and hard_timeout, then cookie
+_PRIORITY_TIMEOUTS = struct.Struct('!HHH')
+_COOKIE = struct.Struct('!Q')
+# Offset of the match in an ofp_flow_stats entry
+_MATCH_OFFSET = 48
+# Type and length of matches, instructions and actions, then OXM TLV header
+_TLV_HEADER = struct.Struct('!HH')
+_OXM_HEADER = struct.Struct('!HBB')
+_UINT32 = struct.Struct('!I')
+_METADATA = struct.Struct('!QQ')
+
+
+def flow_stats_entries(packet):
+    """Yield the raw ``ofp_flow_stats`` entries of a flow stats reply.
+
+    Entries are zero-copy slices of ``packet``, iteration stops at the
+    first truncated or empty entry.
+    """
+    packet = memoryview(packet)
+    offset = MULTIPART_BODY_OFFSET
+    while offset + _ENTRY_LENGTH.size <= len(packet):
+        length, = _ENTRY_LENGTH.unpack_from(packet, offset)
+        if not length or offset + length > len(packet):
+            return
+        yield packet[offset:offset + length]
+        offset += length
+
+
+def flow_stats_key(entry):
+    """Return the bytes of a raw flow stats entry, except its counters.
+
+    The key covers table_id, priority, timeouts, flags, cookie, match and
+    instructions, leaving out the duration and packet and byte counts.
+    """
+    return b''.join((entry[2:3], entry[12:20], entry[24:32], entry[48:]))
+
+
+def _tlvs(data, offset):
+    """Yield the slices of the TLVs of ``data`` from ``offset`` on.
+
+    Instructions and actions both have their length after a 2-byte type.
+    """
+    while offset + 4 <= len(data):
+        length, = _ENTRY_LENGTH.unpack_from(data, offset + 2)
+        if not length:
+            return
+        yield data[offset:offset + length]
+        offset += length
+
+
+class InternTable:
+    """Bounded table of objects shared by flows, keyed by their wire bytes.
+
+    Matches, instructions and actions packed the same way are built once
+    and then shared by all the flows of all the switches that have them.
+    Once ``capacity`` objects are stored the least recently used ones are
+    evicted. Shared objects are frozen, so that changing them through any
+    flow raises an error instead of changing the flows of other switches.
+    Tables are only used from the event loop.
+    """
+
+    def __init__(self, capacity=None):
+        """Create the table, by default of ``settings.INTERN_TABLE_SIZE``."""
+        if capacity is None:
+            capacity = settings.INTERN_TABLE_SIZE
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._objects = OrderedDict()
+
+    def __len__(self):
+        return len(self._objects)
+
+    @property
+    def metrics(self):
+        """Return the table size and its hit, miss and eviction counters."""
+        lookups = self.hits + self.misses
+        return {'size': len(self._objects),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def get(self, key):
+        """Return the object packed as ``key``, or None."""
+        obj = self._objects.get(key)
+        if obj is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._objects.move_to_end(key)
+        return obj
+
+    def add(self, key, obj):
+        """Freeze ``obj`` and share it as the object packed as ``key``.
+
+        Returns ``obj``.
+        """
+        if obj is not None:
+            obj.freeze()
+        self._objects[key] = obj
+        if len(self._objects) > self.capacity:
+            self._objects.popitem(last=False)
+            self.evictions += 1
+        return obj
+
+
+#: Matches, instructions and actions shared by the flows of all switches
+INTERNED_MATCHES = InternTable()
+INTERNED_INSTRUCTIONS = InternTable()
+INTERNED_ACTIONS = InternTable()
+
+
+def intern_metrics():
+    """Return the metrics of the tables of shared flow fields."""
+    return {'matches': INTERNED_MATCHES.metrics,
+            'instructions': INTERNED_INSTRUCTIONS.metrics,
+            'actions': INTERNED_ACTIONS.metrics}
+
+
+class _OxmTLV(NamedTuple):
+    """The fields of a pyof ``OxmTLV`` read by ``MatchField.from_of_tlv``."""
+
+    oxm_field: OxmOfbMatchField
+    oxm_hasmask: bool
+    oxm_value: bytes
+
+
+def _decode_match(data):
+    """Return the Match of a packed ``ofp_match``, None if not understood.
+
+    Fields of the OpenFlow basic class are read like pyof does and built by
+    ``MatchFieldFactory``, other OXM classes are left to pyof.
+    """
+    match_type, length = _TLV_HEADER.unpack_from(data)
+    if match_type != MatchType.OFPMT_OXM:
+        return None
+    match = Match()
+    offset = _TLV_HEADER.size
+    while offset + _OXM_HEADER.size <= length:
+        oxm_class, field_and_mask, oxm_length = \
+            _OXM_HEADER.unpack_from(data, offset)
+        if oxm_class != OxmClass.OFPXMC_OPENFLOW_BASIC:
+            return None
+        try:
+            oxm_field = OxmOfbMatchField(field_and_mask >> 1)
+        except ValueError:
+            return None
+        start = offset + _OXM_HEADER.size
+        offset = start + oxm_length
+        field = MatchFieldFactory.from_of_tlv(
+            _OxmTLV(oxm_field, field_and_mask & 1 == 1, data[start:offset]))
+        if field is not None:
+            setattr(match, field.name, field.value)
+    return match
+
+
+def _decode_action(data):
+    """Return the action of a packed ``ofp_action``, None if not understood.
+
+    Only the actions that pyof would turn into the same classes are decoded,
+    other NApps may handle these pyof actions with classes of their own.
+    """
+    action_type, _ = _TLV_HEADER.unpack_from(data)
+    if action_type == ActionType.OFPAT_OUTPUT:
+        of_class = OFActionOutput
+        action = ActionOutput(_UINT32.unpack_from(data, 4)[0])
+    elif action_type == ActionType.OFPAT_SET_QUEUE:
+        of_class = OFActionSetQueue
+        action = ActionSetQueue(_UINT32.unpack_from(data, 4)[0])
+    elif action_type == ActionType.OFPAT_POP_VLAN:
+        of_class = OFActionPopVLAN
+        action = ActionPopVlan()
+    elif action_type == ActionType.OFPAT_PUSH_VLAN:
+        of_class = OFActionPush
+        ethertype, = _ENTRY_LENGTH.unpack_from(data, 4)
+        action = ActionPushVlan('s' if ethertype == EtherType.VLAN_QINQ
+                                else 'c')
+    elif action_type == ActionType.OFPAT_SET_FIELD:
+        of_class = OFActionSetField
+        oxm_length = _OXM_HEADER.unpack_from(data, 4)[2]
+        vlan_id = int.from_bytes(data[8:8 + oxm_length], 'big') & 4095
+        action = ActionSetVlan(vlan_id)
+    else:
+        return None
+    if Action.get_action_class(of_class) is not type(action):
+        return None
+    return action
+
+
+def _decode_instruction(data):
+    """Return the Instruction of a packed ``ofp_instruction``, or None.
+
+    None is returned for instructions that are not understood, like
+    :func:`_decode_action` does. Actions are shared through
+    ``INTERNED_ACTIONS``.
+    """
+    instruction_type, _ = _TLV_HEADER.unpack_from(data)
+    if instruction_type == InstructionType.OFPIT_GOTO_TABLE:
+        of_class = OFInstructionGotoTable
+        instruction = InstructionGotoTable(data[4])
+    elif instruction_type == InstructionType.OFPIT_WRITE_METADATA:
+        of_class = OFInstructionWriteMetadata
+        instruction = InstructionWriteMetadata(*_METADATA.unpack_from(data,
+                                                                      8))
+    elif instruction_type == InstructionType.OFPIT_METER:
+        of_class = OFInstructionMeter
+        instruction = InstructionMeter(_UINT32.unpack_from(data, 4)[0])
+    elif instruction_type in _ACTION_INSTRUCTIONS:
+        of_class, instruction_class = _ACTION_INSTRUCTIONS[instruction_type]
+        instruction = instruction_class()
+        actions = []
+        # Actions follow the 8-byte instruction header
+        for tlv in _tlvs(data, 8):
+            action = _interned(INTERNED_ACTIONS, bytes(tlv), _decode_action)
+            if action is None:
+                return None
+            actions.append(action)
+        instruction.actions = tuple(actions)
+    else:
+        return None
+    if Instruction.get_instruction_class(of_class) is not type(instruction):
+        return None
+    return instruction
+
+
+# pyof and high-level classes of the instructions with actions
+_ACTION_INSTRUCTIONS = {
+    InstructionType.OFPIT_APPLY_ACTIONS: (OFInstructionApplyAction,
+                                          InstructionApplyAction),
+    InstructionType.OFPIT_WRITE_ACTIONS: (OFInstructionWriteAction,
+                                          InstructionWriteAction),
+    InstructionType.OFPIT_CLEAR_ACTIONS: (OFInstructionClearAction,
+                                          InstructionClearAction),
+}
+
+
+def _interned(table, key, decode):
+    """Return the object of ``table`` packed as ``key``, or None.
+
+    Missing objects are decoded and added to the table, None is returned if
+    they could not be decoded.
+    """
+    obj = table.get(key)
+    if obj is None:
+        obj = decode(key)
+        if obj is not None:
+            table.add(key, obj)
+    return obj
+
+
+def _intern_instruction(key, of_instruction):
+    """Share the instruction packed as ``key`` and its actions."""
+    instruction = Instruction.from_of_instruction(of_instruction)
+    if isinstance(instruction, InstructionAction):
+        # Actions follow the 8-byte instruction header
+        instruction.actions = tuple(
+            INTERNED_ACTIONS.get(action_key) or
+            INTERNED_ACTIONS.add(action_key, action)
+            for action_key, action in zip(
+                (bytes(tlv) for tlv in _tlvs(key, 8)), instruction.actions))
+    return INTERNED_INSTRUCTIONS.add(key, instruction)
+
+
+def _build_flow(entry, switch):
+    """Build the flow of a raw flow stats entry with interned fields.
+
+    Matches and instructions that are not interned yet are decoded from the
+    entry bytes. The entry is only unpacked by pyof if any of them could
+    not be decoded.
+    """
+    match_length, = _ENTRY_LENGTH.unpack_from(entry, _MATCH_OFFSET + 2)
+    match_end = _MATCH_OFFSET + (match_length + 7) // 8 * 8
+    match_key = bytes(entry[_MATCH_OFFSET:match_end])
+    instruction_keys = [bytes(tlv) for tlv in _tlvs(entry, match_end)]
+    match = _interned(INTERNED_MATCHES, match_key, _decode_match)
+    instructions = [_interned(INTERNED_INSTRUCTIONS, key, _decode_instruction)
+                    for key in instruction_keys]
+    if match is None or None in instructions:
+        of_flow_stats = OFFlowStats()
+        of_flow_stats.unpack(bytes(entry))
+        if match is None:
+            match = INTERNED_MATCHES.add(
+                match_key, Match.from_of_match(of_flow_stats.match))
+        instructions = [instruction or _intern_instruction(key,
+                                                           of_instruction)
+                        for instruction, key, of_instruction in
+                        zip(instructions, instruction_keys,
+                            of_flow_stats.instructions)]
+    stats = FlowStats()
+    stats.duration_sec, stats.duration_nsec = _DURATION.unpack_from(entry, 4)
+    stats.packet_count, stats.byte_count = _COUNTERS.unpack_from(entry, 32)
+    priority, idle_timeout, hard_timeout = \
+        _PRIORITY_TIMEOUTS.unpack_from(entry, 12)
+    return Flow(switch, table_id=entry[2], match=match, priority=priority,
+                idle_timeout=idle_timeout, hard_timeout=hard_timeout,
+                cookie=_COOKIE.unpack_from(entry, 24)[0], stats=stats,
+                instructions=instructions)
+
+
+class FlowStatsCache:
+    """Reuse the flows of a switch between flow stats replies.
+
+    Flows are cached by the raw bytes of their flow stats entries, without
+    the counters. An entry found in the cache only updates the duration and
+    counters of the existing flow instead of unpacking the entry and
+    building the flow, its match and its instructions again. The cache
+    keeps the flows of the last complete reply, other entries are built
+    with interned matches, instructions and actions.
+    """
+
+    def __init__(self):
+        """Start with an empty cache."""
+        self._flows = {}
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._flows)
+
+    def flows(self, packet, switch):
+        """Return the flows of a raw flow stats reply of ``switch``."""
+        flows = []
+        for entry in flow_stats_entries(packet):
+            key = flow_stats_key(entry)
+            # Popped, so that a flow is never used twice in a reply
+            flow = self._flows.pop(key, None)
+            if flow is None:
+                self.misses += 1
+                flow = _build_flow(entry, switch)
+            else:
+                self.hits += 1
+                stats = flow.stats
+                stats.duration_sec, stats.duration_nsec = \
+                    _DURATION.unpack_from(entry, 4)
+                stats.packet_count, stats.byte_count = \
+                    _COUNTERS.unpack_from(entry, 32)
+            self._pending[key] = flow
+            flows.append(flow)
+        return flows
+
+    def commit(self, merge=False):
+        """Keep the flows of the reply that has just been completed.
+
+        The flows of a reply with all the flows replace the cached ones,
+        those of a reply with a slice of them are merged into them.
+        """
+        if merge:
+            self._flows.update(self._pending)
+            self._pending = {}
+        else:
+            self._flows, self._pending = self._pending, {}
+
+    def discard(self):
+        """Forget the flows of a reply that will not be completed."""
+        self._flows.update(self._pending)
+        self._pending = {}
@@ -2,9 +2,9 @@
 from pyof.v0x04.common.action import ControllerMaxLen
 from pyof.v0x04.common.port import PortConfig, PortNo, PortState
 from pyof.v0x04.controller2switch.common import ConfigFlag, MultipartType
-from pyof.v0x04.controller2switch.multipart_request import (FlowStatsRequest,
-                                                            MultipartRequest,
-                                                            PortStatsRequest)
+from pyof.v0x04.controller2switch.multipart_request import (
+    AggregateStatsRequest, FlowStatsRequest, GroupStatsRequest,
+    MeterMultipartRequest, MultipartRequest, PortStatsRequest)
 from pyof.v0x04.controller2switch.set_config import SetConfig
 from pyof.v0x04.symmetric.echo_request import EchoRequest
 from pyof.v0x04.symmetric.hello import Hello
@@ -38,9 +38,7 @@ def update_flow_list(controller, switch):
         int: multipart request xid
 
     """
-    multipart_request = MultipartRequest()
-    multipart_request.multipart_type = MultipartType.OFPMP_FLOW
-    multipart_request.body = FlowStatsRequest()
+    multipart_request = multipart_stats_request(MultipartType.OFPMP_FLOW)
     emit_message_out(controller, switch.connection, multipart_request)
     return multipart_request.header.xid
 
@@ -58,13 +56,37 @@ def request_port_stats(controller, switch):
         int: multipart request xid
 
     """
-    multipart_request = MultipartRequest()
-    multipart_request.multipart_type = MultipartType.OFPMP_PORT_STATS
-    multipart_request.body = PortStatsRequest()
+    multipart_request = multipart_stats_request(
+        MultipartType.OFPMP_PORT_STATS)
     emit_message_out(controller, switch.connection, multipart_request)
     return multipart_request.header.xid
 
 
+def multipart_stats_request(multipart_type, body=None):
+    """Return a multipart request of ``multipart_type``.
+
+    Unless another ``body`` is given, requests of flows, aggregate flow
+    stats, ports, groups and meters get a body selecting all of them, other
+    types are sent without a body.
+    """
+    multipart_request = MultipartRequest()
+    multipart_request.multipart_type = multipart_type
+    if body is None and multipart_type in _MULTIPART_REQUEST_BODIES:
+        body = _MULTIPART_REQUEST_BODIES[multipart_type]()
+    if body is not None:
+        multipart_request.body = body
+    return multipart_request
+
+
+_MULTIPART_REQUEST_BODIES = {
+    MultipartType.OFPMP_FLOW: FlowStatsRequest,
+    MultipartType.OFPMP_AGGREGATE: AggregateStatsRequest,
+    MultipartType.OFPMP_PORT_STATS: PortStatsRequest,
+    MultipartType.OFPMP_GROUP: GroupStatsRequest,
+    MultipartType.OFPMP_METER: MeterMultipartRequest,
+}
+
+
 def send_desc_request(controller, switch):
     """Request vendor-specific switch description.
 
@@ -73,17 +95,26 @@ def send_desc_request(controller, switch):
             the controller being used.
         switch(:class:`~kytos.core.switch.Switch`):
             target to send a stats request.
+
+    Returns:
+        int: multipart request xid
+
     """
-    multipart_request = MultipartRequest()
-    multipart_request.multipart_type = MultipartType.OFPMP_DESC
+    multipart_request = multipart_stats_request(MultipartType.OFPMP_DESC)
     emit_message_out(controller, switch.connection, multipart_request)
+    return multipart_request.header.xid
 
 
 def send_port_request(controller, connection):
-    """Send a Port Description Request after the Features Reply."""
-    port_request = MultipartRequest()
-    port_request.multipart_type = MultipartType.OFPMP_PORT_DESC
+    """Send a Port Description Request after the Features Reply.
+
+    Returns:
+        int: multipart request xid
+
+    """
+    port_request = multipart_stats_request(MultipartType.OFPMP_PORT_DESC)
     emit_message_out(controller, connection, port_request)
+    return port_request.header.xid
 
 
 def handle_features_reply(controller, event):
@@ -102,8 +133,6 @@ def handle_features_reply(controller, event):
 
     switch = controller.get_switch_or_create(dpid=dpid,
                                              connection=connection)
-    send_port_request(controller, connection)
-
     switch.update_features(features_reply)
 
     return switch
@@ -161,6 +190,12 @@ def send_echo(controller, switch):
     emit_message_out(controller, switch.connection, echo)
 
 
+async def asend_echo(controller, switch):
+    """Async send echo request to a datapath."""
+    echo = EchoRequest(data=b'kytosd_13')
+    await aemit_message_out(controller, switch.connection, echo)
+
+
 def send_set_config(controller, switch):
     """Send a SetConfig message after the OpenFlow handshake."""
     set_config = SetConfig()